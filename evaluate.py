@@ -0,0 +1,50 @@
+import csv
+import os
+
+import click
+
+import scripts.utils.utils as ut
+from src.evaluation import RENDERERS, PredictionRenderer, evaluate, read_samples
+from src.inference import InferenceEngine
+
+
+@click.command()
+@click.option("--model_dir", default="exported_model", help="Folder created by `python predict.py export`")
+@click.option("--data_dir", default="data_test", help="Held-out data folder created by generate.py")
+@click.option("--images_folder", default="circuit_images", help="Name of the images folder inside data_dir")
+@click.option("--max_samples", default=None, type=int, help="Only evaluate the first samples")
+@click.option("--renderer", default="latex", type=click.Choice(RENDERERS),
+              help="Render the predictions with LaTeX (like generate.py), or with the native renderer")
+@click.option("--cache_dir", default=None, help="Rendered predictions cache (data_dir/.render_cache by default)")
+@click.option("--jobs", default=4, help="Number of predictions rendered at the same time")
+@click.option("--batch_size", default=32, help="Number of images per forward pass")
+@click.option("--num_threads", default=None, type=int, help="Number of CPU threads of the model")
+@click.option("--report", default=None, help="CSV file where to write the metrics of each sample")
+def main(model_dir: str, data_dir: str, images_folder: str, max_samples: int, renderer: str, cache_dir: str,
+         jobs: int, batch_size: int, num_threads: int, report: str) -> None:
+    """Scores a model on a held-out set: token accuracy, exact match, and similarity between
+    the true images and the images of the predicted circuitikz code"""
+    samples = read_samples(data_dir, images_folder, max_samples)
+    engine = InferenceEngine(model_dir, batch_size=batch_size, num_threads=num_threads)
+    predictions = engine.predict_files([img_path for img_path, _ in samples])
+
+    latex_path, ghostscript_path = ut.load_env_var()
+    prediction_renderer = PredictionRenderer(
+        cache_dir or os.path.join(data_dir, ".render_cache"), renderer, latex_path, ghostscript_path,
+        engine.image_size)
+    metrics, rows = evaluate(predictions, samples, prediction_renderer, engine.vocab, jobs)
+
+    if report:
+        with open(report, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
+    click.echo(f"samples:          {metrics['nb_samples']}")
+    click.echo(f"token accuracy:   {metrics['token_accuracy']:.4f}")
+    click.echo(f"exact match:      {metrics['exact_match']:.4f}")
+    click.echo(f"pixel similarity: {metrics['pixel_similarity']:.4f}")
+    click.echo(f"render failures:  {metrics['render_failures']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
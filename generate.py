@@ -3,23 +3,95 @@ import os
 
 import scripts.utils.utils as ut
 import scripts.utils.image_utils as iu
+import scripts.utils.profiling_utils as pu
 import scripts.data_generation.generate_circuits as gc
+from scripts.data_generation.native_renderer import NativeRenderer, get_latex_layout
+from scripts.data_generation.sprite_atlas import DEFAULT_SPRITE_KEYS, SpriteAtlas
+from scripts.data_generation.pipeline import GenerationPipeline
+from scripts.data_generation.dedup import CircuitIndex
+from scripts.data_generation.circuit_graph import ValidCircuitGenerator, ValidityRules
+from scripts.utils.shard_utils import ShardWriter
+
+IMAGE_SIZE = 350
 
 
 @click.command()
 @click.option('--nb_images', default=1, help='Number of images to generate')
 @click.option('--save_to', default="data", help="Path where to save the images")
-def main(nb_images: int, save_to: str) -> None:
+@click.option('--renderer', default="latex", type=click.Choice(["latex", "native", "sprites"]),
+              help="Compile the circuitikz code with LaTeX, draw the circuits directly with OpenCV (much faster), "
+                   "or paste circuitikz elements compiled once")
+@click.option('--sprites_dir', default=".sprite_atlas", help="Folder where the compiled elements are stored (sprites renderer)")
+@click.option('--pipeline', is_flag=True, default=False,
+              help="Run LaTeX, Ghostscript and the image processing of different circuits concurrently (latex renderer)")
+@click.option('--latex_jobs', default=2, help="Number of concurrent LaTeX compilations (pipeline)")
+@click.option('--gs_jobs', default=2, help="Number of concurrent Ghostscript conversions (pipeline)")
+@click.option('--postprocess_jobs', default=2, help="Number of images padded and resized concurrently (pipeline)")
+@click.option('--queue_size', default=8, help="Maximal number of circuits waiting between two stages (pipeline)")
+@click.option('--dedup', is_flag=True, default=False,
+              help="Skip the circuits already generated, up to translations and mirrors")
+@click.option('--dedup_index', default=None, help="SQLite index of the generated circuits (save_to/circuit_index.sqlite by default)")
+@click.option('--valid_only', is_flag=True, default=False,
+              help="Regenerate the circuits until they are connected, have a source and no dangling wire")
+@click.option('--max_dangling_nodes', default=0, help="Number of dangling nodes allowed in a valid circuit")
+@click.option('--output_format', default="files", type=click.Choice(["files", "shards"]),
+              help="Save each image in its own file, or group them in tar files (save_to/shards)")
+@click.option('--shard_size', default=10000, help="Number of images per shard")
+@click.option('--profile', is_flag=True, default=False,
+              help="Profile the generation with cProfile (statistics saved as .pstats in profile_dir)")
+@click.option('--profile_dir', default="profiles", help="Directory where the profiling results are saved")
+def main(profile: bool, profile_dir: str, **kwargs) -> None:
+    """Generates random circuits and renders their images. The images are saved in the
+    circuit_images folder of --save_to, the circuitikz code is appended to circuitikz_code.lst
+    and the image names to circuit2latex.lst.
+
+    With --profile, the generation is profiled with cProfile (LaTeX and Ghostscript run in
+    subprocesses: their time shows as time spent waiting for them).
+    """
+    if not profile:
+        generate(**kwargs)
+        return
+    with pu.cprofile(profile_dir, "generate"):
+        generate(**kwargs)
+
+
+def generate(nb_images: int, save_to: str, renderer: str, sprites_dir: str, pipeline: bool,
+             latex_jobs: int, gs_jobs: int, postprocess_jobs: int, queue_size: int,
+             dedup: bool, dedup_index: str, valid_only: bool, max_dangling_nodes: int,
+             output_format: str, shard_size: int) -> None:
     """Uses various functions to generate circuit data
 
     Args:
         nb_images (int): Number of images to generate
         save_to (str): Path where to save the generated images
+        renderer (str): "latex", "native" or "sprites"
+        sprites_dir (str): Path where the sprite atlas is stored
+        pipeline (bool): Run the latex renderer stages concurrently
+        latex_jobs, gs_jobs, postprocess_jobs (int): Number of concurrent workers of each stage of the pipeline
+        queue_size (int): Maximal number of circuits waiting between two stages of the pipeline
+        dedup (bool): Skip the circuits whose canonical form is already in the index (before rendering them)
+        dedup_index (str): Path of the SQLite index
+        valid_only (bool): Reject the invalid circuits before rendering them
+        max_dangling_nodes (int): Number of dangling nodes allowed in a valid circuit
+        output_format (str): "files" or "shards" (the .lst files are written in both cases)
+        shard_size (int): Number of images per shard
     """
+    if pipeline and renderer != "latex":
+        raise click.UsageError("--pipeline can only be used with the latex renderer")
     latex_path, ghostscript_path = ut.load_env_var()
-    circuit_generator = gc.CircuitGenerator()
+    if valid_only:
+        circuit_generator = ValidCircuitGenerator(ValidityRules(max_dangling_nodes=max_dangling_nodes))
+    else:
+        circuit_generator = gc.CircuitGenerator()
+    if renderer == "native":
+        native_renderer = NativeRenderer(image_size=IMAGE_SIZE)
+    elif renderer == "sprites":
+        # only compiled once, then reused until BEFORE_LATEX changes
+        sprite_atlas = SpriteAtlas.load_or_build(
+            sprites_dir, latex_path, ghostscript_path, DEFAULT_SPRITE_KEYS)
     images_folder_path = os.path.join(save_to, "circuit_images")
-    generator_version = "basic"
+    # keep track of which renderer drew the images
+    generator_version = "basic" if renderer == "latex" else f"basic-{renderer}"
 
     # if there is no data folder, create one
     ut.create_dir_if_not_exists(save_to)
@@ -27,30 +99,61 @@ def main(nb_images: int, save_to: str) -> None:
     ut.create_dir_if_not_exists(images_folder_path)
     # check if the file exists
     ut.create_file_if_not_exists(os.path.join(save_to, "circuitikz_code.lst"))
+    circuit_index = None
+    if dedup:
+        circuit_index = CircuitIndex(dedup_index or os.path.join(save_to, "circuit_index.sqlite"))
+    shard_writer = None
+    if output_format == "shards":
+        shard_writer = ShardWriter(os.path.join(save_to, "shards"), max_samples=shard_size)
+
+    if pipeline:
+        generation_pipeline = GenerationPipeline(
+            save_to, images_folder_path, latex_path, ghostscript_path, circuit_generator,
+            generator_version, IMAGE_SIZE, latex_jobs, gs_jobs, postprocess_jobs, queue_size,
+            circuit_index, shard_writer)
+        nb_generated = generation_pipeline.run(nb_images)
+        if circuit_index is not None:
+            circuit_index.close()
+        if shard_writer is not None:
+            shard_writer.close()
+        click.echo(f"Generated {nb_generated} images.")
+        return
 
+    # line of the next formula (counted once, then incremented)
+    line_number = ut.count_lines(os.path.join(save_to, "circuitikz_code.lst")) + 1
+    nb_duplicates = 0
     for i in range(nb_images):
         segments_list = circuit_generator.generate_one_circuit()
         latex_string = ut.segment_list_to_latex(segments_list)
         filename = ut.get_image_name(latex_string)
+        # the key is only added to the index once the sample is saved
+        circuit_key = circuit_index.get_key(segments_list) if circuit_index is not None else None
+        if circuit_key is not None and circuit_key in circuit_index:
+            nb_duplicates += 1
+            continue
 
-        ut.save_to_latex(ut.BEFORE_LATEX + latex_string + ut.AFTER_LATEX,
-                         images_folder_path, filename)
-        ut.latex_to_jpg(filename, latex_path,
-                        ghostscript_path, images_folder_path)
-        # pad, resize and save the image
         img_path = os.path.join(images_folder_path, f"{filename}.jpg")
-        img = iu.read_image(img_path)
-        img = iu.pad_to_square(img, border=50)
-        img = iu.resize_image(img, (350, 350))
-        iu.save_image(img, img_path)
-
-        # find the first empty line
-        with open(os.path.join(save_to, "circuitikz_code.lst"), "r") as f:
-            line_number = 1
-            for line in f:
-                line_number += 1
-                if line == "\n":
-                    break
+        if renderer == "native":
+            img = native_renderer.render(segments_list)
+        elif renderer == "sprites":
+            img = sprite_atlas.compose(segments_list)
+            img = iu.pad_to_square(img, border=50)
+            img = iu.resize_image(img, (IMAGE_SIZE, IMAGE_SIZE))
+        else:
+            # rasterized at the scale of the final image, so it only needs to be padded
+            resolution, border = get_latex_layout(segments_list, IMAGE_SIZE)
+            ut.save_to_latex(ut.BEFORE_LATEX + latex_string + ut.AFTER_LATEX,
+                             images_folder_path, filename)
+            ut.latex_to_jpg(filename, latex_path,
+                            ghostscript_path, images_folder_path, resolution)
+            img = iu.fit_to_square(iu.read_image(img_path), IMAGE_SIZE, border)
+        if shard_writer is not None:
+            shard_writer.write(filename, iu.encode_image(img), latex_string,
+                               {"generator_version": generator_version})
+            if os.path.exists(img_path):
+                os.remove(img_path)
+        else:
+            iu.save_image(img, img_path)
 
         # save its name and line
         with open(os.path.join(save_to, "circuit2latex.lst"), "a") as f:
@@ -59,10 +162,18 @@ def main(nb_images: int, save_to: str) -> None:
         # save the formula
         with open(os.path.join(save_to, "circuitikz_code.lst"), "a") as f:
             f.write(f"{latex_string}\n")
+        line_number += 1
+        if circuit_key is not None:
+            circuit_index.add(circuit_key, filename)
 
         print(f"{i+1}/{nb_images}")
 
-    click.echo(f"Generated {nb_images} images.")
+    if shard_writer is not None:
+        shard_writer.close()
+    if circuit_index is not None:
+        circuit_index.close()
+        click.echo(f"Skipped {nb_duplicates} duplicated circuits.")
+    click.echo(f"Generated {nb_images - nb_duplicates} images.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,39 @@
+import click
+import os
+import torch
+
+from src.inference import BACKENDS, InferenceEngine, export_model
+
+
+@click.group()
+def cli() -> None:
+    """Exports trained models and predicts circuitikz code from circuit images"""
+
+
+@cli.command()
+@click.option("--models_dir", default="trained_models", help="Folder containing encoder.pt and decoder.pt (saved by train.py)")
+@click.option("--output_dir", default="exported_model", help="Folder where to write the exported model")
+@click.option("--backend", default="torchscript", type=click.Choice(BACKENDS), help="Format of the exported model")
+@click.option("--quantize", is_flag=True, default=False, help="Apply dynamic int8 quantization")
+def export(models_dir: str, output_dir: str, backend: str, quantize: bool) -> None:
+    """Exports the models saved by train.py to a self-contained inference model"""
+    encoder = torch.load(os.path.join(models_dir, "encoder.pt"), map_location="cpu", weights_only=False)
+    decoder = torch.load(os.path.join(models_dir, "decoder.pt"), map_location="cpu", weights_only=False)
+    export_model(encoder, decoder, output_dir, backend=backend, quantize=quantize)
+    click.echo(f"Exported {backend} model to {output_dir}")
+
+
+@cli.command()
+@click.argument("images", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--model_dir", default="exported_model", help="Folder created by the export command")
+@click.option("--batch_size", default=32, help="Number of images per forward pass")
+@click.option("--num_threads", default=None, type=int, help="Number of CPU threads")
+def run(images, model_dir: str, batch_size: int, num_threads: int) -> None:
+    """Prints the predicted circuitikz code for each image"""
+    engine = InferenceEngine(model_dir, batch_size=batch_size, num_threads=num_threads)
+    for img_path, latex_string in zip(images, engine.predict_files(images)):
+        click.echo(f"{img_path}\t{latex_string}")
+
+
+if __name__ == '__main__':
+    cli()
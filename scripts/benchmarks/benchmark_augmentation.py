@@ -0,0 +1,35 @@
+import click
+import torch
+
+from scripts.benchmarks.timing import measure_duration
+from scripts.preprocessing.augment_images import (BatchAugmentation, random_affine, simulate_jpeg,
+                                                  thicken_strokes)
+
+
+@click.command()
+@click.option("--batch_size", default=64, help="Number of images per batch")
+@click.option("--image_size", default=350, help="Side of the (square) images")
+@click.option("--nb_runs", default=10, help="Number of timed batches")
+@click.option("--num_threads", default=None, type=int, help="Number of torch threads (all cores by default)")
+def main(batch_size: int, image_size: int, nb_runs: int, num_threads: int) -> None:
+    """Measures the throughput of each augmentation, on batches of random images"""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    images = torch.rand(batch_size, 1, image_size, image_size)
+    ones = torch.ones(batch_size)
+    # with all the images thickened and compressed
+    augmentation = BatchAugmentation(p_thicken=1., p_jpeg=1.)
+    augmentations = {
+        "affine": lambda: random_affine(images, 2 * ones, 1.05 * ones),
+        "thicken": lambda: thicken_strokes(images),
+        "jpeg": lambda: simulate_jpeg(images, 50 * ones),
+        "all": lambda: augmentation(images),
+    }
+    click.echo(f"{'augmentation':<13} {'batch (ms)':>11} {'img/s':>9}")
+    for name, func in augmentations.items():
+        duration = measure_duration(func, nb_runs)
+        click.echo(f"{name:<13} {duration * 1000:>11.1f} {batch_size / duration:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from typing import Dict
+
+import click
+import torch
+import torch.nn as nn
+from torch.utils.flop_counter import FlopCounterMode
+
+from scripts.benchmarks.timing import measure_duration
+from src.models.encoder import get_encoder
+
+
+def count_flops(model: nn.Module, x: torch.Tensor) -> int:
+    """Returns the number of floating point operations of one forward pass"""
+    flop_counter = FlopCounterMode(display=False)
+    with flop_counter, torch.no_grad():
+        model(x)
+    return flop_counter.get_total_flops()
+
+
+def benchmark_encoder(model: nn.Module, batch_size: int, image_size: int, nb_runs: int) -> Dict[str, float]:
+    model.eval()
+    x = torch.rand(batch_size, 1, image_size, image_size)
+    with torch.no_grad():
+        latency = measure_duration(lambda: model(x), nb_runs)
+    return {
+        "params": sum(p.numel() for p in model.parameters()),
+        # per image
+        "gflops": count_flops(model, x[:1]) / 1e9,
+        "latency_ms": latency * 1000,
+        "images_per_s": batch_size / latency,
+    }
+
+
+@click.command()
+@click.option("--batch_size", default=8, help="Number of images per forward pass")
+@click.option("--image_size", default=350, help="Side of the (square) input images")
+@click.option("--nb_runs", default=10, help="Number of timed forward passes")
+@click.option("--vocab_size", default=84, help="Output size of the encoders")
+@click.option("--channels", default="16,32,64,128", help="Channel widths of the efficient encoder")
+def main(batch_size: int, image_size: int, nb_runs: int, vocab_size: int, channels: str) -> None:
+    """Compares FLOPs and CPU latency of the basic and efficient image encoders"""
+    encoders = {
+        "basic": get_encoder("basic", vocab_size),
+        "efficient": get_encoder("efficient", vocab_size, [int(c) for c in channels.split(",")]),
+    }
+    click.echo(f"{'encoder':<10} {'params':>10} {'GFLOPs/img':>11} {'latency (ms)':>13} {'img/s':>8}")
+    for name, model in encoders.items():
+        res = benchmark_encoder(model, batch_size, image_size, nb_runs)
+        click.echo(
+            f"{name:<10} {res['params']:>10,} {res['gflops']:>11.3f} "
+            f"{res['latency_ms']:>13.1f} {res['images_per_s']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
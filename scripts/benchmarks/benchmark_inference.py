@@ -0,0 +1,34 @@
+import time
+
+import click
+import numpy as np
+
+from src.inference import InferenceEngine
+
+
+@click.command()
+@click.option("--model_dir", default="exported_model", help="Folder created by `predict.py export`")
+@click.option("--batch_sizes", default="1,8,32", help="Comma separated batch sizes to benchmark")
+@click.option("--nb_images", default=64, help="Number of images predicted for each batch size")
+@click.option("--num_threads", default=None, type=int, help="Number of CPU threads")
+def main(model_dir: str, batch_sizes: str, nb_images: int, num_threads: int) -> None:
+    """Measures latency and throughput of an exported model on random images"""
+    engine = InferenceEngine(model_dir, num_threads=num_threads)
+    images = [np.random.randint(0, 256, (engine.image_size, engine.image_size), dtype=np.uint8)
+              for _ in range(nb_images)]
+    # warmup
+    engine.predict(images[:2])
+
+    click.echo(f"backend: {engine.backend}")
+    click.echo(f"{'batch size':>10} {'latency/batch (ms)':>19} {'img/s':>8}")
+    for batch_size in (int(b) for b in batch_sizes.split(",")):
+        engine.batch_size = batch_size
+        start = time.perf_counter()
+        engine.predict(images)
+        duration = time.perf_counter() - start
+        nb_batches = -(-nb_images // batch_size)
+        click.echo(f"{batch_size:>10} {1000 * duration / nb_batches:>19.1f} {nb_images / duration:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
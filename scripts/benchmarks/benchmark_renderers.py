@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+import click
+import numpy as np
+
+import scripts.data_generation.generate_circuits as gc
+import scripts.utils.image_utils as iu
+import scripts.utils.utils as ut
+from scripts.benchmarks.timing import measure_duration
+from scripts.data_generation.native_renderer import NativeRenderer, get_latex_layout
+
+
+def render_with_latex(segments, latex_path: str, ghostscript_path: str, tmp_dir: str,
+                      image_size: int = 350) -> np.ndarray:
+    """Same steps as generate.py with the latex renderer"""
+    latex_string = ut.segment_list_to_latex(segments)
+    filename = ut.get_image_name(latex_string)
+    ut.save_to_latex(ut.BEFORE_LATEX + latex_string + ut.AFTER_LATEX, tmp_dir, filename)
+    resolution, border = get_latex_layout(segments, image_size)
+    ut.latex_to_jpg(filename, latex_path, ghostscript_path, tmp_dir, resolution)
+    img_path = os.path.join(tmp_dir, f"{filename}.jpg")
+    img = iu.fit_to_square(iu.read_image(img_path), image_size, border)
+    os.remove(img_path)
+    return img
+
+
+@click.command()
+@click.option("--nb_circuits", default=1000, help="Number of circuits rendered natively")
+@click.option("--nb_compared", default=20, help="Number of circuits also rendered with LaTeX, to check fidelity")
+@click.option("--seed", default=0, help="Random seed of the circuit generator")
+def main(nb_circuits: int, nb_compared: int, seed: int) -> None:
+    """Measures the speed of the native renderer, and its fidelity to the circuitikz images
+    (requires LaTeX and Ghostscript, see .env)"""
+    np.random.seed(seed)
+    generator = gc.CircuitGenerator()
+    renderer = NativeRenderer()
+    circuits = [generator.generate_one_circuit() for _ in range(nb_circuits)]
+
+    duration = measure_duration(lambda: [renderer.render(segments) for segments in circuits], nb_runs=3, nb_warmup=1)
+    click.echo(f"native: {nb_circuits / duration:.0f} images/s ({1000 * duration / nb_circuits:.2f} ms/image)")
+
+    if not nb_compared:
+        click.echo("--nb_compared is 0, fidelity check skipped")
+        return
+    latex_path, ghostscript_path = ut.load_env_var()
+    if latex_path is None or ghostscript_path is None:
+        click.echo("LATEX_PATH or GS_PATH not set, fidelity check skipped")
+        return
+    scores = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        latex_imgs = []
+        # compiled only once, it is slow enough
+        duration = measure_duration(lambda: latex_imgs.extend(
+            render_with_latex(s, latex_path, ghostscript_path, tmp_dir) for s in circuits[:nb_compared]),
+            nb_runs=1, nb_warmup=0)
+        for segments, latex_img in zip(circuits, latex_imgs):
+            scores.append(iu.ink_similarity(renderer.render(segments), latex_img))
+    click.echo(f"latex: {nb_compared / duration:.1f} images/s")
+    click.echo(f"fidelity (ink F1 score): mean {np.mean(scores):.3f}, min {np.min(scores):.3f}")
+
+
+if __name__ == "__main__":
+    main()
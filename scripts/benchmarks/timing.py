@@ -0,0 +1,13 @@
+import time
+from typing import Callable
+
+
+def measure_duration(func: Callable[[], object], nb_runs: int = 10, nb_warmup: int = 2) -> float:
+    """Returns the median duration (in seconds) of a call, after nb_warmup calls which are not timed"""
+    durations = []
+    for i in range(nb_warmup + nb_runs):
+        start = time.perf_counter()
+        func()
+        if i >= nb_warmup:
+            durations.append(time.perf_counter() - start)
+    return sorted(durations)[len(durations) // 2]
@@ -0,0 +1,125 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from scripts.data_generation.generate_circuits import SOURCES_BIPOLES, CircuitGenerator, Segment
+
+Node = Tuple[int, int]
+
+
+class UnionFind:
+    def __init__(self) -> None:
+        """Disjoint sets of nodes (path halving and union by size)"""
+        self.parent: Dict[Node, Node] = {}
+        self.size: Dict[Node, int] = {}
+
+    def find(self, node: Node) -> Node:
+        if node not in self.parent:
+            self.parent[node] = node
+            self.size[node] = 1
+            return node
+        while self.parent[node] != node:
+            self.parent[node] = self.parent[self.parent[node]]
+            node = self.parent[node]
+        return node
+
+    def union(self, a: Node, b: Node) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+
+    def nb_sets(self) -> int:
+        return sum(1 for node, parent in self.parent.items() if node == parent)
+
+
+class CircuitGraph:
+    def __init__(self, segments: Iterable[Segment]) -> None:
+        """Connectivity of a circuit: its nodes are the ends of the segments, its edges the segments."""
+        self.segments: List[Segment] = list(segments)
+        # segments connected to each node
+        self.adjacency: Dict[Node, List[Segment]] = defaultdict(list)
+        self.components = UnionFind()
+        for s in self.segments:
+            self.adjacency[s.from_pos].append(s)
+            self.adjacency[s.to_pos].append(s)
+            self.components.union(s.from_pos, s.to_pos)
+
+    @property
+    def nb_components(self) -> int:
+        """Number of disconnected parts of the circuit"""
+        return self.components.nb_sets()
+
+    @property
+    def dangling_nodes(self) -> Set[Node]:
+        """Nodes connected to a single segment (open wire or element)"""
+        return {node for node, segments in self.adjacency.items() if len(segments) == 1}
+
+    @property
+    def has_source(self) -> bool:
+        return any(s.type in SOURCES_BIPOLES for s in self.segments)
+
+
+class ValidityRules:
+    def __init__(self, max_components: int = 1, max_dangling_nodes: int = 0, require_source: bool = True) -> None:
+        """Conditions a circuit must satisfy to be rendered.
+
+        Args:
+            max_components (int): maximal number of disconnected parts of the circuit
+            max_dangling_nodes (int): maximal number of nodes connected to a single segment
+            require_source (bool): reject circuits without any source
+        """
+        self.max_components = max_components
+        self.max_dangling_nodes = max_dangling_nodes
+        self.require_source = require_source
+
+    def get_violations(self, segments: Iterable[Segment]) -> List[str]:
+        """Returns the description of the rules broken by the circuit (empty if it is valid)"""
+        graph = CircuitGraph(segments)
+        violations = []
+        if not graph.segments:
+            return ["empty circuit"]
+        if graph.nb_components > self.max_components:
+            violations.append(f"{graph.nb_components} disconnected parts")
+        nb_dangling = len(graph.dangling_nodes)
+        if nb_dangling > self.max_dangling_nodes:
+            violations.append(f"{nb_dangling} dangling nodes")
+        if self.require_source and not graph.has_source:
+            violations.append("no source")
+        return violations
+
+    def is_valid(self, segments: Iterable[Segment]) -> bool:
+        return not self.get_violations(segments)
+
+
+def filter_valid(circuits: Iterable[Set[Segment]], rules: ValidityRules = None) -> List[Set[Segment]]:
+    """Keeps the circuits satisfying the rules (default rules if None)"""
+    rules = rules or ValidityRules()
+    return [circuit for circuit in circuits if rules.is_valid(circuit)]
+
+
+class ValidCircuitGenerator(CircuitGenerator):
+    def __init__(self, rules: ValidityRules = None, max_attempts: int = 100, **kwargs) -> None:
+        """CircuitGenerator whose circuits are regenerated until they satisfy the validity rules,
+        so that invalid circuits are rejected before being rendered.
+
+        Args:
+            rules (ValidityRules): default rules if None
+            max_attempts (int): number of circuits generated before giving up
+            kwargs: probabilities passed to CircuitGenerator
+        """
+        super().__init__(**kwargs)
+        self.rules = rules or ValidityRules()
+        self.max_attempts = max_attempts
+        self.nb_rejected = 0
+
+    def generate_one_circuit(self) -> Set[Segment]:
+        for _ in range(self.max_attempts):
+            segments = super().generate_one_circuit()
+            if self.rules.is_valid(segments):
+                return segments
+            self.nb_rejected += 1
+        raise RuntimeError(f"No valid circuit was generated in {self.max_attempts} attempts, "
+                           "the validity rules may be too strict")
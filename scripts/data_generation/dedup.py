@@ -0,0 +1,192 @@
+import hashlib
+import os
+import re
+import sqlite3
+from typing import Iterable, List, Optional, Set, Tuple
+
+import click
+
+from scripts.data_generation.generate_circuits import Segment
+from scripts.preprocessing.token_store import TokenStore
+
+# (x1, y1, x2, y2, element, label) with the circuit translated to (0, 0)
+CanonicalCircuit = Tuple[Tuple[int, int, int, int, str, str], ...]
+
+# kind of keys held by a CircuitIndex, depending on include_mirrors
+KEY_SCHEMES = {True: "mirrors", False: "no-mirrors"}
+
+DRAW_PATTERN = re.compile(
+    r"\\draw \((-?\d+), (-?\d+)\) to\[([^,\]]+)(?:, l=([^\]]*))?\] \((-?\d+), (-?\d+)\);")
+
+
+def parse_circuit(latex_string: str) -> Set[Segment]:
+    """Inverse of segment_list_to_latex: returns the segments described by circuitikz code"""
+    return {
+        Segment((int(x1), int(y1)), (int(x2), int(y2)), element, label or None)
+        for x1, y1, element, label, x2, y2 in DRAW_PATTERN.findall(latex_string)
+    }
+
+
+def _normalize(segments: Iterable[Segment], flip_x: bool, flip_y: bool, directed: bool) -> CanonicalCircuit:
+    sx, sy = (-1 if flip_x else 1), (-1 if flip_y else 1)
+    records = []
+    for s in segments:
+        start = (sx * s.from_pos[0], sy * s.from_pos[1])
+        end = (sx * s.to_pos[0], sy * s.to_pos[1])
+        if not directed:
+            start, end = min(start, end), max(start, end)
+        records.append((*start, *end, s.type or "", s.label or ""))
+    if not records:
+        return ()
+    x_min = min(min(r[0], r[2]) for r in records)
+    y_min = min(min(r[1], r[3]) for r in records)
+    return tuple(sorted((x1 - x_min, y1 - y_min, x2 - x_min, y2 - y_min, element, label)
+                        for x1, y1, x2, y2, element, label in records))
+
+
+def get_canonical_circuit(segments: Iterable[Segment], include_mirrors: bool = True) -> CanonicalCircuit:
+    """Normal form of a circuit: translated so that its upper left corner is at (0, 0), and sorted.
+    If include_mirrors is True, the smallest of the circuit and its horizontal and vertical mirrors is
+    returned (the direction of the segments, i.e. the polarity of the elements, is then ignored).
+    """
+    segments = list(segments)
+    if not include_mirrors:
+        return _normalize(segments, False, False, directed=True)
+    return min(_normalize(segments, flip_x, flip_y, directed=False)
+               for flip_x in (False, True) for flip_y in (False, True))
+
+
+def get_circuit_key(segments: Iterable[Segment], include_mirrors: bool = True) -> str:
+    """Hash of the canonical circuit: translated (and mirrored) copies of a circuit get the same key"""
+    canonical = get_canonical_circuit(segments, include_mirrors)
+    return hashlib.sha1(repr(canonical).encode("utf-8")).hexdigest()
+
+
+class CircuitIndex:
+    def __init__(self, path: str, include_mirrors: bool = True, commit_every: int = 1000) -> None:
+        """On disk (SQLite) set of the keys of the circuits already generated.
+        An index only holds one kind of keys (with or without mirrors), stored in it when it is created.
+
+        Args:
+            path (str): database file, created if it does not exist
+            include_mirrors (bool): kind of keys (see get_circuit_key), must be the one of the existing index
+            commit_every (int): number of insertions between two commits
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS circuits (key TEXT PRIMARY KEY, image_name TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+        key_scheme = KEY_SCHEMES[include_mirrors]
+        row = self.connection.execute("SELECT value FROM metadata WHERE name = 'key_scheme'").fetchone()
+        if row is None:
+            self.connection.execute("INSERT INTO metadata (name, value) VALUES ('key_scheme', ?)", (key_scheme,))
+            self.connection.commit()
+        elif row[0] != key_scheme:
+            self.connection.close()
+            raise ValueError(f"The index {path} holds keys '{row[0]}', not '{key_scheme}': use another index file")
+        self.include_mirrors = include_mirrors
+        self.commit_every = commit_every
+        self.nb_pending = 0
+
+    def get_key(self, segments: Iterable[Segment]) -> str:
+        """Key of a circuit, of the kind held by this index"""
+        return get_circuit_key(segments, self.include_mirrors)
+
+    def add(self, key: str, image_name: str = None) -> bool:
+        """Adds a circuit key to the index. Returns False if it was already there."""
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO circuits (key, image_name) VALUES (?, ?)", (key, image_name))
+        self.nb_pending += 1
+        if self.nb_pending >= self.commit_every:
+            self.commit()
+        return cursor.rowcount == 1
+
+    def get_image_name(self, key: str) -> Optional[str]:
+        row = self.connection.execute("SELECT image_name FROM circuits WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, key: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM circuits WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM circuits").fetchone()[0]
+
+    def commit(self) -> None:
+        self.connection.commit()
+        self.nb_pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self) -> "CircuitIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def dedup_dataset(data_dir: str, index_path: str = None, include_mirrors: bool = True,
+                  delete_images: bool = False) -> Tuple[int, int]:
+    """Removes the duplicated circuits of a data folder in one pass, and rewrites its .lst files.
+    The keys of the remaining circuits are stored in the index, so that generate.py --dedup
+    does not generate them again.
+
+    Returns:
+        Tuple[int, int]: number of samples kept and removed
+    """
+    names_path = os.path.join(data_dir, "circuit2latex.lst")
+    formulas_path = os.path.join(data_dir, "circuitikz_code.lst")
+    with open(names_path, "r") as f:
+        samples = [line.split() for line in f if line.strip()]
+    with open(formulas_path, "r") as f:
+        formulas = f.read().splitlines()
+
+    kept: List[Tuple[str, str, str]] = []
+    removed_names: Set[str] = set()
+    with CircuitIndex(index_path or os.path.join(data_dir, "circuit_index.sqlite"), include_mirrors) as index:
+        seen: Set[str] = set()
+        for line_number, filename, *version in samples:
+            formula = formulas[int(line_number) - 1]
+            key = index.get_key(parse_circuit(formula))
+            if key in seen:
+                removed_names.add(filename)
+                continue
+            seen.add(key)
+            index.add(key, filename)
+            kept.append((filename, " ".join(version), formula))
+
+    # write the new files next to the old ones, then replace them
+    with open(names_path + ".tmp", "w") as names_file, open(formulas_path + ".tmp", "w") as formulas_file:
+        for line_number, (filename, version, formula) in enumerate(kept, start=1):
+            names_file.write(f"{line_number} {filename} {version}\n")
+            formulas_file.write(f"{formula}\n")
+    os.replace(names_path + ".tmp", names_path)
+    os.replace(formulas_path + ".tmp", formulas_path)
+    # the tokenized formulas do not match the lines of the formulas file anymore
+    if os.path.exists(os.path.join(data_dir, "token_store")):
+        TokenStore(os.path.join(data_dir, "token_store")).reset()
+
+    if delete_images:
+        # identical formulas share the same image
+        for filename in removed_names - {name for name, _, _ in kept}:
+            img_path = os.path.join(data_dir, "circuit_images", f"{filename}.jpg")
+            if os.path.exists(img_path):
+                os.remove(img_path)
+    return len(kept), len(samples) - len(kept)
+
+
+@click.command()
+@click.option("--data_dir", default="data", help="Folder containing the .lst files and the images folder")
+@click.option("--index_path", default=None, help="SQLite index (data_dir/circuit_index.sqlite by default)")
+@click.option("--mirrors/--no-mirrors", default=True, help="Also consider mirrored circuits as duplicates")
+@click.option("--delete_images", is_flag=True, default=False, help="Delete the images of the removed duplicates")
+def main(data_dir: str, index_path: str, mirrors: bool, delete_images: bool) -> None:
+    """Removes duplicated circuits (up to translations and mirrors) from a data folder"""
+    nb_kept, nb_removed = dedup_dataset(data_dir, index_path, mirrors, delete_images)
+    click.echo(f"Kept {nb_kept} circuits, removed {nb_removed} duplicates.")
+
+
+if __name__ == "__main__":
+    main()
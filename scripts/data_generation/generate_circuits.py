@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib
-from typing import List, Set, Dict, Tuple, Union, Optional
+from typing import Iterator, List, Set, Dict, Tuple, Union, Optional
 from typing_extensions import Literal
 
 # later : use objects instead of dictionnaries
@@ -25,24 +25,56 @@ class Bipole:
         self.name
 
 
+# segments are identified by their coordinates packed into a single integer
+COORD_BITS: int = 16
+COORD_OFFSET: int = 1 << (COORD_BITS - 1)
+COORD_MAX: int = (1 << COORD_BITS) - 1
+
+
+def encode_segment_key(from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> int:
+    """Packs the 4 coordinates of a segment into one integer (COORD_BITS bits each).
+    Coordinates must be between -2**(COORD_BITS-1) and 2**(COORD_BITS-1) - 1.
+    """
+    key = 0
+    for coord in (*from_pos, *to_pos):
+        coord += COORD_OFFSET
+        if not 0 <= coord <= COORD_MAX:
+            raise ValueError(f"Coordinate {coord - COORD_OFFSET} is out of the supported range")
+        key = (key << COORD_BITS) | coord
+    return key
+
+
 class Segment:
+    __slots__ = ("from_pos", "to_pos", "type", "label", "key")
+
     def __init__(self, from_pos: Tuple[int, int], to_pos: Tuple[int, int], element: str = None, label: str = None) -> None:
-        """
+        """Immutable segment of the circuit (it can be safely stored in sets).
+           Use with_type to get a copy of the segment holding another element.
+
         Args:
             from_pos (Tuple[int, int]): the coordinates of the before node
             to_pos (Tuple[int, int]): the coordinates of the after node
             element (str, optional): the kind of electrical element (can be a wire). Defaults to None.
             label (str, optional): an optional label for the element. Defaults to None.
         """
-        self.from_pos = from_pos
-        self.to_pos = to_pos
-        self.type = element
-        self.label = label
+        # python ints (not numpy ones) so that the positions are formatted as (x, y)
+        from_pos = (int(from_pos[0]), int(from_pos[1]))
+        to_pos = (int(to_pos[0]), int(to_pos[1]))
+        object.__setattr__(self, "from_pos", from_pos)
+        object.__setattr__(self, "to_pos", to_pos)
+        object.__setattr__(self, "type", None if element is None else str(element))
+        object.__setattr__(self, "label", label)
+        object.__setattr__(self, "key", encode_segment_key(from_pos, to_pos))
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError("Segment is immutable, use with_type to change its element")
+
+    def __reduce__(self):
+        return (Segment, (self.from_pos, self.to_pos, self.type, self.label))
 
-    def set_type(self, element: str):
-        if self.type is None:
-            self.type = element
-        raise Exception("Segment already has a type")
+    def with_type(self, element: str) -> "Segment":
+        """Returns a copy of the segment holding the given element"""
+        return Segment(self.from_pos, self.to_pos, element, self.label)
 
     def __repr__(self) -> str:
         if self.type:
@@ -55,22 +87,25 @@ class Segment:
 
     def __eq__(self, __o: object) -> bool:
         if isinstance(__o, Segment):
-            return self.from_pos == __o.from_pos and self.to_pos == __o.to_pos and self.type == __o.type
+            return self.key == __o.key and self.type == __o.type
         return False
 
     def __hash__(self):
-        return hash(str(self))
+        # segments with the same coordinates but different types only collide
+        return self.key
 
 
 class CircuitGenerator:
     def __init__(self, p_remove_inside_segment: float = 0.1, p_remove_outline_segment: float = 0.05,
-                 p_line: float = 0.4, p_source: float = 0.1, p_measure: float = 0.1, p_label: float = 0.5) -> None:
+                 p_line: float = 0.4, p_source: float = 0.1, p_measure: float = 0.1, p_label: float = 0.5,
+                 min_lines: int = 2, max_lines: int = 4) -> None:
         """Choose probabilities for various aspects of the circuits we generate.
 
             Args:
                 p_line (float): probability of having a line instaed of a bipole
                 p_remove_inside_segment (float): probability of removing a segment inside the circuit
                 p_label (float): probability of a bipole to have a label.
+                min_lines, max_lines (int): range of the number of horizontal (and vertical) lines of the grid
         """
         # set probabilitites
         # of removing segmentsfrom the initial grid
@@ -81,6 +116,9 @@ class CircuitGenerator:
         self.p_source: float = p_source
         self.p_measure: float = p_measure
         self.p_label: float = p_label
+        # size of the initial grid
+        self.min_lines: int = min_lines
+        self.max_lines: int = max_lines
         self.segments: Set[Segment] = set()
 
     def get_line_segments(self, segments_lengths: List[int], orientation: Union[Literal["horizontal"], Literal["vertical"]], offset: int, init_pos: int = 0) -> Set[Segment]:
@@ -92,22 +130,20 @@ class CircuitGenerator:
             offset (int): Offset of the segments to return. If 
             init_pos (int): Initial start position of the segments, along the axis of the segments (z if vertical, ...)
         """
-        segments: Set[Segment] = set()
+        return set(self._iter_line_segments(segments_lengths, orientation, offset, init_pos))
 
-        start_pos: int = init_pos
+    def _iter_line_segments(self, segments_lengths: List[int], orientation: Union[Literal["horizontal"], Literal["vertical"]], offset: int, init_pos: int = 0) -> Iterator[Segment]:
+        """Same as get_line_segments, without building an intermediate set"""
+        start_pos: int = int(init_pos)
+        offset = int(offset)
         for length in segments_lengths:
+            end_pos = start_pos + int(length)
             if orientation == "horizontal":
-                x_start, x_end = start_pos, start_pos + length
-                y_start, y_end = offset, offset
+                yield Segment((start_pos, offset), (end_pos, offset))
             # vertical
             else:
-                x_start, x_end = offset, offset
-                y_start, y_end = start_pos, start_pos + length
-            segments.add(
-                Segment((x_start, y_start), (x_end, y_end))
-            )
-            start_pos += length
-        return segments
+                yield Segment((offset, start_pos), (offset, end_pos))
+            start_pos = end_pos
 
     def get_inside_segments(self, nb_vert_lines: int, nb_horiz_lines: int, nb_horiz_spaces: List[int], nb_vert_spaces: List[int]) -> Set[Segment]:
         """Returns all the segments of the initial grid except the outline.
@@ -130,7 +166,7 @@ class CircuitGenerator:
             offset += nb_horiz_spaces[vertical_line_id]
             # add the line segments
             inside_segments.update(
-                self.get_line_segments(
+                self._iter_line_segments(
                     segments_lengths=nb_vert_spaces,
                     orientation="vertical",
                     offset=offset,
@@ -145,7 +181,7 @@ class CircuitGenerator:
             offset += nb_vert_spaces[horizontal_line_id]
             # add the line segments
             inside_segments.update(
-                self.get_line_segments(
+                self._iter_line_segments(
                     segments_lengths=nb_horiz_spaces,
                     orientation="horizontal",
                     offset=offset,
@@ -172,7 +208,7 @@ class CircuitGenerator:
         # vertical lines
         for offset in (0, sum(nb_horiz_spaces)):
             outside_segments.update(
-                self.get_line_segments(
+                self._iter_line_segments(
                     segments_lengths=nb_vert_spaces,
                     orientation="vertical",
                     offset=offset,
@@ -183,7 +219,7 @@ class CircuitGenerator:
         # horizontal
         for offset in (0, sum(nb_vert_spaces)):
             outside_segments.update(
-                self.get_line_segments(
+                self._iter_line_segments(
                     segments_lengths=nb_horiz_spaces,
                     orientation="horizontal",
                     offset=offset,
@@ -194,22 +230,27 @@ class CircuitGenerator:
 
     def add_bipoles(self) -> None:
         """Add bipoles with a certain probability for each class.
+           Segments are immutable, so self.segments is replaced by a set of typed copies.
            Later : add labels and indications to the bipoles.
         """
-        for segment in self.segments:
-            # choose an element
-            rand_nb = np.random.rand()
+        # choose an element for all the segments at once
+        rand_nbs = np.random.rand(len(self.segments))
+        choices = np.random.rand(len(self.segments))
+        typed_segments: Set[Segment] = set()
+        for segment, rand_nb, choice in zip(self.segments, rand_nbs, choices):
             # possibly add a label, and choose its position
             if rand_nb < self.p_line:
-                segment.type = "short"
+                element = "short"
             # with some probability, add a source
             elif rand_nb < self.p_line + self.p_source:
-                segment.type = np.random.choice(SOURCES_BIPOLES)
+                element = SOURCES_BIPOLES[int(choice * len(SOURCES_BIPOLES))]
             elif rand_nb < self.p_line + self.p_source + self.p_measure:
-                segment.type = np.random.choice(MEASURE_BIPOLES)
+                element = MEASURE_BIPOLES[int(choice * len(MEASURE_BIPOLES))]
             else:
-                segment.type = np.random.choice(BIPOLE_TOKENS)
+                element = BIPOLE_TOKENS[int(choice * len(BIPOLE_TOKENS))]
                 # possibly add a label
+            typed_segments.add(segment.with_type(element))
+        self.segments = typed_segments
 
     def generate_one_circuit(self) -> Set[Segment]:
         """Generates a circuit in the form of a list of segments.
@@ -226,7 +267,7 @@ class CircuitGenerator:
             Set[Segment]: Set of segments that define the circuit
         """
         # pick a number of lines for the initial grid
-        nb_vert_lines, nb_horiz_lines = np.random.randint(2, 5, size=2)
+        nb_vert_lines, nb_horiz_lines = np.random.randint(self.min_lines, self.max_lines + 1, size=2)
 
         # draw spaces between lines of the grid (= segments lengths)
         nb_horiz_spaces: int = np.random.randint(2, 4, size=nb_vert_lines-1)
@@ -236,19 +277,17 @@ class CircuitGenerator:
             nb_vert_lines, nb_horiz_lines, nb_horiz_spaces, nb_vert_spaces)
 
         # remove some of these inside segments
-        for segment in tuple(inside_segments):
-            if np.random.rand() < self.p_remove_inside_segment:
-                inside_segments.remove(segment)
+        kept = np.random.rand(len(inside_segments)) >= self.p_remove_inside_segment
+        self.segments = {segment for segment,
+                         keep in zip(inside_segments, kept) if keep}
 
         outline_segments = self.get_outside_segments(
             nb_horiz_spaces, nb_vert_spaces)
 
-        # remove a few outline segments
-        for segment in tuple(outline_segments):
-            if np.random.rand() < self.p_remove_outline_segment:
-                outline_segments.remove(segment)
-
-        self.segments = inside_segments | outline_segments
+        # remove a few outline segments (and add the others to the circuit)
+        kept = np.random.rand(len(outline_segments)) >= self.p_remove_outline_segment
+        self.segments.update(segment for segment,
+                             keep in zip(outline_segments, kept) if keep)
         # add elements to all segments
         self.add_bipoles()
 
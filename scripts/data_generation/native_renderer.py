@@ -0,0 +1,201 @@
+import cv2
+import numpy as np
+from typing import Dict, Iterable, Tuple
+
+from scripts.data_generation.generate_circuits import Segment
+
+# rendering of the LaTeX pipeline that this renderer imitates: the images look like
+# latex_to_jpg at 200 dpi, then pad_to_square with a 50 px border, resized to the image size
+LATEX_DPI: int = 200
+LATEX_BORDER: int = 50
+PX_PER_CM: float = LATEX_DPI / 2.54
+
+WHITE = 255
+BLACK = 0
+# sub-pixel precision of the OpenCV drawing functions (coordinates are multiplied by 2**SHIFT)
+SHIFT: int = 4
+
+# circuitikz default bipole length (cm), the sizes below are given relatively to it
+BIPOLE_LENGTH: float = 1.4
+# (length along the segment, height across it) of each element, relatively to BIPOLE_LENGTH
+ELEMENT_SIZES: Dict[str, Tuple[float, float]] = {
+    "short": (0, 0),
+    "generic": (.8, .3),
+    "capacitor": (.2, .6),
+    "cute inductor": (.8, .25),
+    "normal open switch": (.5, .35),
+    "battery1": (.2, .6),
+    "european voltage source": (.6, .6),
+    "european current source": (.6, .6),
+    "ammeter": (.6, .6),
+    "voltmeter": (.6, .6),
+}
+METER_LETTERS: Dict[str, str] = {"ammeter": "A", "voltmeter": "V"}
+# 5 loops of the inductor, for an inductor of half length 1 and height 1
+_NB_COILS: int = 5
+_COIL_ANGLES = np.linspace(np.pi, 0, 12)
+_COIL: np.ndarray = np.concatenate([
+    np.stack(((2 * i + 1 + np.cos(_COIL_ANGLES)) / _NB_COILS - 1, np.sin(_COIL_ANGLES)), axis=1)
+    for i in range(_NB_COILS)
+])
+
+
+class NativeRenderer:
+    def __init__(self, image_size: int = 350, line_width: float = 1., element_line_width: float = 1.5) -> None:
+        """Draws circuits directly with OpenCV, without LaTeX.
+        The layout reproduces the circuitikz images after pad_to_square and resize_image:
+        same element sizes, same border and same scale.
+
+        Args:
+            image_size (int): side of the square output image (px)
+            line_width (float): thickness of the wires (px, at the output resolution)
+            element_line_width (float): thickness of the elements strokes (px)
+        """
+        self.image_size = image_size
+        self.line_width = line_width
+        self.element_line_width = element_line_width
+
+    @staticmethod
+    def get_bounding_box(segments: Iterable[Segment]) -> Tuple[float, float, float, float]:
+        """Returns (x_min, y_min, x_max, y_max) in cm of the drawn circuit, elements included
+        (as the standalone class crops the LaTeX output to it).
+        """
+        x_min = y_min = float("inf")
+        x_max = y_max = float("-inf")
+        for s in segments:
+            half_height = ELEMENT_SIZES.get(s.type, (0, 0))[1] * BIPOLE_LENGTH / 2
+            # horizontal segments get taller, vertical ones wider
+            dx = half_height if s.from_pos[0] == s.to_pos[0] else 0
+            dy = half_height if s.from_pos[1] == s.to_pos[1] else 0
+            x_min = min(x_min, s.from_pos[0] - dx, s.to_pos[0] - dx)
+            x_max = max(x_max, s.from_pos[0] + dx, s.to_pos[0] + dx)
+            y_min = min(y_min, s.from_pos[1] - dy, s.to_pos[1] - dy)
+            y_max = max(y_max, s.from_pos[1] + dy, s.to_pos[1] + dy)
+        return x_min, y_min, x_max, y_max
+
+    def get_layout(self, segments: Iterable[Segment]) -> Tuple[float, float, float]:
+        """Returns the scale (px per cm) and the pixel position of the (0, 0) node."""
+        x_min, y_min, x_max, y_max = self.get_bounding_box(segments)
+        width, height = (x_max - x_min) * PX_PER_CM, (y_max - y_min) * PX_PER_CM
+        scale = get_scale(segments, self.image_size)
+        # images are centered, and the y axis goes down in images
+        origin_x = (self.image_size - width * scale) / 2 - x_min * PX_PER_CM * scale
+        origin_y = (self.image_size - height * scale) / 2 + y_max * PX_PER_CM * scale
+        return PX_PER_CM * scale, origin_x, origin_y
+
+    def render(self, segments: Iterable[Segment]) -> np.ndarray:
+        """Returns the greyscale (uint8) image of the circuit"""
+        segments = list(segments)
+        img = np.full((self.image_size, self.image_size), WHITE, dtype=np.uint8)
+        if not segments:
+            return img
+        px_per_cm, origin_x, origin_y = self.get_layout(segments)
+        for s in segments:
+            _SegmentDrawer(img, s, px_per_cm, origin_x, origin_y,
+                           self.line_width, self.element_line_width).draw()
+        return img
+
+
+def get_scale(segments: Iterable[Segment], image_size: int = 350) -> float:
+    """Ratio between the final image and the image at LATEX_DPI padded with LATEX_BORDER"""
+    x_min, y_min, x_max, y_max = NativeRenderer.get_bounding_box(segments)
+    # size of the padded image before it gets resized to image_size
+    padded_size = max(x_max - x_min, y_max - y_min) * PX_PER_CM + 2 * LATEX_BORDER
+    return image_size / padded_size
+
+
+def get_latex_layout(segments: Iterable[Segment], image_size: int = 350) -> Tuple[float, int]:
+    """Returns the resolution (dpi) at which latex_to_jpg directly creates the drawing of the final image,
+    and the border (px) to add around it, so that the image does not need to be resized.
+    Labels are not part of the bounding box: a labelled circuit can be slightly larger than expected.
+    """
+    scale = get_scale(segments, image_size)
+    # rounded down, so that rounding errors of Ghostscript still fit in the image
+    return LATEX_DPI * scale, int(LATEX_BORDER * scale)
+
+
+class _SegmentDrawer:
+    def __init__(self, img: np.ndarray, segment: Segment, px_per_cm: float, origin_x: float, origin_y: float,
+                 line_width: float, element_line_width: float) -> None:
+        """Draws one segment, using a local frame: u along the segment, v across it (cm)"""
+        self.img = img
+        self.segment = segment
+        self.px_per_cm = px_per_cm
+        # plain floats: numpy is slower than python for these few scalar operations
+        (x1, y1), (x2, y2) = segment.from_pos, segment.to_pos
+        self.length = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** .5
+        self.ux, self.uy = ((x2 - x1) / self.length, (y2 - y1) / self.length) if self.length else (1., 0.)
+        self.vx, self.vy = -self.uy, self.ux
+        self.center_x, self.center_y = (x1 + x2) / 2, (y1 + y2) / 2
+        self.origin_x, self.origin_y = origin_x, origin_y
+        self.wire_thickness = max(1, int(round(line_width)))
+        self.thickness = max(1, int(round(element_line_width)))
+
+    def to_px(self, a: float, b: float) -> Tuple[int, int]:
+        """Local coordinates (cm) -> fixed point pixel coordinates"""
+        x = self.center_x + a * self.ux + b * self.vx
+        y = self.center_y + a * self.uy + b * self.vy
+        px = self.origin_x + x * self.px_per_cm
+        py = self.origin_y - y * self.px_per_cm
+        return int(round(px * (1 << SHIFT))), int(round(py * (1 << SHIFT)))
+
+    def line(self, a1: float, b1: float, a2: float, b2: float, thickness: int = None) -> None:
+        cv2.line(self.img, self.to_px(a1, b1), self.to_px(a2, b2), BLACK,
+                 thickness or self.thickness, cv2.LINE_AA, SHIFT)
+
+    def polyline(self, points: np.ndarray) -> None:
+        """points: array of shape (N, 2) of local coordinates (cm)"""
+        a, b = points[:, 0], points[:, 1]
+        px = self.origin_x + (self.center_x + a * self.ux + b * self.vx) * self.px_per_cm
+        py = self.origin_y - (self.center_y + a * self.uy + b * self.vy) * self.px_per_cm
+        pts = np.rint(np.stack((px, py), axis=1) * (1 << SHIFT)).astype(np.int32)
+        cv2.polylines(self.img, [pts], False, BLACK, self.thickness, cv2.LINE_AA, SHIFT)
+
+    def circle(self, radius: float) -> None:
+        cv2.circle(self.img, self.to_px(0, 0), int(round(radius * self.px_per_cm * (1 << SHIFT))),
+                   BLACK, self.thickness, cv2.LINE_AA, SHIFT)
+
+    def text(self, letter: str, height: float) -> None:
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        (w, h), _ = cv2.getTextSize(letter, font, 1, 1)
+        font_scale = height * self.px_per_cm / h
+        x, y = (c / (1 << SHIFT) for c in self.to_px(0, 0))
+        org = (int(round(x - w * font_scale / 2)), int(round(y + h * font_scale / 2)))
+        cv2.putText(self.img, letter, org, font, font_scale, BLACK, self.thickness, cv2.LINE_AA)
+
+    def draw(self) -> None:
+        element = self.segment.type
+        rel_length, rel_height = ELEMENT_SIZES.get(element, (0, 0))
+        half_l = rel_length * BIPOLE_LENGTH / 2
+        half_h = rel_height * BIPOLE_LENGTH / 2
+        # wires on both sides of the element
+        half_segment = self.length / 2
+        if half_l > 0:
+            self.line(-half_segment, 0, -half_l, 0, self.wire_thickness)
+            self.line(half_l, 0, half_segment, 0, self.wire_thickness)
+        else:
+            self.line(-half_segment, 0, half_segment, 0, self.wire_thickness)
+
+        if element == "generic":
+            self.polyline(np.array([(-half_l, -half_h), (half_l, -half_h), (half_l, half_h),
+                                    (-half_l, half_h), (-half_l, -half_h)]))
+        elif element == "capacitor":
+            self.line(-half_l, -half_h, -half_l, half_h)
+            self.line(half_l, -half_h, half_l, half_h)
+        elif element == "battery1":
+            # long plate, then short plate
+            self.line(-half_l, -half_h, -half_l, half_h)
+            self.line(half_l, -half_h / 2, half_l, half_h / 2)
+        elif element == "cute inductor":
+            self.polyline(_COIL * (half_l, 2 * half_h))
+        elif element == "normal open switch":
+            self.line(-half_l, 0, half_l * .8, half_h)
+        elif element in ("european voltage source", "european current source", "ammeter", "voltmeter"):
+            radius = half_h
+            self.circle(radius)
+            if element == "european voltage source":
+                self.line(-radius, 0, radius, 0)
+            elif element == "european current source":
+                self.line(0, -radius, 0, radius)
+            else:
+                self.text(METER_LETTERS[element], radius)
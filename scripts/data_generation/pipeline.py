@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Optional, Set
+
+import scripts.utils.image_utils as iu
+import scripts.utils.utils as ut
+from scripts.data_generation.dedup import CircuitIndex
+from scripts.data_generation.generate_circuits import CircuitGenerator
+from scripts.data_generation.native_renderer import get_latex_layout
+from scripts.utils.shard_utils import ShardWriter
+
+# marks the end of the items of a queue
+_DONE = None
+
+
+class Sample:
+    def __init__(self, latex_string: str, filename: str, resolution: float = None, border: int = 0,
+                 circuit_key: str = None) -> None:
+        """A circuit going through the pipeline, rasterized at resolution (dpi) and padded with border (px).
+        circuit_key is added to the circuit index once the sample is written."""
+        self.latex_string = latex_string
+        self.filename = filename
+        self.circuit_key = circuit_key
+        self.resolution = resolution
+        self.border = border
+
+
+class GenerationPipeline:
+    def __init__(self, save_to: str, images_folder_path: str, latex_path: str, ghostscript_path: str,
+                 circuit_generator: CircuitGenerator, generator_version: str = "basic", image_size: int = 350,
+                 latex_jobs: int = 2, ghostscript_jobs: int = 2, postprocess_jobs: int = 2,
+                 queue_size: int = 8, circuit_index: CircuitIndex = None,
+                 shard_writer: ShardWriter = None) -> None:
+        """Generates circuits like generate.py, with the latex, ghostscript and image processing
+        stages running concurrently: LaTeX compiles circuit i+1 while Ghostscript rasterizes circuit i
+        and circuit i-1 gets padded and resized.
+
+        Args:
+            save_to (str): folder containing the .lst files
+            images_folder_path (str): folder where the images are saved
+            latex_jobs, ghostscript_jobs, postprocess_jobs (int): number of concurrent workers of each stage
+            queue_size (int): maximal number of circuits waiting between two stages
+            circuit_index (CircuitIndex, optional): circuits already in it are skipped before being compiled,
+                the others are added to it once written (so that failed compilations can be generated again)
+            shard_writer (ShardWriter, optional): if given, the images are moved into its shards
+        """
+        self.save_to = save_to
+        self.images_folder_path = images_folder_path
+        self.latex_path = latex_path
+        self.ghostscript_path = ghostscript_path
+        self.circuit_generator = circuit_generator
+        self.generator_version = generator_version
+        self.image_size = image_size
+        self.latex_jobs = latex_jobs
+        self.ghostscript_jobs = ghostscript_jobs
+        self.postprocess_jobs = postprocess_jobs
+        self.queue_size = queue_size
+        self.circuit_index = circuit_index
+        self.shard_writer = shard_writer
+        self.nb_generated = 0
+
+    def run(self, nb_images: int) -> int:
+        """Generates nb_images circuits, returns the number of images actually saved"""
+        return asyncio.run(self._run(nb_images))
+
+    async def _run(self, nb_images: int) -> int:
+        latex_queue = asyncio.Queue(self.queue_size)
+        ghostscript_queue = asyncio.Queue(self.queue_size)
+        postprocess_queue = asyncio.Queue(self.queue_size)
+        write_queue = asyncio.Queue(self.queue_size)
+        await asyncio.gather(
+            self._produce(nb_images, latex_queue),
+            self._run_stage(self._compile_latex, latex_queue, ghostscript_queue,
+                            self.latex_jobs, self.ghostscript_jobs),
+            self._run_stage(self._rasterize, ghostscript_queue, postprocess_queue,
+                            self.ghostscript_jobs, self.postprocess_jobs),
+            self._run_stage(self._postprocess, postprocess_queue, write_queue,
+                            self.postprocess_jobs, 1),
+            self._write(write_queue),
+        )
+        return self.nb_generated
+
+    async def _produce(self, nb_images: int, out_queue: asyncio.Queue) -> None:
+        """Generates the circuits and their .tex files"""
+        in_progress: Set[str] = set()
+        # keys of this run, which are only added to the index once written
+        keys_in_progress: Set[str] = set()
+        for _ in range(nb_images):
+            segments_list = self.circuit_generator.generate_one_circuit()
+            latex_string = ut.segment_list_to_latex(segments_list)
+            filename = ut.get_image_name(latex_string)
+            # two workers must not compile the same files at the same time
+            if filename in in_progress:
+                continue
+            circuit_key = None
+            if self.circuit_index is not None:
+                circuit_key = self.circuit_index.get_key(segments_list)
+                if circuit_key in keys_in_progress or circuit_key in self.circuit_index:
+                    continue
+                keys_in_progress.add(circuit_key)
+            in_progress.add(filename)
+            ut.save_to_latex(ut.BEFORE_LATEX + latex_string + ut.AFTER_LATEX,
+                             self.images_folder_path, filename)
+            await out_queue.put(Sample(latex_string, filename, *get_latex_layout(segments_list, self.image_size),
+                                       circuit_key))
+        for _ in range(self.latex_jobs):
+            await out_queue.put(_DONE)
+
+    @staticmethod
+    async def _run_stage(func: Callable[[Sample], Awaitable[Optional[Sample]]], in_queue: asyncio.Queue,
+                         out_queue: asyncio.Queue, nb_workers: int, nb_next_workers: int) -> None:
+        """Runs nb_workers concurrent workers applying func to the samples of in_queue.
+        Samples for which func returns None are dropped."""
+        async def worker():
+            while (sample := await in_queue.get()) is not _DONE:
+                result = await func(sample)
+                if result is not None:
+                    await out_queue.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(nb_workers)))
+        for _ in range(nb_next_workers):
+            await out_queue.put(_DONE)
+
+    async def _compile_latex(self, sample: Sample) -> Optional[Sample]:
+        if await ut.async_latex_to_pdf(sample.filename, self.latex_path, self.images_folder_path):
+            return sample
+        logging.warning(f"LaTeX compilation failed for {sample.filename}")
+        ut.remove_latex_files(os.path.join(self.images_folder_path, sample.filename))
+
+    async def _rasterize(self, sample: Sample) -> Optional[Sample]:
+        success = await ut.async_pdf_to_jpg(sample.filename, self.ghostscript_path, self.images_folder_path,
+                                            sample.resolution)
+        ut.remove_latex_files(os.path.join(self.images_folder_path, sample.filename))
+        if success:
+            return sample
+        logging.warning(f"Ghostscript conversion failed for {sample.filename}")
+
+    def _pad(self, img_path: str, border: int) -> None:
+        # the image is already at the final scale: only padded, or resized when labels make it larger
+        img = iu.fit_to_square(iu.read_image(img_path), self.image_size, border)
+        iu.save_image(img, img_path)
+
+    async def _postprocess(self, sample: Sample) -> Sample:
+        # OpenCV releases the GIL, so threads do run in parallel
+        img_path = os.path.join(self.images_folder_path, f"{sample.filename}.jpg")
+        await asyncio.get_running_loop().run_in_executor(None, self._pad, img_path, sample.border)
+        return sample
+
+    async def _write(self, in_queue: asyncio.Queue) -> None:
+        """Appends the samples to the .lst files (single writer, so lines are never interleaved)"""
+        formulas_path = os.path.join(self.save_to, "circuitikz_code.lst")
+        # line of the next formula
+        line_number = ut.count_lines(formulas_path) + 1
+        with open(os.path.join(self.save_to, "circuit2latex.lst"), "a") as names_file, \
+                open(formulas_path, "a") as formulas_file:
+            while (sample := await in_queue.get()) is not _DONE:
+                if self.shard_writer is not None:
+                    img_path = os.path.join(self.images_folder_path, f"{sample.filename}.jpg")
+                    with open(img_path, "rb") as f:
+                        self.shard_writer.write(sample.filename, f.read(), sample.latex_string,
+                                                {"generator_version": self.generator_version})
+                    os.remove(img_path)
+                names_file.write(f"{line_number} {sample.filename} {self.generator_version}\n")
+                formulas_file.write(f"{sample.latex_string}\n")
+                line_number += 1
+                if sample.circuit_key is not None:
+                    self.circuit_index.add(sample.circuit_key, sample.filename)
+                self.nb_generated += 1
+                print(f"{self.nb_generated} images generated")
@@ -0,0 +1,160 @@
+import glob
+import hashlib
+import os
+import tempfile
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+import scripts.utils.image_utils as iu
+import scripts.utils.utils as ut
+from scripts.data_generation.generate_circuits import BIPOLE_TOKENS, SOURCES_BIPOLES, MEASURE_BIPOLES, Segment
+
+# every element the generator can place on a segment
+ATLAS_ELEMENTS: List[str] = ["short"] + BIPOLE_TOKENS + SOURCES_BIPOLES + MEASURE_BIPOLES
+# direction of the segment, from its from_pos to its to_pos (the generator only uses right and up)
+DIRECTIONS: Dict[Tuple[int, int], str] = {(1, 0): "right", (0, 1): "up", (-1, 0): "left", (0, -1): "down"}
+# space (cm) around the segment in each sprite, large enough to contain any element
+SPRITE_MARGIN: float = 1.
+ATLAS_DPI: int = 200
+
+# (element, direction, length)
+SpriteKey = Tuple[str, str, int]
+# sprites compiled when the atlas is first built
+DEFAULT_SPRITE_KEYS: List[SpriteKey] = [
+    (element, direction, length)
+    for element in ATLAS_ELEMENTS for direction in ("right", "up") for length in (2, 3)
+]
+
+
+def get_sprite_key(segment: Segment) -> SpriteKey:
+    dx = segment.to_pos[0] - segment.from_pos[0]
+    dy = segment.to_pos[1] - segment.from_pos[1]
+    length = abs(dx) + abs(dy)
+    if dx and dy or not length:
+        raise ValueError(f"Segment {segment} is not horizontal or vertical")
+    return segment.type, DIRECTIONS[(dx // length, dy // length)], length
+
+
+def get_atlas_version() -> str:
+    """Changes whenever the LaTeX preamble or the sprites layout change (invalidates the stored atlas)"""
+    settings = f"{ut.BEFORE_LATEX}|{ut.AFTER_LATEX}|{ATLAS_DPI}|{SPRITE_MARGIN}"
+    return hashlib.sha1(settings.encode("utf-8")).hexdigest()[:15]
+
+
+def sprite_to_latex(key: SpriteKey) -> str:
+    """circuitikz code of a single element, with a fixed bounding box so that the
+    position of the segment in the image is known"""
+    element, direction, length = key
+    dx, dy = next(d for d, name in DIRECTIONS.items() if name == direction)
+    to_pos = (dx * length, dy * length)
+    m = SPRITE_MARGIN
+    bounding_box = (f"\\useasboundingbox ({min(0, to_pos[0]) - m}, {min(0, to_pos[1]) - m}) "
+                    f"rectangle ({max(0, to_pos[0]) + m}, {max(0, to_pos[1]) + m}); ")
+    return bounding_box + ut.segment_list_to_latex([Segment((0, 0), to_pos, element)])
+
+
+class SpriteAtlas:
+    def __init__(self, sprites: Dict[SpriteKey, np.ndarray] = None, px_per_cm: float = ATLAS_DPI / 2.54,
+                 cache_path: str = None, latex_path: str = None, ghostscript_path: str = None) -> None:
+        """Images of single circuitikz elements, pasted together to draw whole circuits.
+
+        Args:
+            sprites: greyscale image of each (element, direction, length). Each sprite covers the segment
+                and SPRITE_MARGIN cm around it.
+            px_per_cm (float): resolution of the sprites
+            cache_path (str, optional): .npz file where the atlas is stored when new sprites are compiled
+            latex_path, ghostscript_path (str, optional): binaries used to compile missing sprites
+        """
+        self.sprites: Dict[SpriteKey, np.ndarray] = sprites or {}
+        self.px_per_cm = px_per_cm
+        self.cache_path = cache_path
+        self.latex_path = latex_path
+        self.ghostscript_path = ghostscript_path
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "SpriteAtlas":
+        with np.load(path) as data:
+            sprites = {}
+            for name in data.files:
+                if name == "px_per_cm":
+                    continue
+                element, direction, length = name.split("|")
+                sprites[(element, direction, int(length))] = data[name]
+            return cls(sprites, float(data["px_per_cm"]), **kwargs)
+
+    def save(self, path: str) -> None:
+        arrays = {f"{element}|{direction}|{length}": sprite
+                  for (element, direction, length), sprite in self.sprites.items()}
+        np.savez_compressed(path, px_per_cm=np.array(self.px_per_cm), **arrays)
+
+    @classmethod
+    def load_or_build(cls, cache_dir: str, latex_path: str, ghostscript_path: str,
+                      keys: Iterable[SpriteKey] = ()) -> "SpriteAtlas":
+        """Loads the atlas matching the current LaTeX preamble from cache_dir, or builds it.
+        Atlases built with another preamble are deleted.
+
+        Args:
+            keys: sprites to build in advance, others are compiled (and stored) when first needed
+        """
+        ut.create_dir_if_not_exists(cache_dir)
+        path = os.path.join(cache_dir, f"sprite_atlas_{get_atlas_version()}.npz")
+        for stale_path in glob.glob(os.path.join(cache_dir, "sprite_atlas_*.npz")):
+            if stale_path != path:
+                os.remove(stale_path)
+        kwargs = dict(cache_path=path, latex_path=latex_path, ghostscript_path=ghostscript_path)
+        atlas = cls.load(path, **kwargs) if os.path.exists(path) else cls(**kwargs)
+        missing_keys = [k for k in keys if k not in atlas.sprites]
+        if missing_keys:
+            atlas.build_sprites(missing_keys)
+        return atlas
+
+    def build_sprites(self, keys: Iterable[SpriteKey]) -> None:
+        """Compiles the given sprites with LaTeX (once), and stores the atlas"""
+        if self.latex_path is None or self.ghostscript_path is None:
+            raise ValueError("LaTeX and Ghostscript paths are needed to build sprites")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for key in keys:
+                filename = "sprite"
+                ut.save_to_latex(ut.BEFORE_LATEX + sprite_to_latex(key) + ut.AFTER_LATEX, tmp_dir, filename)
+                ut.latex_to_jpg(filename, self.latex_path, self.ghostscript_path, tmp_dir)
+                img_path = os.path.join(tmp_dir, f"{filename}.jpg")
+                self.sprites[key] = iu.read_image(img_path)
+                os.remove(img_path)
+        if self.cache_path is not None:
+            self.save(self.cache_path)
+
+    def get_sprite(self, key: SpriteKey) -> np.ndarray:
+        if key not in self.sprites:
+            self.build_sprites([key])
+        return self.sprites[key]
+
+    def compose(self, segments: Iterable[Segment]) -> np.ndarray:
+        """Pastes the sprites of all segments on a white canvas (keeping the darkest pixels),
+        then crops it to the drawing like the standalone class does.
+        Returns an image at the atlas resolution, to be padded and resized like the LaTeX ones
+        (a blank one, of the size of the margins, when there are no segments).
+        """
+        segments = list(segments)
+        m = SPRITE_MARGIN
+        if not segments:
+            side = int(np.ceil(2 * m * self.px_per_cm)) + 1
+            return np.full((side, side), iu.WHITE, dtype=np.uint8)
+        xs = [c for s in segments for c in (s.from_pos[0], s.to_pos[0])]
+        ys = [c for s in segments for c in (s.from_pos[1], s.to_pos[1])]
+        x_min, y_max = min(xs), max(ys)
+        height = int(np.ceil((y_max - min(ys) + 2 * m) * self.px_per_cm)) + 1
+        width = int(np.ceil((max(xs) - x_min + 2 * m) * self.px_per_cm)) + 1
+        canvas = np.full((height, width), iu.WHITE, dtype=np.uint8)
+
+        for s in segments:
+            key = get_sprite_key(s)
+            sprite = self.get_sprite(key)
+            # top left corner of the sprite: its bounding box starts SPRITE_MARGIN before the segment
+            left = min(s.from_pos[0], s.to_pos[0]) - x_min
+            top = y_max - max(s.from_pos[1], s.to_pos[1])
+            row, col = int(round(top * self.px_per_cm)), int(round(left * self.px_per_cm))
+            h, w = min(sprite.shape[0], height - row), min(sprite.shape[1], width - col)
+            region = canvas[row:row + h, col:col + w]
+            np.minimum(region, sprite[:h, :w], out=region)
+        return iu.crop_to_content(canvas)
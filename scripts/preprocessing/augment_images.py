@@ -0,0 +1,171 @@
+import math
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import default_collate, get_worker_info
+
+# JPEG luminance quantization table (quality 50)
+JPEG_LUMINANCE_TABLE = torch.tensor([
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99],
+], dtype=torch.float32)
+JPEG_BLOCK_SIZE = 8
+
+
+def get_dct_matrix(n: int = JPEG_BLOCK_SIZE) -> torch.Tensor:
+    """Orthonormal DCT-II matrix: D @ x is the DCT of the vector x"""
+    k = torch.arange(n, dtype=torch.float32)[:, None]
+    i = torch.arange(n, dtype=torch.float32)[None, :]
+    matrix = torch.cos(math.pi * (2 * i + 1) * k / (2 * n)) * math.sqrt(2 / n)
+    matrix[0] /= math.sqrt(2)
+    return matrix
+
+
+def get_quantization_tables(quality: torch.Tensor) -> torch.Tensor:
+    """Quantization tables (B, 8, 8) for JPEG qualities (B,) between 1 and 100, as libjpeg scales them"""
+    quality = quality.clamp(1, 100)
+    scale = torch.where(quality < 50, 5000 / quality, 200 - 2 * quality)
+    tables = torch.floor((JPEG_LUMINANCE_TABLE * scale[:, None, None] + 50) / 100)
+    return tables.clamp(min=1)
+
+
+def simulate_jpeg(images: torch.Tensor, quality: torch.Tensor) -> torch.Tensor:
+    """Compresses and decompresses greyscale images with JPEG (block DCT and quantization only),
+    all 8x8 blocks of the batch at once.
+
+    Args:
+        images (torch.Tensor): (B, 1, H, W) images in [0, 1]
+        quality (torch.Tensor): (B,) JPEG quality of each image
+    """
+    b, c, h, w = images.shape
+    pad_h, pad_w = -h % JPEG_BLOCK_SIZE, -w % JPEG_BLOCK_SIZE
+    x = F.pad(images, (0, pad_w, 0, pad_h), mode="replicate") * 255 - 128
+    nh, nw = x.shape[2] // JPEG_BLOCK_SIZE, x.shape[3] // JPEG_BLOCK_SIZE
+    # (B, C, nh, nw, 8, 8) blocks
+    blocks = x.reshape(b, c, nh, JPEG_BLOCK_SIZE, nw, JPEG_BLOCK_SIZE).transpose(3, 4)
+    dct = get_dct_matrix().to(images)
+    tables = get_quantization_tables(quality.to(images))[:, None, None, None]
+    coefficients = dct @ blocks @ dct.T
+    coefficients = torch.round(coefficients / tables) * tables
+    blocks = dct.T @ coefficients @ dct
+    x = blocks.transpose(3, 4).reshape(b, c, nh * JPEG_BLOCK_SIZE, nw * JPEG_BLOCK_SIZE)
+    return ((x[:, :, :h, :w] + 128) / 255).clamp(0, 1)
+
+
+def thicken_strokes(images: torch.Tensor, kernel_size: int = 3) -> torch.Tensor:
+    """Grey level erosion (min pooling): dark strokes on a white background get thicker.
+    The square kernel is separated into a row and a column minimum (much faster than max_pool2d on CPU).
+    """
+    r = kernel_size // 2
+    padded = F.pad(images, (r, r, r, r), value=1.)
+    h, w = images.shape[-2:]
+    rows = padded[..., :, :w]
+    for i in range(1, kernel_size):
+        rows = torch.minimum(rows, padded[..., :, i:i + w])
+    result = rows[..., :h, :]
+    for i in range(1, kernel_size):
+        result = torch.minimum(result, rows[..., i:i + h, :])
+    return result
+
+
+def random_affine(images: torch.Tensor, angles: torch.Tensor, scales: torch.Tensor) -> torch.Tensor:
+    """Rotates (angles in degrees) and scales each image around its center, the background stays white"""
+    radians = angles * math.pi / 180
+    cos, sin = torch.cos(radians) / scales, torch.sin(radians) / scales
+    zeros = torch.zeros_like(cos)
+    # maps output coordinates to input ones (in [-1, 1])
+    theta = torch.stack((torch.stack((cos, -sin, zeros), 1), torch.stack((sin, cos, zeros), 1)), 1)
+    grid = F.affine_grid(theta.to(images), list(images.shape), align_corners=False)
+    # grid_sample pads with zeros: work on inverted images so that the padding is white
+    return 1 - F.grid_sample(1 - images, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+
+class BatchAugmentation:
+    def __init__(self, max_rotation: float = 3., max_scale: float = .1, p_thicken: float = .3,
+                 max_noise: float = .05, p_jpeg: float = .3, jpeg_quality: Tuple[int, int] = (30, 90),
+                 seed: int = 0) -> None:
+        """Random variations applied to whole batches of images (B, 1, H, W) in [0, 1], white background.
+        Each image gets its own random parameters.
+
+        Args:
+            max_rotation (float): rotations are drawn in [-max_rotation, max_rotation] degrees
+            max_scale (float): scales are drawn in [1 - max_scale, 1 + max_scale]
+            p_thicken (float): probability of thickening the strokes of an image
+            max_noise (float): standard deviations of the gaussian noise are drawn in [0, max_noise]
+            p_jpeg (float): probability of adding JPEG compression artifacts
+            jpeg_quality (Tuple[int, int]): range of the JPEG qualities
+            seed (int): the augmentations only depend on the seed, the epoch and the DataLoader worker
+        """
+        self.max_rotation = max_rotation
+        self.max_scale = max_scale
+        self.p_thicken = p_thicken
+        self.max_noise = max_noise
+        self.p_jpeg = p_jpeg
+        self.jpeg_quality = jpeg_quality
+        self.seed = seed
+        self.epoch = 0
+        self.generator = torch.Generator()
+        self._worker_id: Optional[int] = None
+        self._reseed()
+
+    def set_epoch(self, epoch: int) -> None:
+        """Changes the augmentations at each epoch (DataLoader workers get a copy of the augmentation)"""
+        self.epoch = epoch
+        self._reseed()
+
+    def _reseed(self) -> None:
+        worker_id = -1 if self._worker_id is None else self._worker_id
+        state = np.random.SeedSequence([self.seed, self.epoch, worker_id + 1]).generate_state(1)[0]
+        self.generator.manual_seed(int(state))
+
+    def _uniform(self, n: int, low: float, high: float) -> torch.Tensor:
+        return low + (high - low) * torch.rand(n, generator=self.generator)
+
+    def __call__(self, images: torch.Tensor) -> torch.Tensor:
+        # each DataLoader worker draws different parameters
+        worker_info = get_worker_info()
+        if worker_info is not None and worker_info.id != self._worker_id:
+            self._worker_id = worker_info.id
+            self._reseed()
+
+        n = len(images)
+        if self.max_rotation or self.max_scale:
+            angles = self._uniform(n, -self.max_rotation, self.max_rotation)
+            scales = self._uniform(n, 1 - self.max_scale, 1 + self.max_scale)
+            images = random_affine(images, angles, scales)
+        if self.p_thicken:
+            thicken = (torch.rand(n, generator=self.generator) < self.p_thicken).to(images.device)
+            if thicken.any():
+                images = torch.where(thicken[:, None, None, None], thicken_strokes(images), images)
+        if self.max_noise:
+            std = self._uniform(n, 0, self.max_noise).to(images)
+            noise = torch.randn(images.shape, generator=self.generator).to(images)
+            images = (images + std[:, None, None, None] * noise).clamp(0, 1)
+        if self.p_jpeg:
+            # only compress the selected images
+            selected = torch.nonzero(torch.rand(n, generator=self.generator) < self.p_jpeg).flatten()
+            quality = self._uniform(len(selected), *self.jpeg_quality).round()
+            if len(selected):
+                images = images.clone()
+                images[selected.to(images.device)] = simulate_jpeg(images[selected.to(images.device)], quality)
+        return images
+
+
+class AugmentCollate:
+    def __init__(self, augmentation: BatchAugmentation, collate_fn: Callable = default_collate) -> None:
+        """Collate function augmenting the images of each batch once they are stacked,
+        so that the augmentation runs in the DataLoader workers."""
+        self.augmentation = augmentation
+        self.collate_fn = collate_fn
+
+    def __call__(self, batch: List[Tuple[torch.Tensor, torch.Tensor]]) -> Tuple[torch.Tensor, torch.Tensor]:
+        images, formulas = self.collate_fn(batch)
+        return self.augmentation(images), formulas
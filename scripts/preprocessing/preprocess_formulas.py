@@ -1,8 +1,10 @@
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
+import json
 import re
 import torch
 import torch.nn.functional as F
 import logging
+import os
 
 
 class Vocabulary:
@@ -13,19 +15,17 @@ class Vocabulary:
         self.word_to_idx = {word: idx for idx, word in self.idx_to_word.items()}
         # default tensor data type used for the formulas
         self.dtype: torch.dtype = torch.int64  # uint8 cannot be used to one hot encode
+        # incremented each time tokens are added, existing tokens never change id
+        self.version = 0
 
     def __len__(self) -> int:
         return len(self.word_to_idx)
 
-    def build_vocaulary(self, file_path: str) -> None:
-        """From a text file containing formulas, tokenize them and return a list of tokens + UNK, PAD, EOS, SOS...
-        Saves the:
-            The list of possible tokens
-            A maximal length for formulas
+    def update(self, formulas: Iterable[str]) -> List[str]:
+        """Adds the tokens of the formulas that are not in the vocabulary yet, after the existing ones
+        (so the ids of the existing tokens stay the same), and updates formula_max_length.
+        Returns the new tokens.
         """
-        # read the formulas
-        with open(file_path, "r") as f:
-            formulas = f.readlines()
         tokens = set()
         # find the maximum length of the formulas
         max_length = 0
@@ -36,7 +36,7 @@ class Vocabulary:
             if len(tokenized_formula) > max_length:
                 max_length = len(tokenized_formula)
 
-        self.formula_max_length = max_length + 2  # +2 for SOS and EOS
+        self.formula_max_length = max(self.formula_max_length or 0, max_length + 2)  # +2 for SOS and EOS
         # if the indexes cannot be represented with an
         if self.formula_max_length > 255:
             logging.info("Using uint16 as torch.tensor dtype.")
@@ -44,10 +44,58 @@ class Vocabulary:
             self.dtype = torch.int16
 
         # add the tokens to the vocabulary
-        for token in sorted(list(tokens)):
+        new_tokens = sorted(tokens - self.word_to_idx.keys())
+        for token in new_tokens:
             idx = len(self.word_to_idx)
             self.word_to_idx[token] = idx
             self.idx_to_word[idx] = token
+        if new_tokens:
+            self.version += 1
+        return new_tokens
+
+    def save(self, path: str, append_only: bool = True) -> None:
+        """Saves the vocabulary as json. If append_only, raises a ValueError if the file holds a vocabulary
+        which is not a prefix of this one (the ids of its tokens would change)."""
+        tokens = [self.idx_to_word[i] for i in range(len(self))]
+        if append_only and os.path.exists(path):
+            previous_vocab = Vocabulary.load(path)
+            previous_tokens = [previous_vocab.idx_to_word[i] for i in range(len(previous_vocab))]
+        else:
+            previous_tokens = []
+        if tokens[:len(previous_tokens)] != previous_tokens:
+            raise ValueError(f"The vocabulary of {path} is not a prefix of this vocabulary")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"version": self.version, "tokens": tokens,
+                       "formula_max_length": self.formula_max_length}, f)
+        # never leave a partially written vocabulary
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "Vocabulary":
+        with open(path, "r") as f:
+            data = json.load(f)
+        vocab = cls()
+        if "tokens" in data:
+            vocab.idx_to_word = dict(enumerate(data["tokens"]))
+        # vocabularies exported by the first versions of src/inference.py
+        else:
+            vocab.idx_to_word = {int(i): w for i, w in data["idx_to_word"].items()}
+        vocab.word_to_idx = {w: i for i, w in vocab.idx_to_word.items()}
+        vocab.version = data.get("version", 0)
+        vocab.formula_max_length = data["formula_max_length"]
+        if vocab.formula_max_length > 255:
+            vocab.dtype = torch.int16
+        return vocab
+
+    def build_vocaulary(self, file_path: str) -> None:
+        """From a text file containing formulas, tokenize them and return a list of tokens + UNK, PAD, EOS, SOS...
+        Saves the:
+            The list of possible tokens
+            A maximal length for formulas
+        """
+        # read the formulas
+        with open(file_path, "r") as f:
+            self.update(f)
 
     def basic_tokenize(self, formula: str) -> List[str]:
         """Returns a list of tokens corresponding to the input formula.
@@ -56,9 +104,25 @@ class Vocabulary:
         """
         return re.findall(r"to\[[\w\s]+\]|[a-z0-9\\]+|\([0-9|\s,]+\)|;", formula)
 
-    def pad(self, tokens_list: List[str]) -> List[str]:
-        """Pads the tokens list with <PAD> tokens to make them formula_max_length"""
-        nb_pads = self.formula_max_length - len(tokens_list) - 2
+    def detokenize(self, tokens_list: List[str]) -> str:
+        """Inverse of basic_tokenize: joins tokens into a circuitikz formula.
+        Special tokens are skipped and the formula stops at the first <EOS> token.
+        """
+        words = []
+        for token in tokens_list:
+            if token == "<EOS>":
+                break
+            if token in ("<PAD>", "<SOS>"):
+                continue
+            words.append(token)
+        return " ".join(words).replace(" ;", ";")
+
+    def pad(self, tokens_list: List[str], length: int = None) -> List[str]:
+        """Adds <SOS> and <EOS> tokens, then pads the tokens list with <PAD> tokens
+        to make them length long (formula_max_length by default)"""
+        if length is None:
+            length = self.formula_max_length
+        nb_pads = length - len(tokens_list) - 2
         return ["<SOS>"] + tokens_list + ["<EOS>"] + ["<PAD>"] * nb_pads
 
     def numericalize(self, tokens_list: List[str]) -> torch.Tensor:
@@ -69,18 +133,29 @@ class Vocabulary:
 
     def one_hot_encode(self, numeric_tokens_list: torch.Tensor) -> torch.Tensor:
         """Convert the tensor of token ids to a one hot encoded tensor"""
-        return F.one_hot(numeric_tokens_list, num_classes=len(self))
+        # one_hot only accepts int64 indices (self.dtype can be int16 for long formulas)
+        return F.one_hot(numeric_tokens_list.long(), num_classes=len(self))
 
-    def preprocess_formula(self, formula: str) -> torch.Tensor:
+    def preprocess_formula(self, formula: str, pad_to_max_length: bool = True) -> torch.Tensor:
         """Processes the latex formula to be used to train a model.
         tokenizes, then pads, then converts it into a vector
+        If pad_to_max_length is False, only <SOS> and <EOS> are added (padding is done per batch).
         """
         tokens = self.basic_tokenize(formula)
-        padded_formula = self.pad(tokens)
+        padded_formula = self.pad(tokens, None if pad_to_max_length else len(tokens) + 2)
         num_formula = self.numericalize(padded_formula)
         encoded_tokens_formula = self.one_hot_encode(num_formula)
         return encoded_tokens_formula.to(dtype=torch.float)
 
+    def preprocess_token_ids(self, token_ids: torch.Tensor, pad_to_max_length: bool = True) -> torch.Tensor:
+        """Same as preprocess_formula, for a formula already tokenized and numericalized (without <SOS> and <EOS>)"""
+        length = self.formula_max_length if pad_to_max_length else len(token_ids) + 2
+        num_formula = torch.full((length,), self.word_to_idx["<PAD>"], dtype=torch.int64)
+        num_formula[0] = self.word_to_idx["<SOS>"]
+        num_formula[1:len(token_ids) + 1] = torch.as_tensor(token_ids, dtype=torch.int64)
+        num_formula[len(token_ids) + 1] = self.word_to_idx["<EOS>"]
+        return self.one_hot_encode(num_formula).to(dtype=torch.float)
+
     def get_encoded_token(self, tokens: str | int | torch.Tensor) -> torch.Tensor:
         """Returns the one hot encoded vector corresponding to the token(s) given as input
 
@@ -0,0 +1,198 @@
+import json
+import os
+from typing import List, Tuple
+
+import click
+import numpy as np
+
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+
+VOCAB_FILE = "vocab.json"
+STATE_FILE = "state.json"
+TOKENS_FILE = "tokens.bin"
+OFFSETS_FILE = "offsets.bin"
+SAMPLE_LINES_FILE = "sample_lines.bin"
+SAMPLE_NAMES_FILE = "sample_names.bin"
+TOKEN_DTYPE = np.uint16
+OFFSET_DTYPE = np.int64
+# image names are fixed-length byte strings (get_image_name gives 15 characters)
+NAME_DTYPE = np.dtype("S32")
+EMPTY_STATE = {"nb_formulas": 0, "formulas_file_position": 0, "nb_samples": 0, "annotations_file_position": 0}
+
+
+def read_new_lines(path: str, position: int) -> Tuple[List[str], List[int]]:
+    """Complete lines (ending with a new line) of a file after position (bytes), and the size of each one.
+    An incomplete last line is read at the next call."""
+    with open(path, "rb") as f:
+        f.seek(position)
+        data = f.read()
+    lines = data[:data.rfind(b"\n") + 1].splitlines(keepends=True)
+    return [line.decode("utf-8").rstrip("\r\n") for line in lines], [len(line) for line in lines]
+
+
+class TokenStore:
+    def __init__(self, store_dir: str) -> None:
+        """Formulas of a dataset, tokenized and numericalized once, with the vocabulary used to do so.
+        When formulas are appended to the formulas file, update only processes the new ones:
+        their tokens are appended to tokens.bin, and new tokens get new ids after the existing ones.
+        The samples of the annotations file (formula line and image name) are also stored, so that
+        only the appended ones are read.
+
+        Files of store_dir:
+            tokens.bin: token ids of all the formulas, one after the other (uint16)
+            offsets.bin: start of each formula in tokens.bin, plus the end of the last one (int64)
+            sample_lines.bin, sample_names.bin: formula line (int64) and image name of each sample
+            vocab.json: the (append only) vocabulary
+            state.json: number of formulas and samples, and position (bytes) in the formulas
+                and annotations files of the next formula and sample
+        """
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        vocab_path = os.path.join(store_dir, VOCAB_FILE)
+        self.vocab = Vocabulary.load(vocab_path) if os.path.exists(vocab_path) else Vocabulary()
+        state_path = os.path.join(store_dir, STATE_FILE)
+        self.state = dict(EMPTY_STATE)
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                # (stores created before the samples were tracked have no samples yet)
+                self.state.update(json.load(f))
+        self._load_arrays()
+        self._load_samples()
+
+    def _load_arrays(self) -> None:
+        tokens_path = os.path.join(self.store_dir, TOKENS_FILE)
+        offsets_path = os.path.join(self.store_dir, OFFSETS_FILE)
+        nb_offsets = self.state["nb_formulas"] + 1
+        if self.state["nb_formulas"] == 0:
+            self.offsets = np.zeros(1, dtype=OFFSET_DTYPE)
+            self.tokens = np.zeros(0, dtype=TOKEN_DTYPE)
+            return
+        # the files can be longer than the state if an update was interrupted
+        self.offsets = np.memmap(offsets_path, dtype=OFFSET_DTYPE, mode="r", shape=(nb_offsets,))
+        nb_tokens = int(self.offsets[-1])
+        self.tokens = np.memmap(tokens_path, dtype=TOKEN_DTYPE, mode="r", shape=(nb_tokens,)) \
+            if nb_tokens else np.zeros(0, dtype=TOKEN_DTYPE)
+
+    def _load_samples(self) -> None:
+        nb_samples = self.state["nb_samples"]
+        if nb_samples == 0:
+            self.formula_lines = np.zeros(0, dtype=OFFSET_DTYPE)
+            self.image_names = np.zeros(0, dtype=NAME_DTYPE)
+            return
+        self.formula_lines = np.memmap(os.path.join(self.store_dir, SAMPLE_LINES_FILE), dtype=OFFSET_DTYPE,
+                                       mode="r", shape=(nb_samples,))
+        self.image_names = np.memmap(os.path.join(self.store_dir, SAMPLE_NAMES_FILE), dtype=NAME_DTYPE,
+                                     mode="r", shape=(nb_samples,))
+
+    def __len__(self) -> int:
+        """Number of formulas in the store"""
+        return self.state["nb_formulas"]
+
+    @property
+    def nb_samples(self) -> int:
+        return self.state["nb_samples"]
+
+    def get_token_ids(self, line: int) -> np.ndarray:
+        """Token ids of the formula of the given line (starting at 1) of the formulas file"""
+        return np.asarray(self.tokens[self.offsets[line - 1]:self.offsets[line]])
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Number of tokens (without <SOS> and <EOS>) of each formula"""
+        return np.diff(self.offsets)
+
+    def update(self, formulas_file: str, annotations_file: str = None) -> int:
+        """Adds the formulas appended to formulas_file since the last update, returns their number.
+        Only complete lines (ending with a new line) are read.
+
+        Args:
+            annotations_file (str, optional): the samples appended to it are also added (those whose
+                formula is not stored yet are added at the next update)
+        """
+        formulas, sizes = read_new_lines(formulas_file, self.state["formulas_file_position"])
+        state = dict(self.state, nb_formulas=self.state["nb_formulas"] + len(formulas),
+                     formulas_file_position=self.state["formulas_file_position"] + sum(sizes))
+        if formulas:
+            self._append_formulas(formulas)
+        if annotations_file is not None:
+            nb_samples, nb_bytes = self._append_samples(annotations_file, state["nb_formulas"])
+            state["nb_samples"] += nb_samples
+            state["annotations_file_position"] += nb_bytes
+
+        # the state is written last: until then, the previous state is still valid
+        if state != self.state:
+            self.vocab.save(os.path.join(self.store_dir, VOCAB_FILE))
+            self._save_state(state)
+        return len(formulas)
+
+    def _append_formulas(self, formulas: List[str]) -> None:
+        self.vocab.update(formulas)
+        token_ids = [[self.vocab.word_to_idx[token] for token in self.vocab.basic_tokenize(formula)]
+                     for formula in formulas]
+        lengths = np.array([len(ids) for ids in token_ids], dtype=OFFSET_DTYPE)
+        new_offsets = self.offsets[-1] + np.cumsum(lengths)
+        nb_tokens = int(self.offsets[-1])
+        nb_offsets = self.state["nb_formulas"] + 1
+        with open(os.path.join(self.store_dir, TOKENS_FILE), "ab") as f:
+            # drop what an interrupted update may have written
+            f.truncate(nb_tokens * np.dtype(TOKEN_DTYPE).itemsize)
+            np.fromiter((i for ids in token_ids for i in ids), dtype=TOKEN_DTYPE).tofile(f)
+        with open(os.path.join(self.store_dir, OFFSETS_FILE), "ab") as f:
+            if nb_offsets == 1:
+                f.truncate(0)
+                # start of the first formula
+                self.offsets.tofile(f)
+            else:
+                f.truncate(nb_offsets * np.dtype(OFFSET_DTYPE).itemsize)
+            new_offsets.astype(OFFSET_DTYPE).tofile(f)
+
+    def _append_samples(self, annotations_file: str, nb_formulas: int) -> Tuple[int, int]:
+        """Appends the new samples of annotations_file, returns their number and size (bytes)"""
+        lines, sizes = read_new_lines(annotations_file, self.state["annotations_file_position"])
+        formula_lines, image_names, nb_bytes = [], [], 0
+        for line, size in zip(lines, sizes):
+            if line.strip():
+                formula_line, image_name = line.split()[:2]
+                # generate.py writes the image name before the formula
+                if int(formula_line) > nb_formulas:
+                    break
+                if len(image_name) > NAME_DTYPE.itemsize:
+                    raise ValueError(f"Image name {image_name} is longer than {NAME_DTYPE.itemsize} characters")
+                formula_lines.append(int(formula_line))
+                image_names.append(image_name.encode("ascii"))
+            nb_bytes += size
+        nb_samples = self.state["nb_samples"]
+        for filename, values, dtype in ((SAMPLE_LINES_FILE, formula_lines, OFFSET_DTYPE),
+                                        (SAMPLE_NAMES_FILE, image_names, NAME_DTYPE)):
+            with open(os.path.join(self.store_dir, filename), "ab") as f:
+                f.truncate(nb_samples * np.dtype(dtype).itemsize)
+                np.array(values, dtype=dtype).tofile(f)
+        return len(formula_lines), nb_bytes
+
+    def reset(self) -> None:
+        """Forgets the tokenized formulas and the samples, when the formulas and annotations files
+        were rewritten (e.g. by dedup.py). The vocabulary is kept, so the ids of the tokens do not change."""
+        self._save_state(dict(EMPTY_STATE))
+
+    def _save_state(self, state: dict) -> None:
+        self.state = state
+        with open(os.path.join(self.store_dir, STATE_FILE + ".tmp"), "w") as f:
+            json.dump(self.state, f)
+        os.replace(os.path.join(self.store_dir, STATE_FILE + ".tmp"), os.path.join(self.store_dir, STATE_FILE))
+        self._load_arrays()
+        self._load_samples()
+
+
+@click.command()
+@click.option("--data_dir", default="data", help="Folder containing circuitikz_code.lst and circuit2latex.lst")
+@click.option("--store_dir", default=None, help="Folder of the token store (data_dir/token_store by default)")
+def main(data_dir: str, store_dir: str) -> None:
+    """Tokenizes the formulas (and reads the samples) added to the dataset since the last update"""
+    store = TokenStore(store_dir or os.path.join(data_dir, "token_store"))
+    nb_new = store.update(os.path.join(data_dir, "circuitikz_code.lst"), os.path.join(data_dir, "circuit2latex.lst"))
+    click.echo(f"Added {nb_new} formulas ({len(store)} in total, {store.nb_samples} samples, "
+               f"vocabulary version {store.vocab.version}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,18 @@
 import os
-import pandas as pd
+from typing import Iterator, List, Sequence, Tuple
+import numpy as np
+import torch
 from torchvision.io import read_image
 import torchvision.transforms as T
 import torch.nn.functional as F
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, Sampler
 
 from scripts.preprocessing.preprocess_formulas import Vocabulary
+from scripts.preprocessing.token_store import TokenStore
+from scripts.utils.image_cache import SharedImageCache
 
 
 class CustomCircuitDataset(Dataset):
-    LINE_INDEX = 0
-    IMG_NAMES_INDEX = 1
-
     def __init__(
         self,
         annotations_file: str,
@@ -19,41 +20,180 @@ class CustomCircuitDataset(Dataset):
         img_dir: str,
         transform=T.Lambda(lambda t: t / 255),  # normalize the image to [0, 1]
         target_transform=None,
+        pad_to_max_length: bool = True,
+        cache_bytes: int = 0,
+        image_shape: Tuple[int, ...] = (1, 350, 350),
+        token_store: TokenStore = None,
     ):
-        # read formula line, image name and version
-        self.circuit_data = pd.read_csv(annotations_file, sep=" ", header=None)
-        self.formulas = pd.read_csv(
-            formulas_file, sep="#", header=None
-        )  # delimiter character # is not in the dataset
+        """
+        Args:
+            pad_to_max_length (bool): if True, all formulas are padded to the longest formula of the dataset.
+                Otherwise they are returned unpadded, to be padded per batch by PadCollate.
+            cache_bytes (int): if > 0, memory budget of a cache of the decoded images shared by
+                all the DataLoader workers (see SharedImageCache)
+            image_shape (Tuple[int, ...]): shape of the cached images
+            token_store (TokenStore, optional): formulas already tokenized and samples already read (kept
+                up to date with TokenStore.update(formulas_file, annotations_file)), the formulas and
+                annotations files are then not read
+        """
+        # formula line and image name of each example, in numpy arrays rather than python objects,
+        # so that the DataLoader workers (forked) do not copy them when reading them
+        if token_store is None:
+            with open(annotations_file, "r") as f:
+                samples = [line.split() for line in f if line.strip()]
+            self.formula_lines = np.array([int(s[0]) for s in samples], dtype=np.int64)
+            self.image_names = np.array([s[1].encode("ascii") for s in samples], dtype=np.bytes_)
+        else:
+            self.formula_lines, self.image_names = token_store.formula_lines, token_store.image_names
+        self.token_store = token_store
+        if token_store is None:
+            # all formulas in one byte buffer, formula i is blob[offsets[i]:offsets[i + 1]]
+            with open(formulas_file, "r", encoding="utf-8") as f:
+                formulas = f.read().splitlines()
+            encoded_formulas = [formula.encode("utf-8") for formula in formulas]
+            self.formulas_blob = np.frombuffer(b"".join(encoded_formulas), dtype=np.uint8)
+            self.formulas_offsets = np.zeros(len(formulas) + 1, dtype=np.int64)
+            np.cumsum([len(formula) for formula in encoded_formulas], out=self.formulas_offsets[1:])
         self.img_dir = img_dir
         self.transform = transform
         self.target_transform = target_transform
         # create vocabulary
-        self.vocab = Vocabulary()
-        self.vocab.build_vocaulary(formulas_file)
+        if token_store is None:
+            self.vocab = Vocabulary()
+            self.vocab.build_vocaulary(formulas_file)
+        else:
+            self.vocab = token_store.vocab
+        self.pad_to_max_length = pad_to_max_length
+        self.image_cache = SharedImageCache(len(self), cache_bytes, image_shape) if cache_bytes > 0 else None
+
+    def get_formula(self, line: int) -> str:
+        """Returns the formula of the given line (starting at 1) of the formulas file"""
+        start, end = self.formulas_offsets[line - 1], self.formulas_offsets[line]
+        return self.formulas_blob[start:end].tobytes().decode("utf-8")
+
+    @property
+    def formula_lengths(self) -> np.ndarray:
+        """Number of tokens (including <SOS> and <EOS>) of the formula of each example"""
+        if not hasattr(self, "_formula_lengths") and self.token_store is not None:
+            self._formula_lengths = self.token_store.lengths[self.formula_lines - 1] + 2
+        elif not hasattr(self, "_formula_lengths"):
+            lengths_per_line = np.array(
+                [len(self.vocab.basic_tokenize(self.get_formula(line)))
+                 for line in range(1, len(self.formulas_offsets))], dtype=np.int64
+            ) + 2
+            self._formula_lengths = lengths_per_line[self.formula_lines - 1]
+        return self._formula_lengths
 
     def __len__(self):
         """Returns the number of examples in the dataset."""
-        return len(self.circuit_data)
+        return len(self.formula_lines)
+
+    def read_image(self, idx: int) -> torch.Tensor:
+        """Returns the decoded (uint8) image of an example, from the cache if possible"""
+        if self.image_cache is not None:
+            image = self.image_cache.get(idx)
+            if image is not None:
+                return image
+        img_path = os.path.join(self.img_dir, self.image_names[idx].decode("ascii") + ".jpg")
+        image = read_image(img_path)  # images are already in grey scale (1 channel)
+        if self.image_cache is not None:
+            self.image_cache.put(idx, image)
+        return image
 
     def __getitem__(self, idx):
         """Args:
         idx (int): Index of the example between 0 and nb_exambles - 1.
         """
-        img_path = (
-            os.path.join(
-                self.img_dir, self.circuit_data.iloc[idx, self.IMG_NAMES_INDEX]
-            )
-            + ".jpg"
-        )
-        image = read_image(img_path)  # images are already in grey scale (1 channel)
-        formula_line = self.circuit_data.iloc[idx, self.LINE_INDEX]
+        image = self.read_image(idx)
         # read circuit formula
-        formula_str = self.formulas.iloc[formula_line - 1, 0]
-        formula = self.vocab.preprocess_formula(formula_str)
+        if self.token_store is not None:
+            token_ids = torch.from_numpy(self.token_store.get_token_ids(self.formula_lines[idx]).astype(np.int64))
+            formula = self.vocab.preprocess_token_ids(token_ids, self.pad_to_max_length)
+        else:
+            formula_str = self.get_formula(self.formula_lines[idx])
+            formula = self.vocab.preprocess_formula(formula_str, self.pad_to_max_length)
         # apply possible transformations
         if self.transform:
             image = self.transform(image)
         if self.target_transform:
             formula = self.target_transform(formula)
         return image, formula
+
+
+class PadCollate:
+    def __init__(self, vocab: Vocabulary) -> None:
+        """Collate function padding the one hot encoded formulas of a batch
+        to the longest formula of that batch (instead of the longest of the dataset).
+        """
+        self.pad_vect = vocab.get_encoded_token("<PAD>")
+
+    def __call__(self, batch: List[Tuple[torch.Tensor, torch.Tensor]]) -> Tuple[torch.Tensor, torch.Tensor]:
+        images, formulas = zip(*batch)
+        max_length = max(len(f) for f in formulas)
+        padded_formulas = self.pad_vect.repeat(len(formulas), max_length, 1)
+        for i, formula in enumerate(formulas):
+            padded_formulas[i, : len(formula)] = formula
+        return torch.stack(images), padded_formulas
+
+
+class BucketBatchSampler(Sampler):
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        batch_size: int,
+        bucket_width: int = 10,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        seed: int = 0,
+        num_replicas: int = 1,
+        rank: int = 0,
+    ) -> None:
+        """Yields batches of indices of examples with similar formula lengths,
+        so that each batch is only padded to its own longest formula.
+
+        Args:
+            lengths (Sequence[int]): number of tokens of each example
+            batch_size (int): maximal number of examples per batch
+            bucket_width (int): examples whose lengths differ by less than bucket_width tokens
+                can end up in the same batch
+            shuffle (bool): shuffle the examples in each bucket, and the order of the batches
+            drop_last (bool): drop the last incomplete batch of each bucket
+            seed (int): random seed, must be the same for all processes when distributed
+            num_replicas (int): number of distributed processes, each one gets its own batches
+            rank (int): rank of the current process
+        """
+        self.buckets = {}
+        for idx, length in enumerate(lengths):
+            self.buckets.setdefault(int(length) // bucket_width, []).append(idx)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def set_epoch(self, epoch: int) -> None:
+        """Changes the shuffling at each epoch (same interface as DistributedSampler)"""
+        self.epoch = epoch
+
+    def _get_batches(self) -> List[List[int]]:
+        rng = np.random.default_rng(self.seed + self.epoch)
+        batches = []
+        for bucket in self.buckets.values():
+            indices = rng.permutation(bucket).tolist() if self.shuffle else bucket
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start : start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        # every process gets the same number of batches
+        nb_batches = len(batches) - len(batches) % self.num_replicas
+        return batches[self.rank : nb_batches : self.num_replicas]
+
+    def __iter__(self) -> Iterator[List[int]]:
+        return iter(self._get_batches())
+
+    def __len__(self) -> int:
+        return len(self._get_batches())
@@ -0,0 +1,49 @@
+import os
+from typing import Any, List, Tuple
+
+import torch.distributed as dist
+
+
+def init_distributed(backend: str = "gloo") -> Tuple[int, int]:
+    """Initializes the default process group from the environment variables
+       set by torchrun (RANK, WORLD_SIZE, MASTER_ADDR, MASTER_PORT).
+       gloo is used by default as it runs on CPU-only machines.
+
+    Returns:
+        Tuple[int, int]: rank of the current process and total number of processes
+    """
+    if "RANK" not in os.environ or "WORLD_SIZE" not in os.environ:
+        raise RuntimeError(
+            "Distributed training should be launched with torchrun, e.g. "
+            "`torchrun --nproc_per_node=4 train.py --distributed`"
+        )
+    dist.init_process_group(backend=backend)
+    return dist.get_rank(), dist.get_world_size()
+
+
+def cleanup_distributed() -> None:
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+
+def is_main_process() -> bool:
+    """Returns True if not distributed, or if this is the rank 0 process."""
+    return not (dist.is_available() and dist.is_initialized()) or dist.get_rank() == 0
+
+
+def get_local_rank() -> Tuple[int, int, int]:
+    """Returns the node index, the rank of the process on its node and the number of processes per node
+    (from the environment variables set by torchrun)."""
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    node = int(os.environ.get("GROUP_RANK", int(os.environ.get("RANK", 0)) // local_world_size))
+    return node, local_rank, local_world_size
+
+
+def all_gather(value: Any) -> List[Any]:
+    """Returns the value of every process (picklable values), or [value] if not distributed."""
+    if not (dist.is_available() and dist.is_initialized()):
+        return [value]
+    values = [None] * dist.get_world_size()
+    dist.all_gather_object(values, value)
+    return values
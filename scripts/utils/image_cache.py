@@ -0,0 +1,65 @@
+import multiprocessing
+from typing import Optional, Tuple
+
+import torch
+
+
+class SharedImageCache:
+    def __init__(self, nb_images: int, max_bytes: int, image_shape: Tuple[int, ...] = (1, 350, 350)) -> None:
+        """Decoded uint8 images kept in shared memory, so that all the DataLoader workers
+        (and all the epochs) reuse the images decoded once by any of them.
+        It holds max_bytes // image size images, the least recently used one is evicted when it is full.
+        Must be created before the workers are started.
+
+        Args:
+            nb_images (int): number of images of the dataset (indices are between 0 and nb_images - 1)
+            max_bytes (int): memory budget of the cached images
+            image_shape (Tuple[int, ...]): shape of the images, others are not cached
+        """
+        self.image_shape = tuple(image_shape)
+        image_bytes = max(1, int(torch.Size(self.image_shape).numel()))
+        self.nb_slots = min(nb_images, max_bytes // image_bytes)
+        self.images = torch.zeros((self.nb_slots, *self.image_shape), dtype=torch.uint8).share_memory_()
+        # slot of each image (-1 if it is not cached), and image of each slot (-1 if the slot is free)
+        self.slot_of_image = torch.full((nb_images,), -1, dtype=torch.int64).share_memory_()
+        self.image_of_slot = torch.full((max(self.nb_slots, 1),), -1, dtype=torch.int64).share_memory_()
+        # last access of each slot, for the LRU eviction
+        self.last_used = torch.zeros(max(self.nb_slots, 1), dtype=torch.int64).share_memory_()
+        self.clock = torch.zeros(1, dtype=torch.int64).share_memory_()
+        self.lock = multiprocessing.Lock()
+
+    def _touch(self, slot: int) -> None:
+        self.clock += 1
+        self.last_used[slot] = self.clock[0]
+
+    def get(self, idx: int) -> Optional[torch.Tensor]:
+        """Returns a copy of the cached image, or None"""
+        with self.lock:
+            slot = int(self.slot_of_image[idx])
+            if slot < 0:
+                return None
+            self._touch(slot)
+            # copied while locked, so that the slot cannot be overwritten meanwhile
+            return self.images[slot].clone()
+
+    def put(self, idx: int, image: torch.Tensor) -> None:
+        if self.nb_slots == 0 or tuple(image.shape) != self.image_shape or image.dtype != torch.uint8:
+            return
+        with self.lock:
+            if self.slot_of_image[idx] >= 0:
+                return
+            free_slots = torch.nonzero(self.image_of_slot < 0)
+            if len(free_slots):
+                slot = int(free_slots[0])
+            else:
+                # evict the least recently used image
+                slot = int(torch.argmin(self.last_used))
+                self.slot_of_image[self.image_of_slot[slot]] = -1
+            self.images[slot] = image
+            self.image_of_slot[slot] = idx
+            self.slot_of_image[idx] = slot
+            self._touch(slot)
+
+    def __len__(self) -> int:
+        """Number of cached images"""
+        return int((self.image_of_slot >= 0).sum())
@@ -15,7 +15,6 @@ def read_image(img: str) -> np.ndarray:
 def pad_image(img: np.ndarray, output_size: Tuple[int, int] = (1000, 1000)) -> np.ndarray:
     """Reads and pads an image with white pixels to a given size.
         Image should be smaller than the desired output size.
-        Not used anymore.
     """
     assert img.shape[0] <= output_size[0] and img.shape[1] <= output_size[1], \
         f"Image should be smaller than {output_size}, but is {tuple(img.shape[:2])}"
@@ -50,10 +49,51 @@ def pad_to_square(img: np.ndarray, border: int = 50) -> np.ndarray:
     return new_img
 
 
+def fit_to_square(img: np.ndarray, size: int, border: int = 0) -> np.ndarray:
+    """ Centers the image on a white square of the given size.
+        Images that do not fit with a border of at least border pixels are
+        padded to a square with this border and resized instead.
+    """
+    height, width = img.shape[:2]
+    if max(height, width) + 2 * border > size:
+        return resize_image(pad_to_square(img, border), (size, size))
+    return pad_image(img, (size, size))
+
+
+def crop_to_content(img: np.ndarray, threshold: int = 200) -> np.ndarray:
+    """ Removes the white rows and columns around the drawing (pixels darker than threshold).
+        The threshold is low enough to ignore jpeg compression noise.
+    """
+    rows = np.flatnonzero((img < threshold).any(axis=1))
+    cols = np.flatnonzero((img < threshold).any(axis=0))
+    if not len(rows):
+        return img
+    return img[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+
 def resize_image(img: np.ndarray, res_size=(256, 256)) -> np.ndarray:
     return cv2.resize(img, res_size, interpolation=cv2.INTER_LANCZOS4)
 
 
+def ink_similarity(img_a: np.ndarray, img_b: np.ndarray, threshold: int = 128, tolerance: int = 2) -> float:
+    """ Compares the drawings (dark pixels) of two greyscale images of the same size.
+        Returns the F1 score between 0 and 1 of the ink pixels of each image that are
+        less than tolerance pixels away from ink pixels of the other image.
+    """
+    assert img_a.shape == img_b.shape, f"Images have different shapes {img_a.shape} and {img_b.shape}"
+    ink_a = (img_a < threshold).astype(np.uint8)
+    ink_b = (img_b < threshold).astype(np.uint8)
+    if not ink_a.any() and not ink_b.any():
+        return 1.
+    kernel = np.ones((2 * tolerance + 1, 2 * tolerance + 1), np.uint8)
+    # ink of a close to ink of b, and the opposite
+    precision = (ink_a & cv2.dilate(ink_b, kernel)).sum() / max(ink_a.sum(), 1)
+    recall = (ink_b & cv2.dilate(ink_a, kernel)).sum() / max(ink_b.sum(), 1)
+    if precision + recall == 0:
+        return 0.
+    return float(2 * precision * recall / (precision + recall))
+
+
 def show_image(img: np.ndarray, title: str = "Image") -> None:
     cv2.imshow(title, img)
     cv2.waitKey(0)
@@ -63,6 +103,14 @@ def save_image(img: np.ndarray, output_path: str) -> None:
     cv2.imwrite(output_path, img)
 
 
+def encode_image(img: np.ndarray) -> bytes:
+    """Returns the bytes of the image saved as a .jpg (same encoding as save_image)"""
+    success, buffer = cv2.imencode(".jpg", img)
+    if not success:
+        raise ValueError("The image could not be encoded")
+    return buffer.tobytes()
+
+
 if __name__ == '__main__':
     img_path = r"..\..\data\file-0-001.jpg"
     img = pad_to_square(read_image(img_path))
@@ -0,0 +1,67 @@
+import cProfile
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, TypeVar
+
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function, schedule
+
+T = TypeVar("T")
+
+
+def get_training_profiler(output_dir: str, nb_steps: int = 5, nb_wait: int = 1, nb_warmup: int = 1,
+                          rank: int = 0) -> profile:
+    """torch.profiler recording nb_steps training steps, after nb_wait skipped and nb_warmup warmup steps
+    (call .step() after each step). The trace is saved in output_dir, in the Chrome trace format
+    (open it in chrome://tracing or https://ui.perfetto.dev), with a summary table of the operators.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    def save_trace(prof: profile) -> None:
+        name = f"train_rank{rank}_step{prof.step_num}"
+        prof.export_chrome_trace(os.path.join(output_dir, f"{name}.json"))
+        with open(os.path.join(output_dir, f"{name}.txt"), "w") as f:
+            f.write(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=30))
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    return profile(
+        activities=activities,
+        schedule=schedule(wait=nb_wait, warmup=nb_warmup, active=nb_steps, repeat=1),
+        on_trace_ready=save_trace,
+        record_shapes=True,
+    )
+
+
+def iter_with_label(iterable: Iterable[T], label: str) -> Iterator[T]:
+    """Iterates over iterable, labelling the time spent waiting for each item in the profiler traces
+    (e.g. the time spent waiting for the DataLoader)"""
+    iterator = iter(iterable)
+    while True:
+        with record_function(label):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+@contextmanager
+def cprofile(output_dir: str, name: str, nb_lines: int = 25) -> Iterator[cProfile.Profile]:
+    """Profiles the code run in the context (main thread only) with cProfile, saves the statistics
+    in output_dir as a .pstats file (open it with python -m pstats or snakeviz) and prints the slowest functions.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}.pstats")
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(nb_lines)
+        print(f"Profile saved to {path}")
@@ -0,0 +1,208 @@
+import io
+import json
+import os
+import tarfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from torchvision.io import decode_image
+import torchvision.transforms as T
+
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+
+SHARD_INDEX_FILE = "index.json"
+# extensions of the files of one sample in a shard
+IMAGE_EXTENSION = "jpg"
+FORMULA_EXTENSION = "tex"
+METADATA_EXTENSION = "json"
+
+
+def read_shard_index(shards_dir: str) -> List[Dict]:
+    """Returns the list of the shards of a folder: {"name", "nb_samples", "nb_bytes"}"""
+    index_path = os.path.join(shards_dir, SHARD_INDEX_FILE)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, "r") as f:
+        return json.load(f)["shards"]
+
+
+class ShardWriter:
+    def __init__(self, shards_dir: str, max_samples: int = 10000, max_bytes: int = 2**30) -> None:
+        """Writes samples into tar files of at most max_samples samples (and about max_bytes bytes),
+        rather than one file per image. Each sample is stored as 3 consecutive files sharing its name:
+        the .jpg image, the .tex circuitikz code and a .json of metadata.
+        The shards are listed in index.json, new shards are added to the ones already in shards_dir.
+        """
+        self.shards_dir = shards_dir
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        os.makedirs(shards_dir, exist_ok=True)
+        self.shards = read_shard_index(shards_dir)
+        self.tar: Optional[tarfile.TarFile] = None
+        self.nb_samples = 0
+
+    def _open_shard(self) -> None:
+        self.shard_name = f"shard-{len(self.shards):06d}.tar"
+        self.tar = tarfile.open(os.path.join(self.shards_dir, self.shard_name), "w")
+        self.nb_samples = 0
+
+    def _close_shard(self) -> None:
+        self.tar.close()
+        self.tar = None
+        nb_bytes = os.path.getsize(os.path.join(self.shards_dir, self.shard_name))
+        self.shards.append({"name": self.shard_name, "nb_samples": self.nb_samples, "nb_bytes": nb_bytes})
+        # the index only lists complete shards
+        with open(os.path.join(self.shards_dir, SHARD_INDEX_FILE + ".tmp"), "w") as f:
+            json.dump({"shards": self.shards}, f, indent=1)
+        os.replace(os.path.join(self.shards_dir, SHARD_INDEX_FILE + ".tmp"),
+                   os.path.join(self.shards_dir, SHARD_INDEX_FILE))
+
+    def _add_file(self, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def write(self, name: str, image: bytes, formula: str, metadata: Dict = None) -> None:
+        """Adds a sample (its encoded image, its circuitikz code and its metadata) to the current shard"""
+        if self.tar is None:
+            self._open_shard()
+        self._add_file(f"{name}.{IMAGE_EXTENSION}", image)
+        self._add_file(f"{name}.{FORMULA_EXTENSION}", formula.encode("utf-8"))
+        self._add_file(f"{name}.{METADATA_EXTENSION}", json.dumps(metadata or {}).encode("utf-8"))
+        self.nb_samples += 1
+        if self.nb_samples >= self.max_samples or self.tar.fileobj.tell() >= self.max_bytes:
+            self._close_shard()
+
+    def close(self) -> None:
+        if self.tar is not None:
+            self._close_shard()
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def iter_shard(path: str) -> Iterator[Tuple[str, Dict[str, bytes]]]:
+    """Reads a shard sequentially, yields the name of each sample and its files {extension: bytes}"""
+    current_name, files = None, {}
+    # streaming mode: one sequential read of the whole file
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            name, extension = member.name.rsplit(".", 1)
+            if name != current_name:
+                if files:
+                    yield current_name, files
+                current_name, files = name, {}
+            files[extension] = tar.extractfile(member).read()
+    if files:
+        yield current_name, files
+
+
+class ShardedCircuitDataset(IterableDataset):
+    def __init__(
+        self,
+        shards_dir: str,
+        vocab: Vocabulary,
+        transform=T.Lambda(lambda t: t / 255),  # normalize the image to [0, 1]
+        target_transform=None,
+        pad_to_max_length: bool = True,
+        shuffle: bool = True,
+        shuffle_buffer: int = 1000,
+        seed: int = 0,
+        num_replicas: int = 1,
+        rank: int = 0,
+    ) -> None:
+        """Same examples as CustomCircuitDataset, read sequentially from the shards written by ShardWriter.
+        The samples are split between the distributed processes, which all get the same number of samples
+        (shards do not all have the same size), then between the DataLoader workers.
+
+        Args:
+            vocab (Vocabulary): vocabulary built from the formulas of the dataset
+            shuffle (bool): shuffle the order of the shards, and the samples in a buffer of shuffle_buffer samples
+            seed (int): random seed, must be the same for all processes when distributed
+            num_replicas (int): number of distributed processes
+            rank (int): rank of the current process
+        """
+        self.shards_dir = shards_dir
+        self.shards = read_shard_index(shards_dir)
+        self.vocab = vocab
+        self.transform = transform
+        self.target_transform = target_transform
+        self.pad_to_max_length = pad_to_max_length
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def set_epoch(self, epoch: int) -> None:
+        """Changes the shuffling at each epoch (same interface as DistributedSampler)"""
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        """Number of examples read by this process (the last total % num_replicas examples are dropped)"""
+        return sum(shard["nb_samples"] for shard in self.shards) // self.num_replicas
+
+    def _get_ranges(self) -> List[Tuple[str, int, int]]:
+        """Returns the (shard, first sample, end sample) read by this process and worker.
+        The shards are put one after the other (in a random order when shuffling), and each process
+        reads the samples of a contiguous part of the same size, so that all run the same number of steps.
+        """
+        rng = np.random.default_rng(self.seed + self.epoch)
+        shards = list(self.shards)
+        if self.shuffle:
+            shards = [shards[i] for i in rng.permutation(len(shards))]
+        start, end = self.rank * len(self), (self.rank + 1) * len(self)
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            nb_samples = end - start
+            start, end = (start + nb_samples * worker_info.id // worker_info.num_workers,
+                          start + nb_samples * (worker_info.id + 1) // worker_info.num_workers)
+        ranges = []
+        shard_start = 0
+        for shard in shards:
+            shard_end = shard_start + shard["nb_samples"]
+            if shard_start < end and start < shard_end:
+                ranges.append((shard["name"], max(start, shard_start) - shard_start, min(end, shard_end) - shard_start))
+            shard_start = shard_end
+        return ranges
+
+    def _decode(self, files: Dict[str, bytes]) -> Tuple[torch.Tensor, torch.Tensor]:
+        image = decode_image(torch.frombuffer(bytearray(files[IMAGE_EXTENSION]), dtype=torch.uint8))
+        formula = self.vocab.preprocess_formula(files[FORMULA_EXTENSION].decode("utf-8"), self.pad_to_max_length)
+        if self.transform:
+            image = self.transform(image)
+        if self.target_transform:
+            formula = self.target_transform(formula)
+        return image, formula
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        worker_info = get_worker_info()
+        worker_id = worker_info.id if worker_info is not None else 0
+        rng = np.random.default_rng([self.seed, self.epoch, self.rank, worker_id])
+        buffer = []
+        for shard, first, end in self._get_ranges():
+            for i, (_, files) in enumerate(iter_shard(os.path.join(self.shards_dir, shard))):
+                # samples of the other processes are read, but not decoded
+                if i < first:
+                    continue
+                if i >= end:
+                    break
+                if not self.shuffle:
+                    yield self._decode(files)
+                    continue
+                # yield a random sample of the buffer once it is full
+                buffer.append(files)
+                if len(buffer) >= self.shuffle_buffer:
+                    i = rng.integers(len(buffer))
+                    buffer[i], buffer[-1] = buffer[-1], buffer[i]
+                    yield self._decode(buffer.pop())
+        for i in rng.permutation(len(buffer)):
+            yield self._decode(buffer[i])
@@ -1,5 +1,7 @@
+import asyncio
 import hashlib
 import os
+from typing import List
 from dotenv import load_dotenv
 from subprocess import call, DEVNULL
 
@@ -12,6 +14,9 @@ BEFORE_LATEX = r"""\documentclass[convert={density=100}]{standalone}
 \begin{circuitikz}"""
 AFTER_LATEX = r"""\end{circuitikz}
 \end{document}"""
+GHOSTSCRIPT_BINARY = "gswin64c"
+# resolution (dpi) of the images when none is given
+DEFAULT_RESOLUTION = 200
 
 
 def load_env_var():
@@ -52,13 +57,11 @@ def segment_list_to_latex(segments_list) -> str:
 
     Returns:
         A string representing circuitikz instructions"""
-    circuitikz_str = ""
-    for s in segments_list:
-        circuitikz_str += f"\\draw {s.from_pos} to[{s.type}"
-        if s.label:
-            circuitikz_str += f", l={s.label}"
-        circuitikz_str += f"] {s.to_pos}; "
-    return circuitikz_str
+    # sets of segments have no order: sort them so that a circuit always gets the same code (and image name)
+    segments_list = sorted(segments_list, key=lambda s: (s.from_pos, s.to_pos, s.type or "", s.label or ""))
+    # joined once, as repeated += copies the whole string for each segment
+    return "".join(f"\\draw {s.from_pos} to[{s.type}{f', l={s.label}' if s.label else ''}] {s.to_pos}; "
+                   for s in segments_list)
 
 
 def save_to_latex(latex_string: str,  save_path: str = "data", filename: str = "file") -> None:
@@ -67,17 +70,69 @@ def save_to_latex(latex_string: str,  save_path: str = "data", filename: str = "
         f.write(latex_string)
 
 
-def latex_to_jpg(latex_filename: str, latex_path: str, ghostscript_path: str, save_path: str = "data",) -> None:
+def get_binary_path(binaries_dir: str, name: str) -> str:
+    """Path of a LaTeX or Ghostscript binary. Quotes used in the .env file for shell commands are removed."""
+    return os.path.join(binaries_dir.replace('"', ''), name)
+
+
+def get_latex_command(tex_file_path: str, latex_path: str, save_path: str) -> List[str]:
+    """Arguments of the command creating a pdf from the latex file"""
+    return [get_binary_path(latex_path, "latex"), f"{tex_file_path}.tex", "-output-format=pdf",
+            "--interaction=batchmode", f"--output-directory={save_path}", f"--aux-directory={save_path}"]
+
+
+def get_ghostscript_command(tex_file_path: str, ghostscript_path: str, resolution: float = None) -> List[str]:
+    """Arguments of the command converting the pdf into a jpg image
+
+    Args:
+        resolution (float): dpi of the image, DEFAULT_RESOLUTION if None. Images rasterized at a given
+            resolution are not downsized afterwards, so their lines and text are anti-aliased by Ghostscript.
+    """
+    command = [get_binary_path(ghostscript_path, GHOSTSCRIPT_BINARY), "-dNOPAUSE", "-sDEVICE=jpeg"]
+    if resolution is None:
+        command.append(f"-r{DEFAULT_RESOLUTION}")
+    else:
+        command += [f"-r{resolution:.2f}", "-dGraphicsAlphaBits=4", "-dTextAlphaBits=4"]
+    return command + ["-dJPEGQ=60", f"-sOutputFile={tex_file_path}.jpg", f"{tex_file_path}.pdf", "-dBATCH", "-dQUIET"]
+
+
+def remove_latex_files(tex_file_path: str) -> None:
+    """Deletes the files created to compile an image (except the image)"""
+    for extension in ("tex", "aux", "log", "pdf"):
+        if os.path.exists(f"{tex_file_path}.{extension}"):
+            os.remove(f"{tex_file_path}.{extension}")
+
+
+def latex_to_jpg(latex_filename: str, latex_path: str, ghostscript_path: str, save_path: str = "data",
+                 resolution: float = None) -> None:
     tex_file_path = os.path.join(save_path, latex_filename)
     # create a pdf from the latex file
-    os.system(os.path.join(latex_path, "latex") +
-              f" {tex_file_path}.tex -output-format=pdf --interaction=batchmode --output-directory={save_path} --aux-directory={save_path}")
+    call(get_latex_command(tex_file_path, latex_path, save_path), stdout=DEVNULL)
     # convert them into images
-    call(os.path.join(ghostscript_path, "gswin64c") +
-         f" -dNOPAUSE -sDEVICE=jpeg -r200 -dJPEGQ=60 -sOutputFile={tex_file_path}.jpg {tex_file_path}.pdf -dBATCH -dQUIET", stdout=DEVNULL)
+    call(get_ghostscript_command(tex_file_path, ghostscript_path, resolution), stdout=DEVNULL)
     # delete unneeded files
-    for extension in ("tex", "aux", "log", "pdf"):
-        os.remove(f"{tex_file_path}.{extension}")
+    remove_latex_files(tex_file_path)
+
+
+async def async_latex_to_pdf(latex_filename: str, latex_path: str, save_path: str = "data") -> bool:
+    """Same as the first step of latex_to_jpg, without blocking the event loop.
+    Returns True if the pdf was created."""
+    tex_file_path = os.path.join(save_path, latex_filename)
+    process = await asyncio.create_subprocess_exec(
+        *get_latex_command(tex_file_path, latex_path, save_path), stdout=DEVNULL, stderr=DEVNULL)
+    await process.wait()
+    return os.path.exists(f"{tex_file_path}.pdf")
+
+
+async def async_pdf_to_jpg(latex_filename: str, ghostscript_path: str, save_path: str = "data",
+                           resolution: float = None) -> bool:
+    """Same as the second step of latex_to_jpg, without blocking the event loop.
+    Returns True if the image was created."""
+    tex_file_path = os.path.join(save_path, latex_filename)
+    process = await asyncio.create_subprocess_exec(
+        *get_ghostscript_command(tex_file_path, ghostscript_path, resolution), stdout=DEVNULL, stderr=DEVNULL)
+    await process.wait()
+    return os.path.exists(f"{tex_file_path}.jpg")
 
 
 def get_image_name(circuit_latex_string: str) -> str:
@@ -97,6 +152,12 @@ def create_file_if_not_exists(path: str) -> None:
             pass
 
 
+def count_lines(path: str, chunk_size: int = 1 << 20) -> int:
+    """Returns the number of lines of a file, reading it by large chunks"""
+    with open(path, "rb") as f:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(chunk_size), b""))
+
+
 if __name__ == '__main__':
     # simple test
     import random as rd
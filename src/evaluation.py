@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import scripts.utils.image_utils as iu
+import scripts.utils.utils as ut
+from scripts.data_generation.dedup import parse_circuit
+from scripts.data_generation.native_renderer import NativeRenderer, get_latex_layout
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+
+RENDERERS = ("latex", "native")
+IMAGE_SIZE = 350
+# marks the predictions which could not be rendered, so that they are not compiled again
+FAILED_EXTENSION = "failed"
+
+
+def read_samples(data_dir: str, images_folder: str = "circuit_images",
+                 max_samples: int = None) -> List[Tuple[str, str]]:
+    """Returns the (image path, formula) of the samples of a data folder created by generate.py"""
+    with open(os.path.join(data_dir, "circuitikz_code.lst"), "r") as f:
+        formulas = f.read().splitlines()
+    samples = []
+    with open(os.path.join(data_dir, "circuit2latex.lst"), "r") as f:
+        for line in f:
+            if max_samples is not None and len(samples) >= max_samples:
+                break
+            if not line.strip():
+                continue
+            line_number, filename = line.split()[:2]
+            samples.append((os.path.join(data_dir, images_folder, f"{filename}.jpg"),
+                            formulas[int(line_number) - 1]))
+    return samples
+
+
+def compare_tokens(predicted_tokens: Sequence[str], true_tokens: Sequence[str]) -> int:
+    """Number of positions where the predicted token is the true one (the <EOS> position included)"""
+    predicted = list(predicted_tokens) + ["<EOS>"]
+    true = list(true_tokens) + ["<EOS>"]
+    return sum(p == t for p, t in zip(predicted, true))
+
+
+class PredictionRenderer:
+    def __init__(self, cache_dir: str, renderer: str = "latex", latex_path: str = None,
+                 ghostscript_path: str = None, image_size: int = IMAGE_SIZE) -> None:
+        """Renders predicted circuitikz code like generate.py does, keeping the images in a subfolder
+        of cache_dir per renderer and image size (named by get_image_name), so that a prediction is only
+        rendered once across evaluations.
+
+        Args:
+            renderer (str): "latex" (latex_to_jpg) or "native" (NativeRenderer, no LaTeX needed)
+            latex_path, ghostscript_path (str): binaries of the latex renderer
+        """
+        if renderer not in RENDERERS:
+            raise ValueError(f"Unknown renderer {renderer}, choose one of {RENDERERS}")
+        # the images (and failures) of a renderer are not valid for the other one
+        self.cache_dir = os.path.join(cache_dir, f"{renderer}-{image_size}")
+        self.renderer = renderer
+        self.latex_path = latex_path
+        self.ghostscript_path = ghostscript_path
+        self.image_size = image_size
+        self.native_renderer = NativeRenderer(image_size=image_size)
+        ut.create_dir_if_not_exists(self.cache_dir)
+
+    def _draw(self, latex_string: str, filename: str) -> Optional[np.ndarray]:
+        segments = parse_circuit(latex_string)
+        if self.renderer == "native":
+            return self.native_renderer.render(segments) if segments else None
+        # like generate.py (predictions that cannot be parsed are rasterized at the default resolution)
+        resolution, border = get_latex_layout(segments, self.image_size) if segments else (None, 50)
+        # each compilation in its own folder, as several run at the same time
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            ut.save_to_latex(ut.BEFORE_LATEX + latex_string + ut.AFTER_LATEX, tmp_dir, filename)
+            ut.latex_to_jpg(filename, self.latex_path, self.ghostscript_path, tmp_dir, resolution)
+            img_path = os.path.join(tmp_dir, f"{filename}.jpg")
+            if not os.path.exists(img_path):
+                return None
+            return iu.fit_to_square(iu.read_image(img_path), self.image_size, border)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def render(self, latex_string: str) -> Optional[np.ndarray]:
+        """Returns the image of the circuitikz code, or None if it cannot be rendered"""
+        filename = ut.get_image_name(latex_string)
+        img_path = os.path.join(self.cache_dir, f"{filename}.jpg")
+        failed_path = os.path.join(self.cache_dir, f"{filename}.{FAILED_EXTENSION}")
+        if os.path.exists(img_path):
+            return iu.read_image(img_path)
+        if os.path.exists(failed_path):
+            return None
+        img = self._draw(latex_string, filename)
+        if img is None:
+            open(failed_path, "w").close()
+        else:
+            iu.save_image(img, img_path)
+        return img
+
+    def render_all(self, latex_strings: Iterable[str], jobs: int = 4) -> Dict[str, Optional[np.ndarray]]:
+        """Renders the distinct strings in parallel (LaTeX and Ghostscript run in subprocesses,
+        and OpenCV releases the GIL, so threads are enough)"""
+        unique_strings = list(dict.fromkeys(latex_strings))
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return dict(zip(unique_strings, executor.map(self.render, unique_strings)))
+
+
+def evaluate(predictions: Sequence[str], samples: Sequence[Tuple[str, str]], renderer: PredictionRenderer,
+             vocab: Vocabulary = None, jobs: int = 4) -> Tuple[Dict[str, float], List[Dict]]:
+    """Compares predicted circuitikz code with the ground truth of each sample.
+
+    Args:
+        predictions: predicted code of each sample
+        samples: (image path, true code) of each sample
+        renderer: renders the predictions which are not exact matches
+        vocab: only used to tokenize the code
+        jobs (int): number of predictions rendered at the same time
+
+    Returns:
+        the metrics averaged over the samples: token accuracy (over all the tokens of the true formulas),
+        exact match rate, pixel similarity (ink_similarity, 0 when the prediction cannot be rendered)
+        and the proportion of predictions which cannot be rendered; and the metrics of each sample.
+    """
+    vocab = vocab or Vocabulary()
+    rows = []
+    for prediction, (img_path, formula) in zip(predictions, samples):
+        predicted_tokens, true_tokens = vocab.basic_tokenize(prediction), vocab.basic_tokenize(formula)
+        rows.append({
+            "image": img_path,
+            "prediction": prediction,
+            "nb_correct_tokens": compare_tokens(predicted_tokens, true_tokens),
+            "nb_tokens": len(true_tokens) + 1,
+            "exact_match": predicted_tokens == true_tokens,
+        })
+
+    # exact matches are not rendered: their image is the true one
+    images = renderer.render_all((row["prediction"] for row in rows if not row["exact_match"]), jobs)
+    for row in rows:
+        rendered = None if row["exact_match"] else images[row["prediction"]]
+        row["renderable"] = row["exact_match"] or rendered is not None
+        if row["exact_match"]:
+            row["pixel_similarity"] = 1.
+        elif rendered is None:
+            row["pixel_similarity"] = 0.
+        else:
+            true_img = iu.read_image(row["image"])
+            if rendered.shape != true_img.shape:
+                rendered = iu.resize_image(rendered, true_img.shape[::-1])
+            row["pixel_similarity"] = iu.ink_similarity(rendered, true_img)
+
+    nb_samples = max(len(rows), 1)
+    metrics = {
+        "nb_samples": len(rows),
+        "token_accuracy": sum(r["nb_correct_tokens"] for r in rows) / max(sum(r["nb_tokens"] for r in rows), 1),
+        "exact_match": sum(r["exact_match"] for r in rows) / nb_samples,
+        "pixel_similarity": sum(r["pixel_similarity"] for r in rows) / nb_samples,
+        "render_failures": sum(not r["renderable"] for r in rows) / nb_samples,
+    }
+    return metrics, rows
@@ -0,0 +1,152 @@
+import json
+import os
+from typing import List, Sequence
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+import scripts.utils.image_utils as iu
+import scripts.utils.utils as ut
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+
+BACKENDS = ("torchscript", "onnx")
+IMAGE_SIZE = 350
+CONFIG_FILE = "config.json"
+VOCAB_FILE = "vocab.json"
+MODEL_FILES = {"torchscript": "model.ts", "onnx": "model.onnx"}
+
+
+class CircuitToLatexModel(nn.Module):
+    def __init__(self, encoder: nn.Module, decoder: nn.Module) -> None:
+        """Encoder and decoder chained together, returning the predicted token ids.
+        This is the module that gets exported.
+        """
+        super().__init__()
+        self.encoder = encoder
+        self.decoder = decoder
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            x (torch.Tensor): batch of images of shape (batch_size, 1, H, W), with values in [0, 1]
+
+        Returns:
+            torch.Tensor: token ids of shape (batch_size, formula_max_len)
+        """
+        return self.decoder(self.encoder(x)).argmax(dim=-1)
+
+
+def export_model(encoder: nn.Module, decoder: nn.Module, output_dir: str, backend: str = "torchscript",
+                 quantize: bool = False, image_size: int = IMAGE_SIZE) -> None:
+    """Exports the trained models to output_dir, with the vocabulary needed to decode the predictions.
+
+    Args:
+        encoder (nn.Module): trained image encoder
+        decoder (nn.Module): trained text decoder (holds the vocabulary)
+        output_dir (str): folder where the exported files are written
+        backend ("torchscript" | "onnx"): format of the exported model
+        quantize (bool): apply dynamic int8 quantization to the linear and LSTM layers (torchscript only)
+        image_size (int): side of the square images given to the model
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    if quantize and backend != "torchscript":
+        # onnxruntime's dynamic quantization fails on the Gemm nodes of the unrolled LSTM cell
+        raise ValueError("Dynamic int8 quantization is only supported with the torchscript backend")
+    ut.create_dir_if_not_exists(output_dir)
+    model = CircuitToLatexModel(encoder, decoder).to("cpu").eval()
+    # batch of 2 so that nothing gets specialized to a batch of 1
+    example_input = torch.rand(2, 1, image_size, image_size)
+    model_path = os.path.join(output_dir, MODEL_FILES[backend])
+
+    if backend == "torchscript":
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {nn.Linear, nn.LSTMCell}, dtype=torch.qint8)
+        with torch.no_grad():
+            traced_model = torch.jit.trace(model, example_input, check_trace=False)
+        torch.jit.save(traced_model, model_path)
+    else:
+        torch.onnx.export(
+            model, (example_input,), model_path,
+            input_names=["images"], output_names=["tokens"],
+            dynamic_axes={"images": {0: "batch_size"}, "tokens": {0: "batch_size"}},
+        )
+
+    vocab: Vocabulary = decoder.vocab
+    vocab.save(os.path.join(output_dir, VOCAB_FILE), append_only=False)
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump({"backend": backend, "quantized": quantize, "image_size": image_size}, f)
+
+
+class InferenceEngine:
+    def __init__(self, model_dir: str, batch_size: int = 32, num_threads: int = None) -> None:
+        """Loads an exported model once, then predicts circuitikz code for batches of images.
+
+        Args:
+            model_dir (str): folder created by export_model
+            batch_size (int): maximal number of images per forward pass
+            num_threads (int, optional): number of CPU threads used by the runtime
+        """
+        with open(os.path.join(model_dir, CONFIG_FILE), "r") as f:
+            config = json.load(f)
+        self.backend: str = config["backend"]
+        self.image_size: int = config["image_size"]
+        self.batch_size = batch_size
+
+        self.vocab = Vocabulary.load(os.path.join(model_dir, VOCAB_FILE))
+
+        model_path = os.path.join(model_dir, MODEL_FILES[self.backend])
+        if self.backend == "torchscript":
+            if num_threads:
+                torch.set_num_threads(num_threads)
+            self.model = torch.jit.load(model_path, map_location="cpu").eval()
+        else:
+            try:
+                import onnxruntime
+            except ImportError as e:
+                raise ImportError("The onnx backend requires onnxruntime: `pip install onnxruntime`") from e
+            options = onnxruntime.SessionOptions()
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self.session = onnxruntime.InferenceSession(
+                model_path, options, providers=["CPUExecutionProvider"])
+
+    def preprocess(self, img: np.ndarray) -> np.ndarray:
+        """Greyscale uint8 image -> float32 array of shape (1, image_size, image_size) in [0, 1].
+        Images that are not already at the right size are padded and resized like in generate.py
+        """
+        if img.ndim == 3:
+            img = img[..., 0]
+        if img.shape != (self.image_size, self.image_size):
+            img = iu.pad_to_square(img, border=50)
+            img = iu.resize_image(img, (self.image_size, self.image_size))
+        return (img.astype(np.float32) / 255)[np.newaxis]
+
+    def run_batch(self, batch: np.ndarray) -> np.ndarray:
+        """Returns the predicted token ids for a batch of preprocessed images"""
+        if self.backend == "torchscript":
+            with torch.inference_mode():
+                return self.model(torch.from_numpy(batch)).numpy()
+        return self.session.run(None, {"images": batch})[0]
+
+    def decode(self, token_ids: Sequence[int]) -> str:
+        """Converts predicted token ids into a circuitikz string"""
+        return self.vocab.detokenize([self.vocab.idx_to_word.get(int(i), "<UNK>") for i in token_ids])
+
+    def predict(self, images: Sequence[np.ndarray]) -> List[str]:
+        """Returns the predicted circuitikz code for each (greyscale) image"""
+        predictions = []
+        for start in range(0, len(images), self.batch_size):
+            batch = np.stack([self.preprocess(img) for img in images[start:start + self.batch_size]])
+            predictions.extend(self.decode(ids) for ids in self.run_batch(batch))
+        return predictions
+
+    def predict_files(self, img_paths: Sequence[str]) -> List[str]:
+        """Same as predict, reading the images one batch at a time"""
+        predictions = []
+        for start in range(0, len(img_paths), self.batch_size):
+            predictions.extend(self.predict(
+                [iu.read_image(path) for path in img_paths[start:start + self.batch_size]]))
+        return predictions
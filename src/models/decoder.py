@@ -22,40 +22,43 @@ class TextDecoder(nn.Module):
         self.softmax = nn.Softmax(dim=-1)
         # later : add an embedding layer
 
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, formula_len: int = None) -> torch.Tensor:
         """
         Args:
             x (torch.Tensor): is a tensor of shape (batch_size, input_size)
+            formula_len (int, optional): number of tokens to generate (e.g. the longest formula of the batch).
+                Defaults to the longest formula of the vocabulary.
 
         Returns:
             torch.Tensor: The tensor of one hot encoded tokens, generated by the decoder
         """
-        batch_size = x.shape[0]
-
         # get SOS, EOS & PAD one-hot encoded vectors
+        if formula_len is None:
+            formula_len = self.formula_max_len
         eos_vect_id = self.vocab.word_to_idx["<EOS>"]
         pad_vect = self.vocab.get_encoded_token("<PAD>")
         sos_vect = self.vocab.get_encoded_token("<SOS>")
 
-        # will contain the probabilities for each prediction of the different tokens
-        # initialized with <PAD> token One Hot Encoded (and <SOS> for the first token)
-        predictions = (
-            torch.ones(size=(batch_size, self.formula_max_len, self.vocab_size))
-            * pad_vect
-        )
-        predictions[:, 0] = sos_vect
-
         # initialize hidden state with the encoder outputed vector <SOS> token
-        hidden_state = x.squeeze()
+        # (flatten instead of squeeze, to keep the batch dimension when batch_size = 1)
+        hidden_state = x.flatten(start_dim=1)
         cell_state = torch.zeros_like(hidden_state)  # how to initialize it properly ?
+
+        # will contain the probabilities for each prediction of the different tokens
+        # initialized with <PAD> token One Hot Encoded (and <SOS> for the first token)
+        # shapes are derived from x (not from x.shape) so that the model can be traced
         # initialize the input vector with the <SOS> token
         # shape (batch size, vocab_size)
-        input_vect = torch.ones(size=(batch_size, self.vocab_size)) * sos_vect.to(
-            torch.float32
+        input_vect = torch.ones_like(hidden_state) * sos_vect.to(torch.float32)
+        predictions = (
+            (torch.ones_like(hidden_state) * pad_vect)
+            .unsqueeze(1)
+            .repeat(1, formula_len, 1)
         )
+        predictions[:, 0] = input_vect
 
         # until the full formula has been predicted,
-        for i in range(self.formula_max_len - 1):
+        for i in range(formula_len - 1):
             # run once through the LSTM
             hidden_state, cell_state = self.lstm_cell(
                 input_vect, (hidden_state, cell_state)
@@ -69,6 +72,7 @@ class TextDecoder(nn.Module):
             #     break
 
             # update the input to be the predicted token
-            input_vect = self.vocab.get_encoded_token(pred_tokens)
+            # (not get_encoded_token, which squeezes the batch dimension when batch_size = 1)
+            input_vect = self.vocab.one_hot_encode(pred_tokens).to(dtype=torch.float)
 
         return predictions
@@ -1,3 +1,5 @@
+from typing import Sequence
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -35,5 +37,80 @@ class ImageEncoder(nn.Module):
         return x
 
 
+class DepthwiseSeparableConv(nn.Module):
+    def __init__(self, in_channels: int, out_channels: int, stride: int = 1):
+        """A 3x3 depthwise convolution (one filter per channel) followed by a 1x1 pointwise
+        convolution mixing the channels. Costs about 1/9 of a full 3x3 convolution.
+        """
+        super().__init__()
+        self.depthwise = nn.Conv2d(
+            in_channels, in_channels, (3, 3), stride=stride, padding=1, groups=in_channels, bias=False
+        )
+        self.pointwise = nn.Conv2d(in_channels, out_channels, (1, 1), bias=False)
+        self.bn = nn.BatchNorm2d(out_channels)
+
+    def forward(self, x):
+        return F.relu(self.bn(self.pointwise(self.depthwise(x))))
+
+
+class EfficientImageEncoder(nn.Module):
+    def __init__(
+        self,
+        ouptut_size: int,
+        nb_input_channels: int = 1,
+        channels: Sequence[int] = (16, 32, 64, 128),
+        stem_stride: int = 4,
+        pool_size: int = 4,
+    ):
+        """Lighter encoder for the sparse (mostly white) circuit images.
+
+        Args:
+            ouptut_size (int): size of the output vector (vocabulary size)
+            nb_input_channels (int): 1 because images are greyscale
+            channels (Sequence[int]): number of channels after the stem, then after each block.
+                Each block after the stem halves the resolution.
+            stem_stride (int): downsampling factor of the first (patchifying) convolution
+            pool_size (int): side of the feature map kept before the linear layer
+        """
+        super().__init__()
+        # downsample early: non overlapping patches, 350x350 -> 87x87 with the default stride
+        self.stem = nn.Conv2d(
+            nb_input_channels, channels[0], (stem_stride, stem_stride), stride=stem_stride, bias=False
+        )
+        self.stem_bn = nn.BatchNorm2d(channels[0])
+        self.blocks = nn.Sequential(
+            *(
+                DepthwiseSeparableConv(in_c, out_c, stride=2)
+                for in_c, out_c in zip(channels[:-1], channels[1:])
+            )
+        )
+        # keep all the channels (instead of collapsing them into one) but on a small grid
+        self.pool = nn.AdaptiveAvgPool2d(pool_size)
+        self.lin1 = nn.Linear(channels[-1] * pool_size * pool_size, ouptut_size)
+
+    def forward(self, x):
+        x = F.relu(self.stem_bn(self.stem(x)))
+        x = self.blocks(x)
+        x = self.pool(x)
+        x = torch.flatten(x, start_dim=1)
+        x = F.relu(self.lin1(x))
+        return x
+
+
+ENCODERS = {
+    "basic": ImageEncoder,
+    "efficient": EfficientImageEncoder,
+}
+
+
+def get_encoder(name: str, ouptut_size: int, channels: Sequence[int] = None) -> nn.Module:
+    """Instanciates one of the ENCODERS. channels is only used by the efficient encoder."""
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder '{name}', expected one of {list(ENCODERS)}")
+    if name == "efficient" and channels:
+        return EfficientImageEncoder(ouptut_size, channels=channels)
+    return ENCODERS[name](ouptut_size)
+
+
 if __name__ == "__main__":
     net = ImageEncoder()
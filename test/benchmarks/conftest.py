@@ -0,0 +1,14 @@
+import importlib.util
+
+import pytest
+
+# the benchmarks need the pytest-benchmark plugin (pip install pytest-benchmark)
+if importlib.util.find_spec("pytest_benchmark") is None:
+    collect_ignore_glob = ["test_*.py"]
+else:
+    @pytest.fixture(autouse=True)
+    def run_once(request, benchmark):
+        """In the normal test run, benchmarked functions only run once (as smoke tests).
+        They are timed with `make bench-generation` (--benchmark-only) or --benchmark-enable."""
+        if not (request.config.getoption("benchmark_only") or request.config.getoption("benchmark_enable")):
+            benchmark.disabled = True
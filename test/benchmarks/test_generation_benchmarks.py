@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import scripts.utils.utils as ut
+from scripts.data_generation.generate_circuits import CircuitGenerator
+
+# number of horizontal and vertical lines of the grid (circuits are generated with 2 to 4 lines)
+GRID_SIZES = [4, 16, 64]
+
+
+def get_grid(nb_lines: int):
+    """Spaces between the lines of a nb_lines x nb_lines grid, like generate_one_circuit draws them"""
+    rng = np.random.RandomState(0)
+    return rng.randint(2, 4, size=nb_lines - 1), rng.randint(2, 4, size=nb_lines - 1)
+
+
+def get_circuit(nb_lines: int):
+    np.random.seed(0)
+    return CircuitGenerator(min_lines=nb_lines, max_lines=nb_lines).generate_one_circuit()
+
+
+@pytest.mark.benchmark(group="get_line_segments")
+@pytest.mark.parametrize("nb_lines", GRID_SIZES)
+def test_get_line_segments(benchmark, nb_lines):
+    spaces, _ = get_grid(nb_lines)
+    segments = benchmark(CircuitGenerator().get_line_segments, spaces, "horizontal", 0)
+    assert len(segments) == nb_lines - 1
+
+
+@pytest.mark.benchmark(group="get_inside_segments")
+@pytest.mark.parametrize("nb_lines", GRID_SIZES)
+def test_get_inside_segments(benchmark, nb_lines):
+    horiz_spaces, vert_spaces = get_grid(nb_lines)
+    segments = benchmark(CircuitGenerator().get_inside_segments, nb_lines, nb_lines, horiz_spaces, vert_spaces)
+    assert len(segments) == 2 * (nb_lines - 2) * (nb_lines - 1)
+
+
+@pytest.mark.benchmark(group="get_outside_segments")
+@pytest.mark.parametrize("nb_lines", GRID_SIZES)
+def test_get_outside_segments(benchmark, nb_lines):
+    horiz_spaces, vert_spaces = get_grid(nb_lines)
+    segments = benchmark(CircuitGenerator().get_outside_segments, horiz_spaces, vert_spaces)
+    assert len(segments) == 4 * (nb_lines - 1)
+
+
+@pytest.mark.benchmark(group="add_bipoles")
+@pytest.mark.parametrize("nb_lines", GRID_SIZES)
+def test_add_bipoles(benchmark, nb_lines):
+    generator = CircuitGenerator()
+    segments = {s.with_type(None) for s in get_circuit(nb_lines)}
+
+    def add_bipoles():
+        generator.segments = segments
+        generator.add_bipoles()
+
+    benchmark(add_bipoles)
+    assert len(generator.segments) == len(segments)
+
+
+@pytest.mark.benchmark(group="generate_one_circuit")
+@pytest.mark.parametrize("nb_lines", GRID_SIZES)
+def test_generate_one_circuit(benchmark, nb_lines):
+    np.random.seed(0)
+    generator = CircuitGenerator(min_lines=nb_lines, max_lines=nb_lines)
+    assert benchmark(generator.generate_one_circuit)
+
+
+@pytest.mark.benchmark(group="segment_list_to_latex")
+@pytest.mark.parametrize("nb_lines", GRID_SIZES)
+def test_segment_list_to_latex(benchmark, nb_lines):
+    segments = get_circuit(nb_lines)
+    latex_string = benchmark(ut.segment_list_to_latex, segments)
+    assert latex_string.count("\\draw") == len(segments)
@@ -0,0 +1,32 @@
+import stat
+import sys
+
+import pytest
+
+import scripts.utils.utils as ut
+
+FAKE_LATEX = """#!/bin/sh
+# writes the .pdf next to the .tex file
+sleep 0.05
+cp "$1" "${1%.tex}.pdf"
+"""
+FAKE_GHOSTSCRIPT = f"""#!/bin/sh
+# writes a blank image to -sOutputFile=...
+for arg in "$@"; do
+    case $arg in -sOutputFile=*) output="${{arg#-sOutputFile=}}";; esac
+done
+sleep 0.05
+{sys.executable} -c "import sys, numpy as np, cv2; img = np.full((120, 200), 255, np.uint8); img[60] = 0; cv2.imwrite(sys.argv[1], img)" "$output"
+"""
+
+
+@pytest.fixture
+def fake_binaries(tmp_path):
+    """Folder of shell scripts standing in for latex and Ghostscript (not on Windows)"""
+    binaries_dir = tmp_path / "bin"
+    binaries_dir.mkdir()
+    for name, script in (("latex", FAKE_LATEX), (ut.GHOSTSCRIPT_BINARY, FAKE_GHOSTSCRIPT)):
+        path = binaries_dir / name
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(binaries_dir)
@@ -0,0 +1,67 @@
+import torch
+import torch.nn.functional as F
+
+from scripts.preprocessing.augment_images import (AugmentCollate, BatchAugmentation, random_affine,
+                                                  simulate_jpeg, thicken_strokes)
+
+
+def get_images(batch_size=4, size=40):
+    """White images with a dark horizontal line"""
+    images = torch.ones(batch_size, 1, size, size)
+    images[:, :, size // 2, 5:-5] = 0
+    return images
+
+
+def test_thicken_strokes():
+    images = get_images()
+    thick = thicken_strokes(images)
+    assert torch.equal(thick, -F.max_pool2d(-images, 3, stride=1, padding=1))
+    assert (thick < .5).sum() > (images < .5).sum()
+
+
+def test_random_affine_keeps_white_background():
+    images = torch.ones(2, 1, 30, 30)
+    rotated = random_affine(images, torch.tensor([10., -10.]), torch.tensor([.9, 1.1]))
+    assert torch.allclose(rotated, images)
+
+
+def test_random_affine_identity():
+    images = get_images()
+    assert torch.allclose(random_affine(images, torch.zeros(4), torch.ones(4)), images, atol=1e-5)
+
+
+def test_simulate_jpeg():
+    images = torch.rand(2, 1, 20, 27)
+    high, low = simulate_jpeg(images, torch.tensor([100., 100.])), simulate_jpeg(images, torch.tensor([10., 10.]))
+    assert high.shape == images.shape
+    assert (high - images).abs().mean() < (low - images).abs().mean()
+
+
+class TestBatchAugmentation:
+    def test_output(self):
+        images = get_images()
+        augmented = BatchAugmentation(p_thicken=1., p_jpeg=1.)(images)
+        assert augmented.shape == images.shape
+        assert 0 <= augmented.min() and augmented.max() <= 1
+        assert not torch.equal(augmented, images)
+
+    def test_seed(self):
+        images = get_images()
+        assert torch.equal(BatchAugmentation(seed=1)(images), BatchAugmentation(seed=1)(images))
+        assert not torch.equal(BatchAugmentation(seed=1)(images), BatchAugmentation(seed=2)(images))
+
+    def test_set_epoch(self):
+        images = get_images()
+        augmentation = BatchAugmentation()
+        first = augmentation(images)
+        augmentation.set_epoch(1)
+        assert not torch.equal(augmentation(images), first)
+        augmentation.set_epoch(0)
+        assert torch.equal(augmentation(images), first)
+
+
+def test_augment_collate():
+    batch = [(torch.ones(1, 10, 10), torch.tensor([i])) for i in range(3)]
+    images, targets = AugmentCollate(BatchAugmentation())(batch)
+    assert images.shape == (3, 1, 10, 10)
+    assert torch.equal(targets, torch.tensor([[0], [1], [2]]))
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from scripts.data_generation.circuit_graph import (CircuitGraph, UnionFind, ValidCircuitGenerator, ValidityRules,
+                                                   filter_valid)
+from scripts.data_generation.generate_circuits import Segment
+
+# a rectangle with a battery on its left side
+LOOP = {
+    Segment((0, 0), (0, 2), "battery1"),
+    Segment((0, 2), (3, 2), "generic"),
+    Segment((3, 0), (3, 2), "short"),
+    Segment((0, 0), (3, 0), "short"),
+}
+WIRE = Segment((3, 2), (5, 2), "short")
+ISLAND = Segment((10, 10), (12, 10), "capacitor")
+
+
+class TestUnionFind:
+    def test_union(self):
+        uf = UnionFind()
+        uf.union((0, 0), (0, 1))
+        uf.union((0, 2), (0, 3))
+        assert uf.nb_sets() == 2
+        uf.union((0, 1), (0, 3))
+        assert uf.nb_sets() == 1
+        assert uf.find((0, 0)) == uf.find((0, 2))
+
+
+class TestCircuitGraph:
+    def test_loop(self):
+        graph = CircuitGraph(LOOP)
+        assert graph.nb_components == 1
+        assert graph.dangling_nodes == set()
+        assert graph.has_source
+        assert len(graph.adjacency[(0, 0)]) == 2
+
+    def test_dangling_wire(self):
+        assert CircuitGraph(LOOP | {WIRE}).dangling_nodes == {(5, 2)}
+
+    def test_island(self):
+        graph = CircuitGraph(LOOP | {ISLAND})
+        assert graph.nb_components == 2
+        assert graph.dangling_nodes == {(10, 10), (12, 10)}
+
+
+class TestValidityRules:
+    def test_default_rules(self):
+        rules = ValidityRules()
+        assert rules.is_valid(LOOP)
+        assert rules.get_violations(LOOP | {WIRE}) == ["1 dangling nodes"]
+        assert rules.get_violations({s.with_type("short") for s in LOOP}) == ["no source"]
+        assert not rules.is_valid(set())
+
+    def test_custom_rules(self):
+        rules = ValidityRules(max_components=2, max_dangling_nodes=2, require_source=False)
+        assert rules.is_valid(LOOP | {ISLAND})
+        assert rules.is_valid({s.with_type("short") for s in LOOP})
+
+    def test_filter_valid(self):
+        assert filter_valid([LOOP, LOOP | {WIRE}, LOOP | {ISLAND}]) == [LOOP]
+
+
+class TestValidCircuitGenerator:
+    def test_generated_circuits_are_valid(self):
+        np.random.seed(0)
+        generator = ValidCircuitGenerator()
+        for _ in range(20):
+            assert generator.rules.is_valid(generator.generate_one_circuit())
+
+    def test_impossible_rules(self):
+        generator = ValidCircuitGenerator(max_attempts=5, p_source=0)
+        with pytest.raises(RuntimeError):
+            generator.generate_one_circuit()
@@ -0,0 +1,40 @@
+import torch
+
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+from scripts.utils.dataset_utils import BucketBatchSampler, PadCollate
+
+
+class TestBucketBatchSampler:
+    lengths = [12, 55, 14, 51, 18, 57, 11, 90]
+
+    def test_batches_have_similar_lengths(self):
+        sampler = BucketBatchSampler(self.lengths, batch_size=2, bucket_width=10)
+        batches = list(sampler)
+        assert sorted(i for batch in batches for i in batch) == list(range(len(self.lengths)))
+        for batch in batches:
+            assert len({self.lengths[i] // 10 for i in batch}) == 1
+
+    def test_same_seed_same_batches(self):
+        batches_1 = list(BucketBatchSampler(self.lengths, batch_size=2, seed=3))
+        batches_2 = list(BucketBatchSampler(self.lengths, batch_size=2, seed=3))
+        assert batches_1 == batches_2
+
+    def test_distributed_split(self):
+        """Each process gets the same number of batches, without overlap"""
+        samplers = [BucketBatchSampler(self.lengths, batch_size=2, num_replicas=2, rank=r) for r in (0, 1)]
+        batches_0, batches_1 = list(samplers[0]), list(samplers[1])
+        assert len(batches_0) == len(batches_1)
+        assert not {i for b in batches_0 for i in b} & {i for b in batches_1 for i in b}
+
+
+class TestPadCollate:
+    def test_pad_to_longest_of_batch(self):
+        vocab = Vocabulary()
+        collate = PadCollate(vocab)
+        short_formula = vocab.one_hot_encode(torch.tensor([1, 2])).float()
+        long_formula = vocab.one_hot_encode(torch.tensor([1, 3, 3, 2])).float()
+        images, formulas = collate([(torch.zeros(1, 5, 5), short_formula), (torch.ones(1, 5, 5), long_formula)])
+        assert images.shape == (2, 1, 5, 5)
+        assert formulas.shape == (2, 4, len(vocab))
+        assert formulas[0, 2:].argmax(dim=-1).tolist() == [vocab.word_to_idx["<PAD>"]] * 2
+        assert torch.equal(formulas[1], long_formula)
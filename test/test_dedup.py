@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import scripts.utils.utils as ut
+from scripts.data_generation.dedup import CircuitIndex, dedup_dataset, get_circuit_key, parse_circuit
+from scripts.data_generation.generate_circuits import CircuitGenerator, Segment
+
+# a rectangle with a resistor on its left side and a battery on its bottom side
+CIRCUIT = [
+    Segment((0, 0), (0, 2), "generic", "R_1"),
+    Segment((0, 2), (3, 2)),
+    Segment((3, 0), (3, 2)),
+    Segment((0, 0), (3, 0), "battery1"),
+]
+
+
+def translate(segments, dx, dy):
+    return [Segment((s.from_pos[0] + dx, s.from_pos[1] + dy), (s.to_pos[0] + dx, s.to_pos[1] + dy),
+                    s.type, s.label) for s in segments]
+
+
+def mirror_x(segments):
+    return [Segment((-s.to_pos[0], s.to_pos[1]), (-s.from_pos[0], s.from_pos[1]), s.type, s.label)
+            for s in segments]
+
+
+class TestCanonicalForm:
+    def test_latex_does_not_depend_on_order(self):
+        assert ut.segment_list_to_latex(CIRCUIT) == ut.segment_list_to_latex(CIRCUIT[::-1])
+
+    def test_parse_circuit(self):
+        circuit = CircuitGenerator().generate_one_circuit()
+        assert parse_circuit(ut.segment_list_to_latex(circuit)) == set(circuit)
+
+    def test_translated_circuit(self):
+        assert get_circuit_key(CIRCUIT) == get_circuit_key(translate(CIRCUIT, 4, -2))
+        assert get_circuit_key(CIRCUIT, False) == get_circuit_key(translate(CIRCUIT, 4, -2), False)
+
+    def test_mirrored_circuit(self):
+        mirrored = mirror_x(CIRCUIT)
+        assert get_circuit_key(CIRCUIT) == get_circuit_key(mirrored)
+        assert get_circuit_key(CIRCUIT, include_mirrors=False) != get_circuit_key(mirrored, include_mirrors=False)
+
+    def test_different_circuits(self):
+        other = [s.with_type("capacitor") if s.type == "battery1" else s for s in CIRCUIT]
+        assert get_circuit_key(CIRCUIT) != get_circuit_key(other)
+
+
+class TestCircuitIndex:
+    def test_add(self, tmp_path):
+        path = str(tmp_path / "index.sqlite")
+        with CircuitIndex(path) as index:
+            assert index.add("a", "img_a")
+            assert not index.add("a", "img_b")
+            assert "a" in index and "b" not in index
+        # persisted
+        with CircuitIndex(path) as index:
+            assert len(index) == 1
+            assert index.get_image_name("a") == "img_a"
+
+    def test_key_schemes_are_not_mixed(self, tmp_path):
+        path = str(tmp_path / "index.sqlite")
+        with CircuitIndex(path, include_mirrors=False) as index:
+            assert index.get_key(CIRCUIT) == get_circuit_key(CIRCUIT, include_mirrors=False)
+        with pytest.raises(ValueError):
+            CircuitIndex(path)
+        with CircuitIndex(path, include_mirrors=False) as index:
+            assert len(index) == 0
+
+
+def test_dedup_dataset(tmp_path):
+    circuits = [CIRCUIT, translate(CIRCUIT, 1, 1), CIRCUIT[:3], mirror_x(CIRCUIT)]
+    formulas = [ut.segment_list_to_latex(c) for c in circuits]
+    os.makedirs(tmp_path / "circuit_images")
+    with open(tmp_path / "circuit2latex.lst", "w") as names, open(tmp_path / "circuitikz_code.lst", "w") as codes:
+        for i, formula in enumerate(formulas):
+            filename = ut.get_image_name(formula)
+            (tmp_path / "circuit_images" / f"{filename}.jpg").touch()
+            names.write(f"{i + 1} {filename} basic\n")
+            codes.write(f"{formula}\n")
+
+    assert dedup_dataset(str(tmp_path), delete_images=True) == (2, 2)
+    with open(tmp_path / "circuit2latex.lst") as f:
+        lines = f.read().splitlines()
+    with open(tmp_path / "circuitikz_code.lst") as f:
+        assert f.read().splitlines() == [formulas[0], formulas[2]]
+    assert lines == [f"1 {ut.get_image_name(formulas[0])} basic", f"2 {ut.get_image_name(formulas[2])} basic"]
+    assert len(os.listdir(tmp_path / "circuit_images")) == 2
+    with CircuitIndex(str(tmp_path / "circuit_index.sqlite")) as index:
+        assert len(index) == 2
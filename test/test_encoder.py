@@ -0,0 +1,20 @@
+import pytest
+import torch
+
+from src.models.encoder import EfficientImageEncoder, get_encoder
+
+
+class TestEfficientImageEncoder:
+    def test_output_shape(self):
+        encoder = EfficientImageEncoder(ouptut_size=30)
+        output = encoder(torch.rand(2, 1, 350, 350))
+        assert output.shape == (2, 30)
+
+    def test_custom_channels(self):
+        encoder = get_encoder("efficient", 30, channels=[8, 16])
+        assert encoder.lin1.in_features == 16 * 4 * 4
+        assert encoder(torch.rand(2, 1, 350, 350)).shape == (2, 30)
+
+    def test_unknown_encoder(self):
+        with pytest.raises(ValueError):
+            get_encoder("unknown", 30)
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+import scripts.utils.image_utils as iu
+import scripts.utils.utils as ut
+from scripts.data_generation.dedup import parse_circuit
+from scripts.data_generation.native_renderer import NativeRenderer
+from src.evaluation import PredictionRenderer, compare_tokens, evaluate, read_samples
+
+FORMULAS = [
+    "\\draw (0, 0) to[short] (0, 2); \\draw (0, 0) to[generic] (2, 0); ",
+    "\\draw (0, 0) to[battery1] (0, 3); \\draw (0, 3) to[short] (3, 3); ",
+]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    images_folder = tmp_path / "circuit_images"
+    images_folder.mkdir()
+    renderer = NativeRenderer()
+    names = []
+    for line_number, formula in enumerate(FORMULAS, start=1):
+        name = ut.get_image_name(formula)
+        iu.save_image(renderer.render(parse_circuit(formula)), str(images_folder / f"{name}.jpg"))
+        names.append(f"{line_number} {name} 1\n")
+    (tmp_path / "circuitikz_code.lst").write_text("".join(f"{formula}\n" for formula in FORMULAS))
+    (tmp_path / "circuit2latex.lst").write_text("".join(names))
+    return tmp_path
+
+
+def test_compare_tokens():
+    assert compare_tokens(["a", "b"], ["a", "b"]) == 3
+    assert compare_tokens(["a", "c", "d"], ["a", "b"]) == 1
+    assert compare_tokens([], ["a"]) == 0
+
+
+def test_read_samples(data_dir):
+    samples = read_samples(str(data_dir), max_samples=1)
+    assert samples == [(os.path.join(str(data_dir), "circuit_images", f"{ut.get_image_name(FORMULAS[0])}.jpg"),
+                        FORMULAS[0])]
+
+
+def test_evaluate(data_dir, tmp_path):
+    samples = read_samples(str(data_dir))
+    renderer = PredictionRenderer(str(tmp_path / "cache"), renderer="native")
+    # an exact match, and a wrong prediction which cannot be drawn
+    metrics, rows = evaluate([FORMULAS[0], "\\draw (0, 0)"], samples, renderer, jobs=2)
+    assert metrics["nb_samples"] == 2
+    assert metrics["exact_match"] == .5
+    assert metrics["render_failures"] == .5
+    assert metrics["pixel_similarity"] == .5
+    assert 0 < metrics["token_accuracy"] < 1
+    assert [row["exact_match"] for row in rows] == [True, False]
+
+
+def test_renderer_cache(data_dir, tmp_path):
+    renderer = PredictionRenderer(str(tmp_path / "cache"), renderer="native")
+    img = renderer.render(FORMULAS[1])
+    assert img.shape == (350, 350)
+    assert os.path.exists(tmp_path / "cache" / "native-350" / f"{ut.get_image_name(FORMULAS[1])}.jpg")
+    assert renderer.render("not circuitikz") is None
+    assert os.path.exists(tmp_path / "cache" / "native-350" / f"{ut.get_image_name('not circuitikz')}.failed")
+
+    # a close prediction is similar to the true image
+    samples = read_samples(str(data_dir))[1:]
+    metrics, _ = evaluate([FORMULAS[1].replace("(3, 3)", "(3, 2.5)")], samples, renderer)
+    assert 0 < metrics["pixel_similarity"] < 1
+
+
+@pytest.mark.skipif(os.name == "nt", reason="fake binaries are shell scripts")
+def test_latex_renderer(tmp_path, fake_binaries):
+    renderer = PredictionRenderer(str(tmp_path / "cache"), "latex", fake_binaries, fake_binaries)
+    images = renderer.render_all(FORMULAS + FORMULAS, jobs=2)
+    assert set(images) == set(FORMULAS)
+    assert all(img.shape == (350, 350) for img in images.values())
+    # only the cached images are left
+    assert sorted(os.listdir(tmp_path / "cache" / "latex-350")) == sorted(
+        f"{ut.get_image_name(f)}.jpg" for f in FORMULAS)
+
+
+@pytest.mark.skipif(os.name == "nt", reason="fake binaries are shell scripts")
+def test_renderers_do_not_share_cache(tmp_path, fake_binaries):
+    cache_dir = str(tmp_path / "cache")
+    native = PredictionRenderer(cache_dir, "native")
+    latex = PredictionRenderer(cache_dir, "latex", fake_binaries, fake_binaries)
+    native_img, latex_img = native.render(FORMULAS[0]), latex.render(FORMULAS[0])
+    assert native_img.shape == latex_img.shape == (350, 350)
+    assert (native_img != latex_img).any()
+    # a failure of one renderer does not prevent the other one from trying
+    unparsable = "\\node at (0, 0) {R};"
+    assert native.render(unparsable) is None
+    assert latex.render(unparsable) is not None
+    assert sorted(os.listdir(cache_dir)) == ["latex-350", "native-350"]
+    assert PredictionRenderer(cache_dir, "native", image_size=200).render(FORMULAS[0]).shape == (200, 200)
@@ -1,3 +1,6 @@
+import numpy as np
+import pytest
+
 from scripts.data_generation.generate_circuits import Segment, CircuitGenerator
 
 
@@ -159,3 +162,48 @@ class TestGetOutlineSegments:
             Segment((2, 0), (2, 1)), Segment((2, 1), (2, 2))
         }
         assert inside_segments == expected_segments
+
+
+class TestSegment:
+    def test_immutable(self):
+        segment = Segment((0, 0), (2, 0))
+        with pytest.raises(AttributeError):
+            segment.type = "generic"
+
+    def test_with_type(self):
+        segment = Segment((0, 0), (2, 0))
+        typed_segment = segment.with_type("generic")
+        assert segment.type is None
+        assert typed_segment.type == "generic"
+        assert typed_segment.key == segment.key
+        assert typed_segment != segment
+
+    def test_key_is_unique(self):
+        assert Segment((0, 1), (2, 1)).key != Segment((1, 0), (1, 2)).key
+        assert Segment((0, 0), (0, 2)).key != Segment((0, 2), (0, 0)).key
+
+    def test_numpy_coordinates(self):
+        """Numpy integers are converted, so that positions are formatted as (x, y)"""
+        segment = Segment((np.int64(0), np.int64(2)), (np.int64(3), np.int64(2)))
+        assert segment == Segment((0, 2), (3, 2))
+        assert str(segment.from_pos) == "(0, 2)"
+
+    def test_out_of_range_coordinates(self):
+        with pytest.raises(ValueError):
+            Segment((0, 0), (2 ** 20, 0))
+
+
+class TestGenerateOneCircuit:
+    def test_segments_hashes_are_valid(self):
+        """Every segment can be found in the set, i.e. no hash went stale when adding the bipoles"""
+        generator = CircuitGenerator()
+        segments = generator.generate_one_circuit()
+        assert all(segment.type is not None for segment in segments)
+        assert all(segment in segments for segment in list(segments))
+
+    def test_grid_size(self):
+        np.random.seed(0)
+        generator = CircuitGenerator(p_remove_inside_segment=0, p_remove_outline_segment=0, min_lines=10, max_lines=10)
+        segments = generator.generate_one_circuit()
+        # 10 lines of 9 segments in each direction
+        assert len(segments) == 2 * 10 * 9
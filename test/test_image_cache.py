@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+import scripts.utils.image_utils as iu
+import scripts.utils.utils as ut
+from scripts.utils.dataset_utils import CustomCircuitDataset
+from scripts.utils.image_cache import SharedImageCache
+
+SHAPE = (1, 4, 4)
+
+
+def image(value):
+    return torch.full(SHAPE, value, dtype=torch.uint8)
+
+
+class TestSharedImageCache:
+    def test_get_put(self):
+        cache = SharedImageCache(10, 3 * 16, SHAPE)
+        assert cache.get(0) is None
+        cache.put(0, image(7))
+        assert torch.equal(cache.get(0), image(7))
+        assert len(cache) == 1
+
+    def test_lru_eviction(self):
+        cache = SharedImageCache(10, 2 * 16, SHAPE)
+        cache.put(0, image(0))
+        cache.put(1, image(1))
+        cache.get(0)
+        # 1 is the least recently used
+        cache.put(2, image(2))
+        assert cache.get(1) is None
+        assert torch.equal(cache.get(0), image(0)) and torch.equal(cache.get(2), image(2))
+        assert len(cache) == 2
+
+    def test_other_shapes_not_cached(self):
+        cache = SharedImageCache(10, 10 * 16, SHAPE)
+        cache.put(0, torch.zeros(1, 5, 5, dtype=torch.uint8))
+        assert cache.get(0) is None
+
+    def test_shared_between_processes(self):
+        cache = SharedImageCache(10, 3 * 16, SHAPE)
+        process = multiprocessing.get_context("fork").Process(target=cache.put, args=(3, image(9)))
+        process.start()
+        process.join()
+        assert torch.equal(cache.get(3), image(9))
+
+
+def test_dataset_decodes_images_once(tmp_path):
+    img_dir = tmp_path / "circuit_images"
+    os.makedirs(img_dir)
+    formulas = [r"\draw (0, 0) to[short] (0, 2); ", r"\draw (0, 0) to[generic, l=R_1] (2, 0); "]
+    with open(tmp_path / "circuit2latex.lst", "w") as f:
+        for i, formula in enumerate(formulas):
+            name = ut.get_image_name(formula)
+            iu.save_image(np.full((8, 8), 50 * i, dtype=np.uint8), str(img_dir / f"{name}.jpg"))
+            f.write(f"{i + 1} {name} basic\n")
+    with open(tmp_path / "circuitikz_code.lst", "w") as f:
+        f.write("\n".join(formulas) + "\n")
+
+    data = CustomCircuitDataset(str(tmp_path / "circuit2latex.lst"), str(tmp_path / "circuitikz_code.lst"),
+                                str(img_dir), cache_bytes=2**20, image_shape=(1, 8, 8))
+    assert data.get_formula(2) == formulas[1]
+    assert data.formula_lengths.tolist() == [len(data.vocab.basic_tokenize(f)) + 2 for f in formulas]
+    first_epoch = [x for x, _ in DataLoader(data, batch_size=1, num_workers=2)]
+    # the second epoch does not read the files anymore
+    for name in os.listdir(img_dir):
+        os.remove(img_dir / name)
+    second_epoch = [x for x, _ in DataLoader(data, batch_size=1, num_workers=2)]
+    assert all(torch.equal(a, b) for a, b in zip(first_epoch, second_epoch))
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import torch
+
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+from src.inference import CircuitToLatexModel, InferenceEngine, export_model
+from src.models.decoder import TextDecoder
+from src.models.encoder import get_encoder
+
+FORMULAS = [
+    "\\draw (0, 0) to[short] (0, 2); ",
+    "\\draw (0, 0) to[generic, l=R_1] (2, 0); \\draw (2, 0) to[short] (2, 2); ",
+]
+IMAGE_SIZE = 64
+
+
+@pytest.fixture(scope="module")
+def models():
+    torch.manual_seed(0)
+    vocab = Vocabulary()
+    vocab.update(FORMULAS)
+    encoder = get_encoder("efficient", len(vocab), channels=[8, 16]).eval()
+    return encoder, TextDecoder(vocab).eval()
+
+
+@pytest.fixture(scope="module")
+def images():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (IMAGE_SIZE, IMAGE_SIZE), dtype=np.uint8) for _ in range(3)]
+
+
+@pytest.mark.parametrize("backend, quantize", [("torchscript", False), ("torchscript", True), ("onnx", False)])
+def test_export_and_predict(tmp_path, models, images, backend, quantize):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("onnxscript")
+    encoder, decoder = models
+    export_model(encoder, decoder, str(tmp_path), backend, quantize, image_size=IMAGE_SIZE)
+
+    predictions = {}
+    for batch_size in (1, 2):
+        engine = InferenceEngine(str(tmp_path), batch_size=batch_size)
+        assert engine.image_size == IMAGE_SIZE
+        assert engine.vocab.word_to_idx == decoder.vocab.word_to_idx
+        predictions[batch_size] = engine.predict(images)
+        assert len(predictions[batch_size]) == len(images)
+        assert all(isinstance(p, str) for p in predictions[batch_size])
+
+    if not quantize:
+        # same predictions as the model before export, whatever the batch size
+        # (dynamic quantization depends on the values of the whole batch)
+        with torch.no_grad():
+            batch = torch.from_numpy(np.stack([engine.preprocess(img) for img in images]))
+            token_ids = CircuitToLatexModel(encoder, decoder)(batch).numpy()
+        assert predictions[1] == predictions[2] == [engine.decode(ids) for ids in token_ids]
+
+
+def test_quantized_onnx_is_rejected(tmp_path, models):
+    with pytest.raises(ValueError):
+        export_model(*models, str(tmp_path), "onnx", quantize=True, image_size=IMAGE_SIZE)
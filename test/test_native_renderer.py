@@ -0,0 +1,73 @@
+import numpy as np
+
+from scripts.data_generation.generate_circuits import Segment
+import scripts.utils.utils as ut
+from scripts.data_generation.native_renderer import NativeRenderer, get_latex_layout
+from scripts.utils.image_utils import fit_to_square, ink_similarity
+
+
+class TestNativeRenderer:
+    renderer = NativeRenderer(image_size=350)
+    circuit = {
+        Segment((0, 0), (3, 0), "european voltage source"),
+        Segment((3, 0), (3, 2), "generic"),
+        Segment((0, 2), (3, 2), "short"),
+        Segment((0, 0), (0, 2), "capacitor"),
+    }
+
+    def test_image_format(self):
+        img = self.renderer.render(self.circuit)
+        assert img.shape == (350, 350)
+        assert img.dtype == np.uint8
+        assert (img < 128).any()
+
+    def test_circuit_is_centered(self):
+        img = self.renderer.render(self.circuit)
+        rows, cols = np.nonzero(img < 128)
+        assert abs((rows.min() + rows.max()) / 2 - 175) <= 2
+        assert abs((cols.min() + cols.max()) / 2 - 175) <= 2
+
+    def test_bounding_box_includes_elements(self):
+        x_min, y_min, x_max, y_max = self.renderer.get_bounding_box(self.circuit)
+        # the elements on the bottom, left and right segments stick out, not the top wire
+        assert y_min < 0 and x_min < 0 and x_max > 3
+        assert y_max == 2
+
+    def test_empty_circuit(self):
+        assert (self.renderer.render(set()) == 255).all()
+
+
+class TestInkSimilarity:
+    def test_identical_images(self):
+        img = NativeRenderer().render(TestNativeRenderer.circuit)
+        assert ink_similarity(img, img) == 1
+
+    def test_blank_image(self):
+        img = NativeRenderer().render(TestNativeRenderer.circuit)
+        assert ink_similarity(img, np.full_like(img, 255)) == 0
+
+
+class TestLatexLayout:
+    def test_drawing_fills_image(self):
+        resolution, border = get_latex_layout(TestNativeRenderer.circuit, 350)
+        x_min, y_min, x_max, y_max = NativeRenderer.get_bounding_box(TestNativeRenderer.circuit)
+        drawing_size = max(x_max - x_min, y_max - y_min) / 2.54 * resolution
+        assert 0 <= 350 - (drawing_size + 2 * border) <= 2
+        # same scale as the native renderer
+        assert np.isclose(resolution / 2.54, NativeRenderer(350).get_layout(TestNativeRenderer.circuit)[0])
+
+    def test_fit_to_square_pads_only(self):
+        img = np.full((150, 280), 255, np.uint8)
+        img[75] = 0
+        fitted = fit_to_square(img, 350, border=30)
+        assert fitted.shape == (350, 350)
+        # not resized: the line is still one pixel thick and black
+        assert (fitted < 128).sum() == 280 and fitted.min() == 0
+
+    def test_fit_to_square_resizes_large_images(self):
+        img = np.full((150, 330), 255, np.uint8)
+        assert fit_to_square(img, 350, border=30).shape == (350, 350)
+
+    def test_ghostscript_resolution(self):
+        assert "-r200" in ut.get_ghostscript_command("file", "gs")
+        assert "-r123.46" in ut.get_ghostscript_command("file", "gs", resolution=123.456)
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+import scripts.utils.image_utils as iu
+import scripts.utils.utils as ut
+from scripts.data_generation.dedup import CircuitIndex
+from scripts.data_generation.generate_circuits import CircuitGenerator
+from scripts.data_generation.pipeline import GenerationPipeline
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="fake binaries are shell scripts")
+
+
+class TestGenerationPipeline:
+    def test_generates_samples(self, tmp_path, fake_binaries):
+        save_to = tmp_path / "data"
+        images_folder = save_to / "circuit_images"
+        images_folder.mkdir(parents=True)
+        (save_to / "circuitikz_code.lst").write_text("existing formula\n")
+
+        pipeline = GenerationPipeline(str(save_to), str(images_folder), fake_binaries, fake_binaries,
+                                      CircuitGenerator(), latex_jobs=3, ghostscript_jobs=2, queue_size=2)
+        nb_generated = pipeline.run(10)
+
+        names_lines = (save_to / "circuit2latex.lst").read_text().splitlines()
+        formulas = (save_to / "circuitikz_code.lst").read_text().splitlines()
+        assert len(names_lines) == nb_generated == len(formulas) - 1
+        for line in names_lines:
+            line_number, filename, version = line.split(" ")
+            # each line points to its own formula
+            assert ut.get_image_name(formulas[int(line_number) - 1]) == filename
+            assert iu.read_image(str(images_folder / f"{filename}.jpg")).shape == (350, 350)
+        # only the images are left
+        assert all(f.suffix == ".jpg" for f in images_folder.iterdir())
+
+    def test_failed_compilation_is_skipped(self, tmp_path, fake_binaries):
+        (tmp_path / "bin" / "latex").write_text("#!/bin/sh\nexit 1\n")
+        save_to = tmp_path / "data"
+        images_folder = save_to / "circuit_images"
+        images_folder.mkdir(parents=True)
+        (save_to / "circuitikz_code.lst").write_text("")
+
+        with CircuitIndex(str(tmp_path / "index.sqlite")) as index:
+            pipeline = GenerationPipeline(str(save_to), str(images_folder), fake_binaries, fake_binaries,
+                                          CircuitGenerator(), circuit_index=index)
+            assert pipeline.run(3) == 0
+            # the circuits can be generated again
+            assert len(index) == 0
+        assert not list(images_folder.iterdir())
+
+    def test_written_circuits_are_indexed(self, tmp_path, fake_binaries):
+        save_to = tmp_path / "data"
+        images_folder = save_to / "circuit_images"
+        images_folder.mkdir(parents=True)
+        (save_to / "circuitikz_code.lst").write_text("")
+        with CircuitIndex(str(tmp_path / "index.sqlite")) as index:
+            pipeline = GenerationPipeline(str(save_to), str(images_folder), fake_binaries, fake_binaries,
+                                          CircuitGenerator(), circuit_index=index)
+            nb_generated = pipeline.run(5)
+            assert len(index) == nb_generated > 0
@@ -0,0 +1,14 @@
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+
+
+class TestDetokenize:
+    vocab = Vocabulary()
+
+    def test_round_trip(self):
+        formula = r"\draw (0, 0) to[short] (2, 0); \draw (2, 0) to[european voltage source] (2, 3);"
+        tokens = self.vocab.basic_tokenize(formula)
+        assert self.vocab.detokenize(tokens) == formula
+
+    def test_special_tokens(self):
+        tokens = ["<SOS>", r"\draw", "(0, 0)", "to[generic]", "(0, 2)", ";", "<EOS>", "<PAD>", ";"]
+        assert self.vocab.detokenize(tokens) == r"\draw (0, 0) to[generic] (0, 2);"
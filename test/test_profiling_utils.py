@@ -0,0 +1,32 @@
+import os
+import pstats
+
+import torch
+from torch.profiler import profile
+
+from scripts.utils.profiling_utils import cprofile, get_training_profiler, iter_with_label
+
+
+def test_iter_with_label():
+    with profile() as prof:
+        items = list(iter_with_label(range(3), "data_wait"))
+    assert items == [0, 1, 2]
+    assert any(event.key == "data_wait" for event in prof.key_averages())
+
+
+def test_training_profiler(tmp_path):
+    profiler = get_training_profiler(str(tmp_path), nb_steps=2)
+    profiler.start()
+    for _ in range(5):
+        torch.ones(10, 10) @ torch.ones(10, 10)
+        profiler.step()
+    profiler.stop()
+    assert sorted(os.listdir(tmp_path)) == ["train_rank0_step4.json", "train_rank0_step4.txt"]
+
+
+def test_cprofile(tmp_path):
+    with cprofile(str(tmp_path), "test"):
+        sorted(range(1000), key=lambda x: -x)
+    (path,) = tmp_path.iterdir()
+    assert path.suffix == ".pstats"
+    assert pstats.Stats(str(path)).total_calls > 0
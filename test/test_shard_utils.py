@@ -0,0 +1,106 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+import scripts.utils.image_utils as iu
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+from scripts.utils.shard_utils import ShardWriter, ShardedCircuitDataset, iter_shard, read_shard_index
+
+NB_SAMPLES = 25
+
+
+def get_formula(i):
+    return f"\\draw (0, 0) to[short] (0, {i + 1}); "
+
+
+@pytest.fixture
+def shards_dir(tmp_path):
+    """25 samples in shards of 10, the value of the pixels of image i is i"""
+    with ShardWriter(str(tmp_path), max_samples=10) as writer:
+        for i in range(NB_SAMPLES):
+            image = iu.encode_image(np.full((8, 8), 10 * i, dtype=np.uint8))
+            writer.write(f"sample{i:02d}", image, get_formula(i), {"i": i})
+    return str(tmp_path)
+
+
+@pytest.fixture
+def vocab(tmp_path):
+    formulas_path = tmp_path / "formulas.lst"
+    formulas_path.write_text("\n".join(get_formula(i) for i in range(NB_SAMPLES)) + "\n")
+    vocab = Vocabulary()
+    vocab.build_vocaulary(str(formulas_path))
+    return vocab
+
+
+def get_indices(images):
+    return sorted(int(round(float(x.flatten()[0]) * 255 / 10)) for x in images)
+
+
+class TestShardWriter:
+    def test_index(self, shards_dir):
+        shards = read_shard_index(shards_dir)
+        assert [s["nb_samples"] for s in shards] == [10, 10, 5]
+        assert all(os.path.getsize(os.path.join(shards_dir, s["name"])) == s["nb_bytes"] for s in shards)
+
+    def test_iter_shard(self, shards_dir):
+        samples = list(iter_shard(os.path.join(shards_dir, "shard-000001.tar")))
+        assert [name for name, _ in samples] == [f"sample{i}" for i in range(10, 20)]
+        name, files = samples[0]
+        assert files["tex"].decode() == get_formula(10)
+        assert json.loads(files["json"]) == {"i": 10}
+
+    def test_append_shards(self, shards_dir):
+        with ShardWriter(shards_dir) as writer:
+            writer.write("new", iu.encode_image(np.zeros((8, 8), dtype=np.uint8)), get_formula(0))
+        assert [s["name"] for s in read_shard_index(shards_dir)][-1] == "shard-000003.tar"
+
+
+class TestShardedCircuitDataset:
+    def test_all_samples_once(self, shards_dir, vocab):
+        data = ShardedCircuitDataset(shards_dir, vocab, shuffle_buffer=4)
+        assert len(data) == NB_SAMPLES
+        samples = list(data)
+        assert get_indices(x for x, _ in samples) == list(range(NB_SAMPLES))
+        assert samples[0][1].shape == (vocab.formula_max_length, len(vocab))
+
+    def test_shuffle_changes_with_epoch(self, shards_dir, vocab):
+        data = ShardedCircuitDataset(shards_dir, vocab, shuffle_buffer=4)
+        first = [x.flatten()[0].item() for x, _ in data]
+        data.set_epoch(1)
+        assert [x.flatten()[0].item() for x, _ in data] != first
+
+    def test_workers(self, shards_dir, vocab):
+        data = ShardedCircuitDataset(shards_dir, vocab, shuffle=False)
+        images = torch.cat([x for x, _ in DataLoader(data, batch_size=4, num_workers=2)])
+        assert get_indices(images) == list(range(NB_SAMPLES))
+
+    def test_distributed_split(self, shards_dir, vocab):
+        datasets = [ShardedCircuitDataset(shards_dir, vocab, num_replicas=2, rank=r) for r in (0, 1)]
+        indices = [get_indices(x for x, _ in data) for data in datasets]
+        assert not set(indices[0]) & set(indices[1])
+        # shards of 10, 10 and 5 samples: both processes get 12 samples, whatever the shards order
+        assert len(indices[0]) == len(indices[1]) == len(datasets[0]) == len(datasets[1]) == 12
+
+    def test_distributed_split_with_workers(self, shards_dir, vocab):
+        for epoch in range(3):
+            nb_batches, indices = [], []
+            for rank in range(3):
+                data = ShardedCircuitDataset(shards_dir, vocab, shuffle_buffer=4, num_replicas=3, rank=rank)
+                data.set_epoch(epoch)
+                batches = list(DataLoader(data, batch_size=2, num_workers=2))
+                nb_batches.append(len(batches))
+                indices += get_indices(x for batch, _ in batches for x in batch)
+            # same number of steps on every process, and no sample read twice
+            assert len(set(nb_batches)) == 1
+            assert len(indices) == len(set(indices)) == 24
+
+    def test_fewer_shards_than_processes(self, tmp_path, vocab):
+        with ShardWriter(str(tmp_path), max_samples=10) as writer:
+            for i in range(6):
+                writer.write(f"sample{i}", iu.encode_image(np.full((8, 8), 10 * i, dtype=np.uint8)), get_formula(i))
+        datasets = [ShardedCircuitDataset(str(tmp_path), vocab, num_replicas=4, rank=r) for r in range(4)]
+        assert [len(list(data)) for data in datasets] == [1, 1, 1, 1]
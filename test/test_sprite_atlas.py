@@ -0,0 +1,91 @@
+import os
+import re
+
+import cv2
+import numpy as np
+import pytest
+
+import scripts.utils.utils as ut
+from scripts.data_generation import sprite_atlas
+from scripts.data_generation.generate_circuits import Segment
+from scripts.data_generation.sprite_atlas import SpriteAtlas, get_sprite_key
+
+PX_PER_CM = sprite_atlas.ATLAS_DPI / 2.54
+
+
+@pytest.fixture
+def fake_latex(monkeypatch):
+    """Replaces the LaTeX compilation by a plain line drawn within the sprite bounding box"""
+    compiled = []
+
+    def fake_latex_to_jpg(latex_filename, latex_path, ghostscript_path, save_path="data"):
+        tex_file_path = os.path.join(save_path, latex_filename)
+        with open(f"{tex_file_path}.tex") as f:
+            tex = f.read()
+        compiled.append(tex)
+        number = r"(-?[\d.]+)"
+        x0, y0, x1, y1 = map(float, re.search(
+            rf"\\useasboundingbox \({number}, {number}\) rectangle \({number}, {number}\)", tex).groups())
+        to_x, to_y = map(int, re.search(r"\] \((-?\d+), (-?\d+)\)", tex).groups())
+        img = np.full((round((y1 - y0) * PX_PER_CM), round((x1 - x0) * PX_PER_CM)), 255, np.uint8)
+        cv2.line(img, (round(-x0 * PX_PER_CM), round(y1 * PX_PER_CM)),
+                 (round((to_x - x0) * PX_PER_CM), round((y1 - to_y) * PX_PER_CM)), 0, 2)
+        cv2.imwrite(f"{tex_file_path}.jpg", img)
+        os.remove(f"{tex_file_path}.tex")
+
+    monkeypatch.setattr(ut, "latex_to_jpg", fake_latex_to_jpg)
+    return compiled
+
+
+class TestSpriteKey:
+    def test_directions(self):
+        assert get_sprite_key(Segment((0, 0), (3, 0), "generic")) == ("generic", "right", 3)
+        assert get_sprite_key(Segment((1, 2), (1, 4), "short")) == ("short", "up", 2)
+        assert get_sprite_key(Segment((1, 4), (1, 2), "short")) == ("short", "down", 2)
+
+    def test_diagonal_segment(self):
+        with pytest.raises(ValueError):
+            get_sprite_key(Segment((0, 0), (2, 2), "short"))
+
+
+class TestSpriteAtlas:
+    keys = [("short", "right", 2), ("short", "up", 2)]
+
+    def test_built_once(self, tmp_path, fake_latex):
+        SpriteAtlas.load_or_build(str(tmp_path), "latex", "gs", self.keys)
+        assert len(fake_latex) == 2
+        atlas = SpriteAtlas.load_or_build(str(tmp_path), "latex", "gs", self.keys)
+        assert len(fake_latex) == 2
+        assert set(atlas.sprites) == set(self.keys)
+
+    def test_invalidated_when_preamble_changes(self, tmp_path, fake_latex, monkeypatch):
+        SpriteAtlas.load_or_build(str(tmp_path), "latex", "gs", self.keys)
+        monkeypatch.setattr(ut, "BEFORE_LATEX", ut.BEFORE_LATEX.replace("density=100", "density=300"))
+        SpriteAtlas.load_or_build(str(tmp_path), "latex", "gs", self.keys)
+        assert len(fake_latex) == 4
+        assert len(list(tmp_path.glob("sprite_atlas_*.npz"))) == 1
+
+    def test_missing_sprites_compiled_on_demand(self, tmp_path, fake_latex):
+        atlas = SpriteAtlas.load_or_build(str(tmp_path), "latex", "gs", self.keys)
+        atlas.compose({Segment((0, 0), (3, 0), "short")})
+        assert len(fake_latex) == 3
+        assert ("short", "right", 3) in SpriteAtlas.load_or_build(str(tmp_path), "latex", "gs").sprites
+
+    def test_compose_square(self, tmp_path, fake_latex):
+        atlas = SpriteAtlas.load_or_build(str(tmp_path), "latex", "gs", self.keys)
+        img = atlas.compose({
+            Segment((0, 0), (2, 0), "short"), Segment((0, 2), (2, 2), "short"),
+            Segment((0, 0), (0, 2), "short"), Segment((2, 0), (2, 2), "short"),
+        })
+        side = 2 * PX_PER_CM
+        # (+ line thickness, line caps and jpeg blur)
+        assert abs(img.shape[0] - side) <= 6 and abs(img.shape[1] - side) <= 6
+        # the four sides are drawn, the inside is empty
+        assert (img[:3] < 128).any(axis=0).mean() > .9 and (img[:, -3:] < 128).any(axis=1).mean() > .9
+        assert (img[20:-20, 20:-20] > 128).all()
+
+    def test_compose_empty(self, tmp_path, fake_latex):
+        atlas = SpriteAtlas.load_or_build(str(tmp_path), "latex", "gs")
+        img = atlas.compose([])
+        assert img.ndim == 2 and img.size and (img == 255).all()
+        assert not fake_latex
@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+
+import scripts.utils.image_utils as iu
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+from scripts.preprocessing.token_store import TokenStore
+from scripts.utils.dataset_utils import CustomCircuitDataset
+
+FORMULAS = [
+    "\\draw (0, 0) to[short] (0, 2); ",
+    "\\draw (0, 0) to[generic, l=R_1] (2, 0); \\draw (2, 0) to[short] (2, 2); ",
+]
+NEW_FORMULAS = ["\\draw (0, 0) to[battery1] (0, 3); "]
+
+
+def append(path, formulas):
+    with open(path, "a") as f:
+        f.write("".join(f"{formula}\n" for formula in formulas))
+
+
+class TestVocabulary:
+    def test_update_keeps_ids(self):
+        vocab = Vocabulary()
+        vocab.update(FORMULAS)
+        ids = dict(vocab.word_to_idx)
+        new_tokens = vocab.update(NEW_FORMULAS)
+        assert "to[battery1]" in new_tokens
+        assert {w: vocab.word_to_idx[w] for w in ids} == ids
+        assert vocab.version == 2
+
+    def test_save_load(self, tmp_path):
+        vocab = Vocabulary()
+        vocab.update(FORMULAS)
+        vocab.save(str(tmp_path / "vocab.json"))
+        loaded = Vocabulary.load(str(tmp_path / "vocab.json"))
+        assert loaded.word_to_idx == vocab.word_to_idx
+        assert loaded.formula_max_length == vocab.formula_max_length
+
+    def test_save_append_only(self, tmp_path):
+        vocab = Vocabulary()
+        vocab.update(FORMULAS)
+        vocab.save(str(tmp_path / "vocab.json"))
+        other = Vocabulary()
+        other.update(NEW_FORMULAS)
+        with pytest.raises(ValueError):
+            other.save(str(tmp_path / "vocab.json"))
+
+    def test_preprocess_token_ids(self):
+        vocab = Vocabulary()
+        vocab.update(FORMULAS)
+        token_ids = vocab.numericalize(vocab.basic_tokenize(FORMULAS[1]))
+        for pad in (True, False):
+            assert torch.equal(vocab.preprocess_token_ids(token_ids, pad), vocab.preprocess_formula(FORMULAS[1], pad))
+
+
+class TestTokenStore:
+    def test_incremental_update(self, tmp_path):
+        formulas_path = tmp_path / "circuitikz_code.lst"
+        append(formulas_path, FORMULAS)
+        store = TokenStore(str(tmp_path / "store"))
+        assert store.update(str(formulas_path)) == 2
+        assert store.update(str(formulas_path)) == 0
+        ids = dict(store.vocab.word_to_idx)
+
+        append(formulas_path, NEW_FORMULAS)
+        # reopened, as in a new run
+        store = TokenStore(str(tmp_path / "store"))
+        assert store.update(str(formulas_path)) == 1
+        assert len(store) == 3
+        assert {w: store.vocab.word_to_idx[w] for w in ids} == ids
+        for line, formula in enumerate(FORMULAS + NEW_FORMULAS, start=1):
+            tokens = [store.vocab.idx_to_word[int(i)] for i in store.get_token_ids(line)]
+            assert tokens == store.vocab.basic_tokenize(formula)
+        assert store.lengths.tolist() == [len(store.vocab.basic_tokenize(f)) for f in FORMULAS + NEW_FORMULAS]
+
+    def test_incomplete_line(self, tmp_path):
+        formulas_path = tmp_path / "circuitikz_code.lst"
+        formulas_path.write_text(FORMULAS[0] + "\n" + FORMULAS[1])
+        store = TokenStore(str(tmp_path / "store"))
+        assert store.update(str(formulas_path)) == 1
+        append(formulas_path, [""])
+        assert store.update(str(formulas_path)) == 1
+        assert len(store) == 2
+
+    def test_reset(self, tmp_path):
+        formulas_path = tmp_path / "circuitikz_code.lst"
+        append(formulas_path, FORMULAS)
+        store = TokenStore(str(tmp_path / "store"))
+        store.update(str(formulas_path))
+        formulas_path.write_text(FORMULAS[1] + "\n")
+        store.reset()
+        assert store.update(str(formulas_path)) == 1
+        assert np.array_equal(store.lengths, [len(store.vocab.basic_tokenize(FORMULAS[1]))])
+
+    def test_samples(self, tmp_path):
+        formulas_path, annotations_path = tmp_path / "circuitikz_code.lst", tmp_path / "circuit2latex.lst"
+        append(formulas_path, FORMULAS)
+        # the last sample refers to a formula which is not written yet (generate.py writes its name first)
+        append(annotations_path, ["1 name1 1", "", "2 name2 1", "3 name3 1"])
+        store = TokenStore(str(tmp_path / "store"))
+        store.update(str(formulas_path), str(annotations_path))
+        assert store.formula_lines.tolist() == [1, 2]
+        assert store.image_names.tolist() == [b"name1", b"name2"]
+
+        append(formulas_path, NEW_FORMULAS)
+        store = TokenStore(str(tmp_path / "store"))
+        assert store.update(str(formulas_path), str(annotations_path)) == 1
+        assert store.nb_samples == 3
+        assert store.image_names.tolist() == [b"name1", b"name2", b"name3"]
+        assert store.state["annotations_file_position"] == annotations_path.stat().st_size
+
+        store.reset()
+        assert store.nb_samples == 0 and len(store.formula_lines) == 0
+
+
+def test_dataset_reads_the_store(tmp_path):
+    formulas_path, annotations_path = tmp_path / "circuitikz_code.lst", tmp_path / "circuit2latex.lst"
+    img_dir = tmp_path / "circuit_images"
+    img_dir.mkdir()
+    for name in ("name1", "name2"):
+        iu.save_image(np.zeros((8, 8), dtype=np.uint8), str(img_dir / f"{name}.jpg"))
+    append(formulas_path, FORMULAS)
+    append(annotations_path, ["2 name2 1", "1 name1 1"])
+    store = TokenStore(str(tmp_path / "store"))
+    store.update(str(formulas_path), str(annotations_path))
+    # neither file is read again
+    os.remove(formulas_path)
+    os.remove(annotations_path)
+
+    data = CustomCircuitDataset(str(annotations_path), str(formulas_path), str(img_dir), token_store=store)
+    assert len(data) == 2
+    assert data.formula_lengths.tolist() == [len(store.vocab.basic_tokenize(f)) + 2 for f in FORMULAS[::-1]]
+    image, formula = data[0]
+    assert image.shape == (1, 8, 8)
+    assert torch.equal(formula, store.vocab.preprocess_token_ids(
+        torch.from_numpy(store.get_token_ids(2).astype(np.int64)), True))
@@ -1,12 +1,22 @@
 import click
 import os
 import torch
-from torch.utils.data import DataLoader
+from torch.profiler import record_function
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, default_collate
+from torch.utils.data.distributed import DistributedSampler
 import logging
 
 from src.models.decoder import TextDecoder
-from src.models.encoder import ImageEncoder
-from scripts.utils.dataset_utils import CustomCircuitDataset
+from src.models.encoder import ENCODERS, get_encoder
+from scripts.utils.dataset_utils import BucketBatchSampler, CustomCircuitDataset, PadCollate
+from scripts.preprocessing.augment_images import AugmentCollate, BatchAugmentation
+from scripts.preprocessing.preprocess_formulas import Vocabulary
+from scripts.utils.shard_utils import ShardedCircuitDataset
+from scripts.preprocessing.token_store import TokenStore
+import scripts.utils.distributed_utils as du
+import scripts.utils.profiling_utils as pu
+import scripts.utils.utils as ut
 
 
 @click.command()
@@ -35,34 +45,210 @@ from scripts.utils.dataset_utils import CustomCircuitDataset
     default=2,
     help="Number of epochs for the training.",
 )
+@click.option(
+    "--distributed",
+    is_flag=True,
+    default=False,
+    help="Train with DistributedDataParallel on CPU (gloo backend). Launch with torchrun.",
+)
+@click.option(
+    "--encoder",
+    "encoder_name",
+    default="basic",
+    type=click.Choice(list(ENCODERS)),
+    help="Image encoder architecture.",
+)
+@click.option(
+    "--encoder_channels",
+    default="16,32,64,128",
+    help="Comma separated channel widths of the efficient encoder.",
+)
+@click.option(
+    "--batch_size",
+    default=64,
+    help="Number of examples per batch.",
+)
+@click.option(
+    "--bucketing",
+    is_flag=True,
+    default=False,
+    help="Batch formulas of similar lengths together, and pad them to the longest formula of the batch only.",
+)
+@click.option(
+    "--bucket_width",
+    default=10,
+    help="With --bucketing, maximal difference (in tokens) between formulas lengths of a batch.",
+)
+@click.option(
+    "--augment",
+    is_flag=True,
+    default=False,
+    help="Randomly rotate, scale, thicken, add noise and JPEG artifacts to each batch of images.",
+)
+@click.option(
+    "--num_workers",
+    default=0,
+    help="Number of DataLoader worker processes.",
+)
+@click.option(
+    "--image_cache_mb",
+    default=0,
+    help="Keep up to this many MB of decoded images in memory shared by the DataLoader workers (0: no cache).",
+)
+@click.option(
+    "--shards",
+    is_flag=True,
+    default=False,
+    help="Read the images sequentially from the shards of data_dir/shards (generate.py --output_format shards).",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Profile a few training steps with torch.profiler (Chrome trace and operators table).",
+)
+@click.option(
+    "--profile_dir",
+    default="profiles",
+    help="Directory where the profiling results are saved.",
+)
+@click.option(
+    "--profile_steps",
+    default=5,
+    help="Number of profiled training steps (after 2 steps of warmup).",
+)
+@click.option(
+    "--token_store",
+    "use_token_store",
+    is_flag=True,
+    default=False,
+    help="Tokenize only the formulas (and read only the samples) added since the last run "
+    "(stored in data_dir/token_store), with a vocabulary that only grows.",
+)
 def main(
     data_dir: str,
     images_folder: str,
     circuit_metadata_files: str,
     formulas_file_name: str,
     n_epochs: int = 10,
+    distributed: bool = False,
+    encoder_name: str = "basic",
+    encoder_channels: str = "16,32,64,128",
+    batch_size: int = 64,
+    bucketing: bool = False,
+    bucket_width: int = 10,
+    augment: bool = False,
+    num_workers: int = 0,
+    image_cache_mb: int = 0,
+    shards: bool = False,
+    profile: bool = False,
+    profile_dir: str = "profiles",
+    profile_steps: int = 5,
+    use_token_store: bool = False,
     learning_rate: float = 0.005,
 ) -> None:
+    if distributed:
+        rank, world_size = du.init_distributed(backend="gloo")
+    else:
+        rank, world_size = 0, 1
 
-    # create vocabulary & load data
-    data = CustomCircuitDataset(
-        os.path.join(data_dir, circuit_metadata_files),
-        os.path.join(data_dir, formulas_file_name),
-        os.path.join(data_dir, images_folder),
-    )
-    dataloader = DataLoader(data, batch_size=64, shuffle=True)
-    ds_size = len(dataloader.dataset)
+    if shards and bucketing:
+        raise click.UsageError("--bucketing needs random access to the examples, it cannot be used with --shards")
 
-    # check if cuda is available
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    token_store = None
+    if use_token_store:
+        token_store = TokenStore(os.path.join(data_dir, "token_store"))
+        # only the new formulas are tokenized, by one process per node as each node may have its own
+        # copy of the data folder. The nodes take turns: with a shared folder, the next ones have nothing to do
+        node, local_rank, local_world_size = du.get_local_rank()
+        for updating_node in range(world_size // local_world_size):
+            if node == updating_node and local_rank == 0:
+                token_store.update(os.path.join(data_dir, formulas_file_name),
+                                   os.path.join(data_dir, circuit_metadata_files))
+            if distributed:
+                torch.distributed.barrier()
+        if distributed:
+            token_store = TokenStore(os.path.join(data_dir, "token_store"))
+            # models of different sizes cannot be wrapped by DDP
+            if len(set(du.all_gather(tuple(token_store.vocab.idx_to_word.values())))) > 1:
+                raise click.UsageError(
+                    "--token_store: the vocabularies of the nodes differ, their data folders must hold the same formulas"
+                )
+
+    # create vocabulary & load data
+    if shards:
+        if token_store is not None:
+            vocab = token_store.vocab
+        else:
+            vocab = Vocabulary()
+            vocab.build_vocaulary(os.path.join(data_dir, formulas_file_name))
+        # shuffles and splits the shards between processes itself
+        data = ShardedCircuitDataset(
+            os.path.join(data_dir, "shards"), vocab, num_replicas=world_size, rank=rank
+        )
+        # DDP needs the same number of steps on every process (the shards index may differ between nodes)
+        if len(set(du.all_gather(len(data)))) > 1 or not len(data):
+            raise click.UsageError(
+                "--shards: every process must read the same shards, and at least one sample each"
+            )
+    else:
+        data = CustomCircuitDataset(
+            os.path.join(data_dir, circuit_metadata_files),
+            os.path.join(data_dir, formulas_file_name),
+            os.path.join(data_dir, images_folder),
+            pad_to_max_length=not bucketing,
+            cache_bytes=image_cache_mb * 2**20,
+            token_store=token_store,
+        )
+    collate_fn = PadCollate(data.vocab) if bucketing else default_collate
+    augmentation = None
+    if augment:
+        # runs on whole batches, in the DataLoader workers
+        augmentation = BatchAugmentation(seed=rank)
+        collate_fn = AugmentCollate(augmentation, collate_fn)
+    if bucketing:
+        # also splits the batches between processes when distributed
+        sampler = BucketBatchSampler(
+            data.formula_lengths, batch_size, bucket_width, num_replicas=world_size, rank=rank
+        )
+        dataloader = DataLoader(data, batch_sampler=sampler, collate_fn=collate_fn, num_workers=num_workers)
+        ds_size = len(data) // world_size
+    elif shards:
+        sampler = None
+        dataloader = DataLoader(data, batch_size=batch_size, collate_fn=collate_fn, num_workers=num_workers)
+        ds_size = len(data)
+    elif distributed:
+        # each process only sees its own 1/world_size part of the dataset
+        sampler = DistributedSampler(data, num_replicas=world_size, rank=rank, shuffle=True)
+        dataloader = DataLoader(
+            data, batch_size=batch_size, sampler=sampler, collate_fn=collate_fn, num_workers=num_workers
+        )
+        ds_size = len(sampler)
+    else:
+        sampler = None
+        dataloader = DataLoader(
+            data, batch_size=batch_size, shuffle=True, collate_fn=collate_fn, num_workers=num_workers
+        )
+        ds_size = len(dataloader.dataset)
+    if distributed:
+        # gloo only supports CPU tensors
+        device = "cpu"
+    else:
+        # check if cuda is available
+        device = "cuda" if torch.cuda.is_available() else "cpu"
     logging.info(f"Using {device} device")
 
     # instanciate the models
-    encoder = ImageEncoder(ouptut_size=len(data.vocab)).to(device)
+    channels = [int(c) for c in encoder_channels.split(",")]
+    encoder = get_encoder(encoder_name, len(data.vocab), channels).to(device)
     logging.info(encoder)
     # output size of the encoder : vocabulary size
     decoder = TextDecoder(data.vocab).to(device)
     logging.info(decoder)
+    if distributed:
+        # gradients are averaged between processes during the backward pass
+        encoder = DistributedDataParallel(encoder)
+        decoder = DistributedDataParallel(decoder)
 
     optimizer = torch.optim.Adam(
         [{"params": encoder.parameters()}, {"params": decoder.parameters()}],
@@ -70,25 +256,59 @@ def main(
     )
     loss_ftn = torch.nn.CrossEntropyLoss()  # for now, we use cross entropy loss
 
+    profiler = None
+    if profile:
+        profiler = pu.get_training_profiler(profile_dir, profile_steps, rank=rank)
+        profiler.start()
+
     for epoch in range(n_epochs):
-        print(f"Epoch {epoch}")
-        for batch, (X, y) in enumerate(dataloader):
+        if sampler is not None:
+            # reshuffle differently at each epoch
+            sampler.set_epoch(epoch)
+        if shards:
+            data.set_epoch(epoch)
+        if augmentation is not None:
+            augmentation.set_epoch(epoch)
+        if du.is_main_process():
+            print(f"Epoch {epoch}")
+        current = 0
+        # the labels only show in the profiler traces
+        for batch, (X, y) in enumerate(pu.iter_with_label(dataloader, "data_wait")):
             # Compute prediction and loss
-            pred = decoder(encoder(X))
+            # (only generate as many tokens as the formulas of the batch)
+            with record_function("encoder_forward"):
+                features = encoder(X)
+            with record_function("decoder_forward"):
+                pred = decoder(features, y.shape[1])
             loss = loss_ftn(pred, y)
 
             # Backpropagation
             optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+            with record_function("backward"):
+                loss.backward()
+            with record_function("optimizer_step"):
+                optimizer.step()
+            if profiler is not None:
+                profiler.step()
 
-            if batch % 1 == 0:
-                loss, current = loss.item(), batch * len(X)
+            # batches can be smaller than batch_size with bucketing
+            current += len(X)
+            if batch % 1 == 0 and du.is_main_process():
+                loss = loss.item()
                 print(f"loss: {loss:>7f}  [{current:>5d}/{ds_size:>5d}]")
 
-    # save the trained models
-    torch.save(encoder, os.path.join("trained_models", "encoder.pt"))
-    torch.save(decoder, os.path.join("trained_models", "decoder.pt"))
+    if profiler is not None:
+        profiler.stop()
+
+    # save the trained models (only once when distributed)
+    if du.is_main_process():
+        if distributed:
+            encoder, decoder = encoder.module, decoder.module
+        ut.create_dir_if_not_exists("trained_models")
+        torch.save(encoder, os.path.join("trained_models", "encoder.pt"))
+        torch.save(decoder, os.path.join("trained_models", "decoder.pt"))
+    if distributed:
+        du.cleanup_distributed()
 
     # get one batch of data
     # train_features, train_labels = next(iter(dataloader))